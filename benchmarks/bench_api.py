@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+In-process API benchmark
+
+Classifies the same synthetic pull request diffs once through
+suggest_commit with a reused generator and once by spawning the script
+with --stdin --format json per diff, the way a bot scraping stdout would,
+and checks that both report the same commit types.
+
+Usage:
+    python benchmarks/bench_api.py               # 50 diffs
+    python benchmarks/bench_api.py 200
+"""
+
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from commit_message_generator import CommitMessageGenerator, suggest_commit  # noqa: E402
+from synthetic import synthetic_history  # noqa: E402
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    diffs = [diff for _, _, diff in synthetic_history(count, seed=1)]
+
+    generator = CommitMessageGenerator()
+    start = time.perf_counter()
+    in_process = [suggest_commit(diff, generator=generator)['type'] for diff in diffs]
+    api_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    spawned = []
+    for diff in diffs:
+        result = subprocess.run([sys.executable, str(ROOT / 'commit_message_generator.py'), '--stdin',
+                                 '--format', 'json', '--no-cache'],
+                                input=diff, capture_output=True, text=True, check=True, cwd='/')
+        spawned.append(json.loads(result.stdout)['type'])
+    spawn_time = time.perf_counter() - start
+
+    print(f"diffs:       {count}")
+    print(f"in-process:  {api_time / count * 1000:.2f}ms per diff")
+    print(f"spawned:     {spawn_time / count * 1000:.2f}ms per diff")
+    if in_process != spawned:
+        print("FAIL: the in-process API and --stdin disagree on commit types")
+        sys.exit(1)
+    print(f"OK: same commit types, {spawn_time / api_time:.0f}x faster in-process")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Diff budget benchmark
+
+Analyzes pathological change sets (one giant file, a minified bundle and a
+huge lockfile next to a small source change) once line by line and once
+within the default DiffBudget, and reports the time of both and the error
+of the sampled estimates. Fails when a budgeted run takes longer than
+--max-seconds or the commit type changes.
+
+Then runs analyze_changes on a repository whose single modified file is far
+over a small total budget, and fails unless the analysis is marked as
+truncated and no more than the budget plus a block or two was read from git.
+
+Usage:
+    python benchmarks/bench_budget.py                  # default sizes
+    python benchmarks/bench_budget.py --scale 4 --max-seconds 1
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_streaming import modified_file_repository  # noqa: E402
+from commit_message_generator import (SAMPLED_COUNTERS, STREAM_CHUNK_SIZE,  # noqa: E402
+                                      CommitMessageGenerator, DiffBudget, Profiler)
+from synthetic import _file_diff, giant_file  # noqa: E402
+
+# Total budget of the oversized file check, far below the file's diff
+OVERSIZED_TOTAL_BYTES = 4 * 1024 * 1024
+
+
+def minified_bundle(scale: int):
+    path = 'static/bundle.min.js'
+    line = '+' + 'var a=function(b){return b+1};' * 100000 * scale
+    diff = '\n'.join([f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}",
+                      "@@ -1 +1 @@", "-var a=0;", line])
+    return [path], diff
+
+
+def lockfile(scale: int):
+    rnd = random.Random(0)
+    lines = ["diff --git a/package-lock.json b/package-lock.json", "--- a/package-lock.json",
+             "+++ b/package-lock.json", f"@@ -1,1 +1,{100000 * scale} @@"]
+    lines += [f'+    "fix-{i}": "1.0.{i}",' for i in range(100000 * scale)]
+    lines += _file_diff(rnd, 'src/app.py', 2, 10)
+    return ['package-lock.json', 'src/app.py'], '\n'.join(lines)
+
+
+def giant(scale: int):
+    files, _, diff = giant_file(random.Random(0), scale * 4)
+    return files, diff
+
+
+CASES = {'giant-file': giant, 'minified-bundle': minified_bundle, 'lockfile': lockfile}
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def check_oversized_file(scale: int) -> bool:
+    """Analyze one modified file 8x over the total budget; return whether git was cut off."""
+    size = 32 * scale
+    with tempfile.TemporaryDirectory() as repo:
+        modified_file_repository(repo, size)
+        profiler = Profiler()
+        generator = CommitMessageGenerator(repo=repo, profiler=profiler,
+                                           budget=DiffBudget(max_total_bytes=OVERSIZED_TOTAL_BYTES))
+        elapsed, analysis = timed(generator.analyze_changes, False, 'patch')
+    received = sum(command['bytes'] for command in profiler.git_commands
+                   if command['cmd'].startswith('git --literal-pathspecs diff'))
+    allowed = OVERSIZED_TOTAL_BYTES + 2 * STREAM_CHUNK_SIZE
+    print(f"oversized file: {size} MB of diff, {OVERSIZED_TOTAL_BYTES >> 20} MB budget, "
+          f"{received / 1024 / 1024:.1f} MB read from git in {elapsed:.3f}s")
+    if not analysis.diff_analysis['truncated']:
+        print("FAIL: the oversized file was not marked as truncated")
+        return False
+    if received > allowed:
+        print(f"FAIL: read {received} bytes from git past a {OVERSIZED_TOTAL_BYTES} byte budget")
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', type=int, default=1, help='Size multiplier of the cases')
+    parser.add_argument('--max-seconds', type=float, default=2.0,
+                        help='Fail when a budgeted analysis takes longer than this')
+    args = parser.parse_args()
+
+    exact = CommitMessageGenerator(budget=DiffBudget.unlimited())
+    budgeted = CommitMessageGenerator()
+    failed = False
+    print(f"{'case':<18} {'size':>8} {'exact':>9} {'budget':>9} {'max error':>10}  type")
+    for name, build in CASES.items():
+        files, diff = build(args.scale)
+        exact_time, expected = timed(exact.analyze, files, diff)
+        budget_time, actual = timed(budgeted.analyze, files, diff)
+
+        # Relative error of the extrapolated counters; small ones are mostly noise
+        errors = [abs(actual.diff_analysis[key] - expected.diff_analysis[key]) / expected.diff_analysis[key]
+                  for key in SAMPLED_COUNTERS if expected.diff_analysis[key] >= 1000]
+        expected_type = exact.determine_commit_type(files, analysis=expected)
+        actual_type = budgeted.determine_commit_type(files, analysis=actual)
+        print(f"{name:<18} {len(diff) / 1024 / 1024:>6.1f}MB {exact_time:>8.3f}s {budget_time:>8.3f}s "
+              f"{max(errors, default=0) * 100:>9.1f}%  {actual_type}")
+
+        if budget_time > args.max_seconds:
+            print(f"FAIL: {name} took {budget_time:.2f}s (allowed {args.max_seconds:.2f}s)")
+            failed = True
+        if actual_type != expected_type:
+            print(f"FAIL: {name} classified as {actual_type}, {expected_type} when analyzed in full")
+            failed = True
+
+    if not check_oversized_file(args.scale):
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("OK: every budgeted analysis was bounded and kept its commit type")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Daemon client latency check
+
+Starts a --serve daemon on a scratch repository and compares, best of
+--repeat runs each:
+
+- an in-process ``python -m commit_message_generator --quick --staged``;
+- the same run with ``--client``, which asks the warm daemon;
+- a bare ``python -m`` module that only imports socket and json, the
+  floor of any Python client run the way hooks run the generator;
+- one request_message round trip, without starting an interpreter.
+
+Fails when the client's message differs from the in-process one, when the
+client run loaded argparse or the analysis modules, or when it takes more
+than --max-overhead-ms over the bare interpreter plus the round trip (the
+daemon's own work).
+
+Usage:
+    python benchmarks/bench_client.py
+    python benchmarks/bench_client.py --repeat 20 --max-overhead-ms 5
+"""
+
+import argparse
+import compileall
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench_startup import import_times, scratch_repository  # noqa: E402
+from commit_message_generator import request_message  # noqa: E402
+
+# Modules the thin client must not load: the CLI parser and what analysis needs
+ANALYSIS_MODULES = ('argparse', 'subprocess', 'threading', 'hashlib', 'struct')
+
+
+def best_of(repeat: int, args, cwd, env):
+    """Best wall time of ``repeat`` runs of a Python command and its last result."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable] + args, cwd=cwd, env=env,
+                                capture_output=True, text=True, check=True)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def wait_for(socket_path: str, daemon: subprocess.Popen, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(socket_path):
+        if daemon.poll() is not None or time.monotonic() > deadline:
+            raise SystemExit("FAIL: the daemon did not start")
+        time.sleep(0.02)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10, help='runs per measurement')
+    parser.add_argument('--max-overhead-ms', type=float, default=8.0,
+                        help='allowed client time over a bare socket and json '
+                             'interpreter plus the round trip (default: 8)')
+    args = parser.parse_args()
+
+    compileall.compile_file(str(ROOT / 'commit_message_generator.py'), quiet=1)
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    failed = False
+
+    with tempfile.TemporaryDirectory() as repo:
+        scratch_repository(repo)
+        socket_path = os.path.join(repo, '.git', 'bench.sock')
+        command = ['-m', 'commit_message_generator', '--quick', '--staged']
+        client = command + ['--client', '--socket', socket_path]
+        daemon = subprocess.Popen([sys.executable, '-m', 'commit_message_generator', '--serve',
+                                   '--socket', socket_path], cwd=repo, env=env,
+                                  stderr=subprocess.DEVNULL)
+        try:
+            wait_for(socket_path, daemon)
+            in_process, expected = best_of(args.repeat, command, repo, env)
+            client_time, answered = best_of(args.repeat, client, repo, env)
+            Path(repo, '.git', 'bench_floor.py').write_text('import socket, json\n')
+            compileall.compile_file(os.path.join(repo, '.git', 'bench_floor.py'), quiet=1)
+            floor_env = dict(env, PYTHONPATH=os.path.join(repo, '.git'))
+            floor, _ = best_of(args.repeat, ['-m', 'bench_floor'], repo, floor_env)
+            _, imported = best_of(1, ['-X', 'importtime'] + client, repo, env)
+            round_trips = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                request_message(socket_path, repo, staged=True)
+                round_trips.append(time.perf_counter() - start)
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+    round_trip = min(round_trips)
+    overhead = (client_time - floor - round_trip) * 1000
+    print(f"in-process:    {in_process * 1000:.1f}ms")
+    print(f"client:        {client_time * 1000:.1f}ms ({overhead:.1f}ms over floor and round "
+          f"trip, allowed {args.max_overhead_ms:.0f}ms)")
+    print(f"floor:         {floor * 1000:.1f}ms (python -m of a module importing socket and json)")
+    print(f"round trip:    {round_trip * 1000:.2f}ms (request_message in-process)")
+    print(f"message:       {answered.stdout.strip()}")
+
+    if answered.stdout != expected.stdout:
+        print(f"FAIL: the client printed {answered.stdout!r}, in-process {expected.stdout!r}")
+        failed = True
+    loaded = sorted(set(import_times(imported.stderr)) & set(ANALYSIS_MODULES))
+    if loaded:
+        print(f"FAIL: the client run imported {', '.join(loaded)}")
+        failed = True
+    if overhead > args.max_overhead_ms:
+        print(f"FAIL: the client took {overhead:.1f}ms over floor and round trip")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Fleet scan benchmark
+
+Creates --repos scratch repositories with pending changes, one of them
+broken, and compares one `--quick` invocation per repository, run one
+after the other, with a single `--discover` scan through the thread pool.
+Fails when the messages differ, when the broken repository does not report
+its own error, or when the scan is not faster than the serial runs.
+
+Usage:
+    python benchmarks/bench_fleet.py
+    python benchmarks/bench_fleet.py --repos 100 --workers 16
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+from synthetic import EXTENSIONS, WORDS  # noqa: E402
+
+
+def git(repo, *args):
+    subprocess.run(['git'] + list(args), cwd=repo, check=True, capture_output=True)
+
+
+def scratch_fleet(top: str, count: int, seed: int):
+    """``count`` repositories with random uncommitted changes, and a broken one."""
+    rnd = random.Random(seed)
+    for number in range(count):
+        repo = os.path.join(top, f"repo_{number}")
+        os.makedirs(os.path.join(repo, 'src'))
+        git(repo, 'init', '-q')
+        git(repo, 'config', 'user.email', 'bench@example.com')
+        git(repo, 'config', 'user.name', 'bench')
+        names = [f"src/{rnd.choice(WORDS)}_{i}{rnd.choice(EXTENSIONS)}" for i in range(20)]
+        for name in names:
+            Path(repo, name).write_text('\n'.join(rnd.choice(WORDS) for _ in range(50)) + '\n')
+        git(repo, 'add', '.')
+        git(repo, 'commit', '-qm', 'init')
+        for name in rnd.sample(names, rnd.randint(0, 5)):
+            with open(os.path.join(repo, name), 'a') as f:
+                f.write(f"def {rnd.choice(WORDS)}_{rnd.choice(WORDS)}():\n    return 1\n")
+    broken = os.path.join(top, 'broken')
+    os.makedirs(broken)
+    Path(broken, '.git').write_text('gitdir: /nonexistent\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repos', type=int, default=40, help='scratch repositories')
+    parser.add_argument('--workers', type=int, help='threads of the scan (default: CPU count + 4)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic changes')
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    command = [sys.executable, '-m', 'commit_message_generator']
+    with tempfile.TemporaryDirectory() as top:
+        scratch_fleet(top, args.repos, args.seed)
+        repos = sorted(os.path.join(top, name) for name in os.listdir(top))
+
+        start = time.perf_counter()
+        serial = {}
+        for repo in repos:
+            result = subprocess.run(command + ['--quick'], cwd=repo, env=env, capture_output=True, text=True)
+            serial[repo] = result.stdout.strip()
+        serial_time = time.perf_counter() - start
+
+        scan = command + ['--discover', top, '--format', 'json']
+        if args.workers:
+            scan += ['--workers', str(args.workers)]
+        start = time.perf_counter()
+        result = subprocess.run(scan, env=env, capture_output=True, text=True, check=True)
+        scan_time = time.perf_counter() - start
+        results = {line['repo']: line for line in map(json.loads, result.stdout.splitlines())}
+
+    failures = []
+    for repo in repos:
+        found = results.get(repo)
+        if found is None:
+            failures.append(f"{repo}: missing from the scan")
+        elif repo.endswith('broken'):
+            if 'error' not in found:
+                failures.append(f"{repo}: no error reported")
+        elif 'error' in found:
+            failures.append(f"{repo}: {found['error']}")
+        elif (found['report']['message'] or 'No changes detected.') != serial[repo]:
+            failures.append(f"{repo}: {found['report']['message']!r} != {serial[repo]!r}")
+
+    print(f"repositories:  {len(repos)}")
+    print(f"serial:        {serial_time:.2f}s ({serial_time / len(repos) * 1000:.0f}ms per repository)")
+    print(f"scan:          {scan_time:.2f}s ({serial_time / scan_time:.1f}x faster)")
+    print(f"summary:       {result.stderr.strip()}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if scan_time >= serial_time:
+        failures.append('slower')
+        print("FAIL: the scan was not faster than serial runs")
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Keyword scoring benchmark
+
+Compares the original ``keyword in content_lower`` loop against
+KeywordMatcher, both for the presence scores used by determine_commit_type
+and for per-keyword hit counts, and checks that the results are identical.
+Two corpora of each size: the synthetic diff, whose words repeat a lot and
+lack most keywords, and the standard library's sources added as a diff,
+which holds most keywords somewhere. Word-boundary matches are checked
+against a per-keyword regex on the smallest size.
+
+Usage:
+    python benchmarks/bench_keywords.py            # 1 MB, 10 MB and 100 MB
+    python benchmarks/bench_keywords.py 1 5        # custom sizes in MB
+"""
+
+import re
+import sys
+import sysconfig
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from commit_message_generator import CommitMessageGenerator  # noqa: E402
+from synthetic import synthetic_diff  # noqa: E402
+
+
+def naive_scores(generator: CommitMessageGenerator, files, diff):
+    content_lower = (' '.join(files) + ' ' + diff).lower()
+    scores = {commit_type: 0 for commit_type in generator.commit_types}
+    for commit_type, keywords in generator.keywords.items():
+        for keyword in keywords:
+            if keyword in content_lower:
+                scores[commit_type] += 1
+    return scores
+
+
+def naive_counts(generator: CommitMessageGenerator, files, diff):
+    content_lower = (' '.join(files) + ' ' + diff).lower()
+    counts = {}
+    for keywords in generator.keywords.values():
+        for keyword in keywords:
+            hits = 0
+            start = content_lower.find(keyword)
+            while start != -1:
+                hits += 1
+                start = content_lower.find(keyword, start + 1)
+            counts[keyword] = hits
+    return counts
+
+
+def stdlib_diff(size: int) -> str:
+    """The standard library's Python sources as the added lines of a diff."""
+    sections = []
+    total = 0
+    for path in sorted(Path(sysconfig.get_paths()['stdlib']).rglob('*.py')):
+        lines = path.read_text(encoding='utf-8', errors='replace').splitlines()
+        section = f"diff --git a/{path.name} b/{path.name}\n" + ''.join(f"+{line}\n" for line in lines)
+        sections.append(section)
+        total += len(section)
+        if total >= size:
+            break
+    return ''.join(sections)[:size]
+
+
+def naive_boundary(generator: CommitMessageGenerator, text: str):
+    text_lower = text.lower()
+    return {keyword for keyword in generator.keyword_matcher.types_by_keyword
+            if re.search(r'(?<!\w)' + re.escape(keyword) + r'(?!\w)', text_lower)}
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1, 10, 100]
+    generator = CommitMessageGenerator()
+    files = ['src/app.py', 'tests/test_app.py', 'README.md']
+
+    print(f"{'corpus':<10} {'size':>6}  {'scores naive':>12}  {'scores matcher':>14}  "
+          f"{'counts naive':>12}  {'counts matcher':>14}")
+    for size in sizes:
+        for corpus, make in (('synthetic', synthetic_diff), ('stdlib', stdlib_diff)):
+            diff = make(size * 1024 * 1024)
+            naive_time, expected = timed(naive_scores, generator, files, diff)
+            matcher_time, actual = timed(generator.score_keywords, files, diff)
+            assert actual == expected, "keyword scores differ from the substring loop"
+
+            naive_count_time, expected_counts = timed(naive_counts, generator, files, diff)
+            matcher_count_time, counts = timed(generator.count_keywords, files, diff)
+            assert counts == expected_counts, "keyword counts differ from the substring loop"
+
+            print(f"{corpus:<10} {size:>4}MB  {naive_time:>11.3f}s  {matcher_time:>13.3f}s  "
+                  f"{naive_count_time:>11.3f}s  {matcher_count_time:>13.3f}s")
+
+    boundary = CommitMessageGenerator(word_boundary=True)
+    for make in (synthetic_diff, stdlib_diff):
+        diff = make(min(sizes) * 1024 * 1024)
+        assert boundary.keyword_matcher.find(diff) == naive_boundary(boundary, diff), \
+            "word-boundary keywords differ from a per-keyword regex"
+    print("OK: identical scores, counts and word-boundary matches")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Learned commit type model benchmark
+
+Trains a CommitTypeModel on the older part of a history and compares it
+with the hand-tuned weights of determine_commit_type on the newer part:
+accuracy against the declared conventional commit types, model size, load
+time and scoring time per commit. Both score the same analysis of each
+commit, with the renames its diff headers give. The model is reported on
+its own and as the generator uses it, falling back to the hand-tuned
+weights on close calls. Uses a seeded synthetic history unless --repo is
+given. Exits non-zero when the history is too small to train a model or
+loading the model takes longer than --max-load-ms.
+
+Usage:
+    python benchmarks/bench_model.py                         # 2000 synthetic commits
+    python benchmarks/bench_model.py --repo ~/src/project --range main~5000..main
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from commit_message_generator import (  # noqa: E402
+    CommitMessageGenerator, CommitTypeModel, changes_from_diff, commit_features
+)
+from synthetic import synthetic_history  # noqa: E402
+
+
+def per_call_us(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--commits', type=int, default=2000, help='Synthetic commits to generate')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic history')
+    parser.add_argument('--repo', help='Use the history of this repository instead')
+    parser.add_argument('--range', default='HEAD', help='Revision range of --repo (default: HEAD)')
+    parser.add_argument('--train-share', type=float, default=0.8,
+                        help='Share of the (oldest) commits to train on (default: 0.8)')
+    parser.add_argument('--max-load-ms', type=float, default=1.0,
+                        help='Fail when loading the model takes longer (default: 1)')
+    args = parser.parse_args()
+
+    generator = CommitMessageGenerator(repo=args.repo)
+    if args.repo:
+        # git log lists the newest commits first
+        history = list(generator.iter_history([args.range]))[::-1]
+    else:
+        history = synthetic_history(args.commits, args.seed)
+
+    samples = []
+    for sha, subject, diff in history:
+        sample = generator.commit_sample(sha, subject, diff)
+        if sample is not None:
+            # The analysis commit_sample takes its features from
+            changes = changes_from_diff(diff.split('\n'))
+            files = [change.path for change in changes]
+            analysis = generator.analyze(files, diff, changes)
+            samples.append((sample[0], commit_features(analysis), files, analysis))
+    split = int(len(samples) * args.train_share)
+    train, test = samples[:split], samples[split:]
+
+    start = time.perf_counter()
+    try:
+        model = CommitTypeModel.train((declared, features) for declared, features, _, _ in train)
+    except ValueError as e:
+        print(f"FAIL: could not train on {len(train)} commits: {e}")
+        sys.exit(1)
+    train_seconds = time.perf_counter() - start
+    data = model.to_bytes()
+    load_us = per_call_us(lambda: CommitTypeModel.from_bytes(data), 1000)
+    with_model = CommitMessageGenerator(repo=args.repo)
+    with_model.model = model
+
+    heuristic_hits = model_hits = combined_hits = close_calls = 0
+    for declared, features, files, analysis in test:
+        heuristic_hits += generator.determine_commit_type(files, analysis=analysis) == declared
+        scores = model.scores(features)
+        model_hits += max(scores, key=scores.get) == declared
+        close_calls += model.choose(scores) is None
+        combined_hits += with_model.determine_commit_type(files, analysis=analysis) == declared
+
+    declared, features, files, analysis = test[0]
+    heuristic_us = per_call_us(lambda: generator.determine_commit_type(files, analysis=analysis), 2000)
+    model_us = per_call_us(lambda: model.predict(commit_features(analysis)), 2000)
+
+    print(f"commits:          {len(train)} to train on, {len(test)} to test on")
+    print(f"model:            {len(model.types)} types, {len(model.features)} features, "
+          f"{len(data)} bytes, trained in {train_seconds * 1000:.1f}ms")
+    print(f"accuracy:         heuristic {heuristic_hits / len(test):.1%}, model {model_hits / len(test):.1%}, "
+          f"model with fallback {combined_hits / len(test):.1%} "
+          f"({close_calls} close calls left to the heuristic)")
+    print(f"load:             {load_us:.1f}us")
+    print(f"score per commit: heuristic {heuristic_us:.1f}us, model {model_us:.1f}us")
+
+    if load_us > args.max_load_ms * 1000:
+        print(f"FAIL: loading the model took {load_us / 1000:.2f}ms (allowed {args.max_load_ms}ms)")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Scope detection benchmark
+
+Maps a large synthetic change set (100k paths by default) to the scopes of
+a few hundred package roots with ScopeIndex, checks every scope against a
+naive longest-prefix scan over all roots, and fails when counting takes
+longer than --max-seconds.
+
+It then times load_scope_index in a scratch repository with --packages
+packages: a cold build (listing the tree), a warm load (cache under .git/)
+and a load after a commit that adds a package (tree diff since the cached
+commit).
+
+Usage:
+    python benchmarks/bench_scopes.py
+    python benchmarks/bench_scopes.py --paths 500000 --roots 2000 --packages 50
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from commit_message_generator import CommitMessageGenerator, ScopeIndex  # noqa: E402
+from synthetic import WORDS  # noqa: E402
+
+
+def synthetic_roots(rnd: random.Random, count: int):
+    """Package marker files at depth 1 to 3, some nested inside others."""
+    markers = set()
+    while len(markers) < count:
+        depth = rnd.randint(1, 3)
+        parts = [rnd.choice(['services', 'libs', 'apps', 'tools'])]
+        parts += [f"{rnd.choice(WORDS)}_{rnd.randint(0, 99)}" for _ in range(depth)]
+        markers.add('/'.join(parts) + '/' + rnd.choice(['package.json', 'pyproject.toml', 'setup.py']))
+    return sorted(markers)
+
+
+def synthetic_paths(rnd: random.Random, roots, count: int):
+    paths = []
+    for _ in range(count):
+        base = rnd.choice(roots) if rnd.random() < 0.9 else rnd.choice(['docs', 'scripts', ''])
+        parts = [f"{rnd.choice(WORDS)}" for _ in range(rnd.randint(0, 3))]
+        name = f"{rnd.choice(WORDS)}_{rnd.randint(0, 9999)}.py"
+        paths.append('/'.join([part for part in [base] + parts if part] + [name]))
+    return paths
+
+
+def naive_scope(index: ScopeIndex, path: str):
+    best = None
+    for root, scope in index.roots.items():
+        if path.startswith(root + '/') and (best is None or len(root) > len(best[0])):
+            best = (root, scope)
+    return best[1] if best else None
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def git(repo, *args):
+    subprocess.run(['git'] + list(args), cwd=repo, check=True, capture_output=True)
+
+
+def repository_timings(packages: int):
+    with tempfile.TemporaryDirectory() as repo:
+        git(repo, 'init', '-q')
+        git(repo, 'config', 'user.email', 'bench@example.com')
+        git(repo, 'config', 'user.name', 'bench')
+        for number in range(packages):
+            package = os.path.join(repo, 'packages', f"package_{number}", 'src')
+            os.makedirs(package)
+            Path(package, '..', 'package.json').write_text('{}\n')
+            for module in range(10):
+                Path(package, f"module_{module}.js").write_text(f"export const value = {module};\n")
+        git(repo, 'add', '.')
+        git(repo, 'commit', '-qm', 'packages')
+
+        generator = CommitMessageGenerator(repo=repo)
+        cold, index = timed(generator.load_scope_index)
+        warm, _ = timed(generator.load_scope_index)
+
+        new_package = os.path.join(repo, 'packages', 'added')
+        os.makedirs(new_package)
+        Path(new_package, 'package.json').write_text('{}\n')
+        git(repo, 'add', '.')
+        git(repo, 'commit', '-qm', 'add a package')
+        moved, moved_index = timed(generator.load_scope_index)
+        assert len(moved_index.roots) == len(index.roots) + 1, "the added package was not found"
+        return cold, warm, moved, len(index.roots)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--paths', type=int, default=100000, help='changed paths')
+    parser.add_argument('--roots', type=int, default=500, help='package roots')
+    parser.add_argument('--packages', type=int, default=300, help='packages of the scratch repository')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--max-seconds', type=float, default=0.5,
+                        help='allowed time to count the scopes of all paths (default: 0.5)')
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    markers = synthetic_roots(rnd, args.roots)
+    build_time, index = timed(ScopeIndex.discovered, markers)
+    paths = synthetic_paths(rnd, sorted(index.roots), args.paths)
+
+    # A fresh index has no memoized directories: the worst case
+    cold_time, counts = timed(index.count, paths)
+    count_time, _ = timed(index.count, paths)
+    sample = rnd.sample(paths, min(len(paths), 2000))
+    naive_time, expected = timed(lambda: [naive_scope(index, path) for path in sample])
+    assert [index.scope(path) for path in sample] == expected, "scopes differ from the naive scan"
+
+    print(f"roots:         {len(index.roots)} (index built in {build_time * 1000:.1f}ms)")
+    print(f"paths:         {len(paths)} in {len(counts)} scopes")
+    print(f"count:         {cold_time * 1000:.1f}ms cold, {count_time * 1000:.1f}ms memoized")
+    print(f"naive scan:    {naive_time / len(sample) * len(paths) * 1000:.0f}ms (extrapolated)")
+
+    cold, warm, moved, roots = repository_timings(args.packages)
+    print(f"repository:    {roots} packages: {cold * 1000:.1f}ms cold, {warm * 1000:.1f}ms cached, "
+          f"{moved * 1000:.1f}ms after a commit")
+
+    if max(cold_time, count_time) > args.max_seconds:
+        print(f"FAIL: counting scopes took {max(cold_time, count_time):.3f}s")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Cold-start check for hook usage
+
+Hooks start the generator on every commit, so its start-up time is paid
+over and over. This compiles the module, then:
+
+- imports it under ``python -X importtime`` and fails when the cumulative
+  import time (best of --repeat runs) is above --max-import-ms;
+- runs ``python -m commit_message_generator --quick --staged`` in a scratch
+  repository and fails when the wall time (best of --repeat runs) is above
+  --max-run-ms, or when that run imported any module of the slow-start
+  list (asyncio, concurrent.futures, ...) that only other modes need.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --max-import-ms 40 --max-run-ms 150 --show 15
+"""
+
+import argparse
+import compileall
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Modules only the daemon, watch, history and parallel modes need
+SLOW_START_MODULES = ('asyncio', 'concurrent.futures', 'multiprocessing', 'socket',
+                      'tempfile', 'pathlib', 'typing', 'ctypes')
+
+
+def import_times(stderr: str):
+    """Parse ``-X importtime`` output into {module: cumulative microseconds}."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def run(args, cwd, env):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable] + args, cwd=cwd, env=env,
+                            capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, result
+
+
+def scratch_repository(path: str):
+    """A repository with one staged source file and one staged doc."""
+    def git(*args):
+        subprocess.run(['git'] + list(args), cwd=path, check=True, capture_output=True)
+    git('init', '-q')
+    git('config', 'user.email', 'bench@example.com')
+    git('config', 'user.name', 'bench')
+    Path(path, 'app.py').write_text('def main():\n    return 1\n')
+    git('add', '.')
+    git('commit', '-qm', 'init')
+    Path(path, 'app.py').write_text('def main():\n    # fix the off by one\n    return 0\n')
+    Path(path, 'README.md').write_text('# App\n')
+    git('add', '.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement')
+    parser.add_argument('--max-import-ms', type=float, default=40.0,
+                        help='allowed cumulative import time (default: 40)')
+    parser.add_argument('--max-run-ms', type=float, default=150.0,
+                        help='allowed wall time of a --quick --staged run (default: 150)')
+    parser.add_argument('--show', type=int, default=8,
+                        help='slowest imports to list (default: 8)')
+    args = parser.parse_args()
+
+    # Hooks run from a compiled module; never measure compilation
+    compileall.compile_file(str(ROOT / 'commit_message_generator.py'), quiet=1)
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    failed = False
+
+    best = None
+    for _ in range(args.repeat):
+        _, result = run(['-X', 'importtime', '-c', 'import commit_message_generator'], ROOT, env)
+        times = import_times(result.stderr)
+        if best is None or times['commit_message_generator'] < best['commit_message_generator']:
+            best = times
+    import_ms = best['commit_message_generator'] / 1000
+    print(f"import:        {import_ms:.1f}ms (allowed {args.max_import_ms:.0f}ms)")
+    for name, micros in sorted(best.items(), key=lambda item: -item[1])[1:args.show + 1]:
+        print(f"  {name:<28} {micros / 1000:>6.1f}ms")
+    if import_ms > args.max_import_ms:
+        print(f"FAIL: importing took {import_ms:.1f}ms")
+        failed = True
+
+    with tempfile.TemporaryDirectory() as repo:
+        scratch_repository(repo)
+        command = ['-m', 'commit_message_generator', '--quick', '--staged']
+        run_seconds = min(run(command, repo, env)[0] for _ in range(args.repeat))
+        _, result = run(['-X', 'importtime'] + command, repo, env)
+    print(f"quick run:     {run_seconds * 1000:.1f}ms (allowed {args.max_run_ms:.0f}ms)")
+    print(f"message:       {result.stdout.strip()}")
+    if run_seconds * 1000 > args.max_run_ms:
+        print(f"FAIL: a --quick --staged run took {run_seconds * 1000:.1f}ms")
+        failed = True
+
+    loaded = sorted(set(import_times(result.stderr)) & set(SLOW_START_MODULES))
+    if loaded:
+        print(f"FAIL: a --quick --staged run imported {', '.join(loaded)}")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
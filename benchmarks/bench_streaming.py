@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Streaming diff memory check
+
+Pipes a generated diff (500 MB by default) through
+CommitMessageGenerator.stream_git_command / analyze_stream, then runs
+analyze_changes, the --quick path, on a scratch repository with one
+modified file whose diff is --changes-size MB (200 by default), and samples
+the peak RSS after every block of both. Exits non-zero when the peak keeps
+growing after warm-up by more than the allowed slack, i.e. when memory is
+no longer bounded by the block size and the per-file budget.
+
+Usage:
+    python benchmarks/bench_streaming.py              # 500 MB diff
+    python benchmarks/bench_streaming.py 100 --slack 32 --changes-size 50
+"""
+
+import argparse
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from commit_message_generator import CommitMessageGenerator, DiffBudget  # noqa: E402
+
+# Writes a unified diff of the requested size (in MB) to stdout
+DIFF_WRITER = r'''
+import sys
+size = int(sys.argv[1]) * 1024 * 1024
+hunk = "".join([
+    "diff --git a/src/module.py b/src/module.py\n",
+    "--- a/src/module.py\n",
+    "+++ b/src/module.py\n",
+    "@@ -1,8 +1,8 @@\n",
+    "+def handle_error(value):\n",
+    "+    # fix the cache lookup\n",
+    "+    assert value is not None\n",
+    "-    return compute(value)\n",
+    "     unchanged context line\n",
+] * 64)
+out = sys.stdout
+written = 0
+while written < size:
+    out.write(hunk)
+    written += len(hunk)
+'''
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class SampledGenerator(CommitMessageGenerator):
+    """A generator recording the peak RSS after every block git sends it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.samples = []
+
+    def stream_git_command(self, cmd, *args, **kwargs):
+        for block in super().stream_git_command(cmd, *args, **kwargs):
+            yield block
+            self.samples.append(peak_rss_mb())
+
+
+def growth_after_warm_up(samples) -> tuple:
+    warm = samples[min(len(samples) - 1, max(1, len(samples) // 10))]
+    return warm, samples[-1] - warm
+
+
+def modified_file_repository(path: str, size: int):
+    """A repository whose only change is a tracked file rewritten to ``size`` MB."""
+    def git(*args):
+        subprocess.run(['git'] + list(args), cwd=path, check=True, capture_output=True)
+    git('init', '-q')
+    git('config', 'user.email', 'bench@example.com')
+    git('config', 'user.name', 'bench')
+    module = Path(path, 'module.py')
+    module.write_text('def handle_error(value):\n    return value\n')
+    git('add', '.')
+    git('commit', '-qm', 'init')
+    chunk = ('def handle_error(value):\n    # fix the cache lookup\n'
+             '    assert value is not None\n    return compute(value)\n') * 1024
+    with module.open('w') as out:
+        for _ in range(size * 1024 * 1024 // len(chunk)):
+            out.write(chunk)
+
+
+def check_changes(size: int, slack: float) -> bool:
+    """Stream one file's huge diff through analyze_changes; return whether memory stayed bounded."""
+    with tempfile.TemporaryDirectory() as repo:
+        modified_file_repository(repo, size)
+        # No total limit, so the whole file goes through the per-file budget
+        generator = SampledGenerator(repo=repo, budget=DiffBudget(max_total_bytes=None))
+        start = time.perf_counter()
+        analysis = generator.analyze_changes(level='patch')
+        elapsed = time.perf_counter() - start
+
+    samples = generator.samples
+    warm, growth = growth_after_warm_up(samples)
+    print(f"changes:       one file, {size} MB of diff in {len(samples)} blocks, "
+          f"{analysis.diff_analysis['sampled_files']} sampled")
+    print(f"lines added:   {analysis.diff_analysis['additions']}")
+    print(f"elapsed:       {elapsed:.2f}s (analyze_changes, including git diff)")
+    print(f"peak RSS:      {warm:.1f} MB after warm-up, {samples[-1]:.1f} MB at the end")
+    if growth > slack:
+        print(f"FAIL: peak RSS grew by {growth:.1f} MB analyzing the changes (allowed {slack:.1f} MB)")
+        return False
+    print(f"OK: peak RSS grew by {growth:.1f} MB")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('size', nargs='?', type=int, default=500, help='diff size in MB')
+    parser.add_argument('--slack', type=float, default=16.0,
+                        help='allowed peak RSS growth after warm-up, in MB')
+    parser.add_argument('--changes-size', type=int, default=200,
+                        help='diff size of the modified file analyze_changes reads, in MB')
+    args = parser.parse_args()
+
+    # Without a budget the whole diff is read, and analyzed line by line
+    generator = CommitMessageGenerator(budget=DiffBudget.unlimited())
+    blocks = generator.stream_git_command([sys.executable, '-c', DIFF_WRITER, str(args.size)])
+
+    samples = []
+
+    def sampled(stream):
+        for block in stream:
+            yield block
+            samples.append(peak_rss_mb())
+
+    start = time.perf_counter()
+    analysis = generator.analyze_stream(['src/module.py'], sampled(blocks))
+    elapsed = time.perf_counter() - start
+
+    warm, growth = growth_after_warm_up(samples)
+    print(f"diff size:     {args.size} MB in {len(samples)} blocks")
+    print(f"lines added:   {analysis.diff_analysis['additions']}")
+    print(f"elapsed:       {elapsed:.2f}s")
+    print(f"peak RSS:      {warm:.1f} MB after warm-up, {samples[-1]:.1f} MB at the end")
+
+    failed = growth > args.slack
+    if failed:
+        print(f"FAIL: peak RSS grew by {growth:.1f} MB (allowed {args.slack:.1f} MB)")
+    else:
+        print(f"OK: peak RSS grew by {growth:.1f} MB")
+    print()
+
+    if not check_changes(args.changes_size, args.slack):
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
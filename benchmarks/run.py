@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Per-stage benchmark suite
+
+Runs every stage of the generator over the seeded synthetic scenarios in
+synthetic.py and reports wall time (best of --repeat runs) and peak
+traced memory per stage. With a baseline JSON file present, each stage is
+compared against it and the run fails when a stage got slower (or
+hungrier) by more than --threshold. Baselines depend on the machine, so
+none is committed: CI records one on its own runner and passes
+--require-baseline, which also fails the run when the baseline is missing
+or lacks a stage.
+
+Usage:
+    python benchmarks/run.py                        # compare with benchmarks/baseline.json
+    python benchmarks/run.py --save-baseline        # record a new baseline
+    python benchmarks/run.py --require-baseline     # in CI: no baseline is a failure
+    python benchmarks/run.py --scenario giant-file --scale 2 --threshold 0.5
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from commit_message_generator import CommitMessageGenerator  # noqa: E402
+from synthetic import SCENARIOS, generate  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+
+
+class SyntheticGenerator(CommitMessageGenerator):
+    """Generator whose git status comes from the synthetic change set."""
+
+    def __init__(self, status: str):
+        super().__init__()
+        self.status = status
+
+    def get_git_status(self) -> str:
+        return self.status
+
+
+def stages(generator: SyntheticGenerator, files, diff):
+    """The timed stages, as (name, callable) pairs."""
+    return [
+        ('get_changed_files', lambda: generator.get_changed_files(staged=True)),
+        ('analyze_file_types', lambda: generator.analyze_file_types(files)),
+        ('analyze_diff_content', lambda: generator.analyze_diff_content(diff)),
+        ('determine_commit_type', lambda: generator.determine_commit_type(files, diff)),
+        ('generate_detailed_message', lambda: generator.generate_detailed_message(files, diff)),
+    ]
+
+
+def measure(func, repeat: int):
+    """Best wall time over ``repeat`` runs, and peak traced memory of one run."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    # Traced separately: tracemalloc slows allocation-heavy code down a lot
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def run(scenarios, scale: int, seed: int, repeat: int):
+    results = {}
+    for scenario in scenarios:
+        files, status, diff = generate(scenario, scale, seed)
+        generator = SyntheticGenerator(status)
+        for stage, func in stages(generator, files, diff):
+            seconds, peak = measure(func, repeat)
+            results[f"{scenario}/{stage}"] = {'seconds': seconds, 'peak_bytes': peak}
+    return results
+
+
+def compare(results, baseline, threshold: float):
+    """Yield (key, metric, old, new) for every regression beyond the threshold."""
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            old, new = previous[metric], current[metric]
+            # Ignore noise on stages too fast to measure reliably
+            if metric == 'seconds' and new < 0.001:
+                continue
+            if old and new > old * (1 + threshold):
+                yield key, metric, old, new
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='Scenario to run; may be repeated (default: all)')
+    parser.add_argument('--scale', type=int, default=1, help='Size multiplier of the scenarios')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic data')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per stage')
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE,
+                        help='Baseline JSON file to compare with or save to')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Write the results to the baseline file instead of comparing')
+    parser.add_argument('--require-baseline', action='store_true',
+                        help='Fail when the baseline file, or a stage in it, is missing')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed relative regression per stage (default: 0.25)')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.scenario or sorted(SCENARIOS), args.scale, args.seed, args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print(f"{'stage':<48} {'time':>10} {'peak memory':>12}")
+        for key, result in results.items():
+            print(f"{key:<48} {result['seconds'] * 1000:>8.1f}ms "
+                  f"{result['peak_bytes'] / 1024 / 1024:>10.1f}MB")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        if args.require_baseline:
+            sys.exit(1)
+        return
+
+    baseline = json.loads(args.baseline.read_text())
+    regressions = list(compare(results, baseline, args.threshold))
+    for key, metric, old, new in regressions:
+        print(f"REGRESSION {key} {metric}: {old:.4g} -> {new:.4g} "
+              f"(+{(new / old - 1) * 100:.0f}%, allowed {args.threshold * 100:.0f}%)")
+    missing = [key for key in results if key not in baseline] if args.require_baseline else []
+    for key in missing:
+        print(f"MISSING {key}: not in the baseline; record it with --save-baseline")
+    if regressions or missing:
+        sys.exit(1)
+    print(f"OK: no stage regressed by more than {args.threshold * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Seeded synthetic change sets for the benchmarks
+
+Each scenario returns the changed file list, the matching
+`git status --porcelain=v2 -z` text and the unified diff, so every stage of the
+generator can be fed without a real repository.
+"""
+
+import random
+from typing import Callable, Dict, List, Tuple
+
+ChangeSet = Tuple[List[str], str, str]
+
+WORDS = [
+    'value', 'result', 'return', 'self', 'data', 'index', 'item', 'name',
+    'config', 'handle', 'error', 'update', 'test', 'assert', 'import', 'def',
+    'class', 'function', 'cache', 'format', 'move', 'path', 'count', 'line',
+]
+
+SOURCE_LINES = [
+    'def {name}(value):',
+    'class {Name}(Base):',
+    'import {name}',
+    'from {name} import {Name}',
+    '# {words}',
+    'assert {name} == {name}',
+    'return {words}',
+    '{name} = {name}({name})',
+]
+
+EXTENSIONS = ['.py', '.js', '.ts', '.java', '.c', '.md', '.json', '.yaml', '.txt', '.css']
+
+
+def _line(rnd: random.Random) -> str:
+    name = rnd.choice(WORDS) + '_' + rnd.choice(WORDS)
+    template = rnd.choice(SOURCE_LINES)
+    words = ' '.join(rnd.choice(WORDS) for _ in range(6))
+    return '    ' + template.format(name=name, Name=name.title().replace('_', ''), words=words)
+
+
+def _file_diff(rnd: random.Random, path: str, hunks: int, lines_per_hunk: int) -> List[str]:
+    lines = [f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}"]
+    start = 1
+    for _ in range(hunks):
+        lines.append(f"@@ -{start},{lines_per_hunk} +{start},{lines_per_hunk} @@")
+        for _ in range(lines_per_hunk):
+            lines.append(rnd.choice('+- ') + _line(rnd))
+        start += lines_per_hunk * 2
+    return lines
+
+
+BLOB = 'a' * 40
+
+
+def _status(files: List[str], code: str = 'M.') -> str:
+    return ''.join(f"1 {code} N... 100644 100644 100644 {BLOB} {BLOB} {path}\0" for path in files)
+
+
+def many_small(rnd: random.Random, scale: int) -> ChangeSet:
+    """Thousands of files with one or two small hunks each."""
+    files = [f"pkg{i % 50}/module_{i}{rnd.choice(EXTENSIONS)}" for i in range(2000 * scale)]
+    diff = []
+    for path in files:
+        diff += _file_diff(rnd, path, rnd.randint(1, 2), 6)
+    return files, _status(files), '\n'.join(diff)
+
+
+def giant_file(rnd: random.Random, scale: int) -> ChangeSet:
+    """One file with a very long diff."""
+    files = ['src/generated_tables.py']
+    diff = _file_diff(rnd, files[0], 2000 * scale, 50)
+    return files, _status(files), '\n'.join(diff)
+
+
+def binary_heavy(rnd: random.Random, scale: int) -> ChangeSet:
+    """Mostly binary assets, whose diffs carry no content lines."""
+    files = []
+    diff = []
+    for i in range(2000 * scale):
+        if rnd.random() < 0.9:
+            path = f"assets/img/sprite_{i}.png"
+            diff += [f"diff --git a/{path} b/{path}", "index 1111111..2222222 100644",
+                     f"Binary files a/{path} and b/{path} differ"]
+        else:
+            path = f"src/loader_{i}.js"
+            diff += _file_diff(rnd, path, 1, 10)
+        files.append(path)
+    return files, _status(files), '\n'.join(diff)
+
+
+def rename_heavy(rnd: random.Random, scale: int) -> ChangeSet:
+    """A refactor that moves thousands of files, a few with edits."""
+    files = []
+    status = []
+    diff = []
+    for i in range(2000 * scale):
+        old = f"lib/old_name/part_{i}.py"
+        new = f"lib/new_name/part_{i}.py"
+        files.append(new)
+        similarity = 100 if rnd.random() < 0.8 else rnd.randint(60, 99)
+        status.append(f"2 R. N... 100644 100644 100644 {BLOB} {BLOB} R{similarity} {new}\0{old}\0")
+        diff += [f"diff --git a/{old} b/{new}", f"similarity index {similarity}%",
+                 f"rename from {old}", f"rename to {new}"]
+        if similarity < 100:
+            diff += [f"--- a/{old}", f"+++ b/{new}", "@@ -1,4 +1,4 @@"]
+            diff += [rnd.choice('+-') + _line(rnd) for _ in range(4)]
+    return files, ''.join(status), '\n'.join(diff)
+
+
+SCENARIOS: Dict[str, Callable[[random.Random, int], ChangeSet]] = {
+    'many-small': many_small,
+    'giant-file': giant_file,
+    'binary-heavy': binary_heavy,
+    'rename-heavy': rename_heavy,
+}
+
+
+def generate(scenario: str, scale: int = 1, seed: int = 0) -> ChangeSet:
+    """Build the change set of a scenario; the same seed gives the same data."""
+    return SCENARIOS[scenario](random.Random(seed), scale)
+
+
+def synthetic_diff(size: int, seed: int = 0) -> str:
+    """Build a unified diff of roughly ``size`` characters."""
+    rnd = random.Random(seed)
+    lines = []
+    total = 0
+    file_no = 0
+    while total < size:
+        if not lines or rnd.random() < 0.002:
+            name = f"src/module_{file_no}.py"
+            file_no += 1
+            lines += [f"diff --git a/{name} b/{name}", f"--- a/{name}",
+                      f"+++ b/{name}", "@@ -1,40 +1,42 @@"]
+        line = rnd.choice('+- ') + '    ' + ' '.join(rnd.choice(WORDS) for _ in range(8))
+        lines.append(line)
+        total += len(line) + 1
+    return '\n'.join(lines)
+
+
+# What the commits of each type in the synthetic history usually touch:
+# (paths, added line templates, share of removed lines)
+HISTORY_PROFILES: Dict[str, Tuple[List[str], List[str], float]] = {
+    'feat': (['src/{name}.py', 'src/{name}.js'],
+             ['def {name}(value):', 'class {Name}(Base):', 'return {name}({name})', 'self.{name} = {name}'], 0.1),
+    'fix': (['src/{name}.py', 'lib/{name}.c'],
+            ['if {name} is None:', 'return {name} or {name}', '{name} = {name}({name})'], 0.5),
+    'docs': (['docs/{name}.md', 'README.md', 'docs/{name}.rst'],
+             ['{words}', '## {Name}', 'See {name} for {words}'], 0.3),
+    'style': (['src/{name}.py', 'src/{name}.js'],
+              ['{name}={name}', '{name} = {name}', '    {name}({name},{name})'], 0.5),
+    'refactor': (['src/{name}.py', 'lib/{name}.py'],
+                 ['{name} = {name}({name})', 'from {name} import {Name}', 'return {name}'], 0.5),
+    'test': (['tests/test_{name}.py', 'src/{name}.spec.js'],
+             ['def test_{name}():', 'assert {name} == {name}', 'assert {name}({name})'], 0.2),
+    'chore': (['config/{name}.yaml', 'package.json', 'setup.cfg'],
+              ['{name}: {name}', '"version": "1.{n}.0"', '{name} = {n}'], 0.4),
+    'perf': (['src/{name}.py', 'lib/{name}.c'],
+             ['{name} = cache.get({name})', 'for {name} in {name}:', 'return {name}'], 0.4),
+    'ci': (['.github/workflows/{name}.yml', '.gitlab-ci.yml'],
+           ['runs-on: ubuntu-latest', '- run: {name}', 'steps:'], 0.3),
+    'build': (['requirements.txt', 'setup.py', 'Dockerfile', 'Makefile'],
+              ['{name}=={n}.{n}', 'RUN pip install {name}', '{name}: {name}'], 0.3),
+}
+
+HISTORY_WEIGHTS = {'feat': 25, 'fix': 25, 'docs': 10, 'style': 4, 'refactor': 10, 'test': 10,
+                   'chore': 8, 'perf': 3, 'ci': 2, 'build': 3}
+
+
+def _history_commit(rnd: random.Random, commit_type: str) -> List[str]:
+    paths, templates, removed = HISTORY_PROFILES[commit_type]
+    lines = []
+    for _ in range(rnd.randint(1, 3)):
+        name = rnd.choice(WORDS) + '_' + rnd.choice(WORDS)
+        path = rnd.choice(paths).format(name=name)
+        if commit_type == 'refactor' and rnd.random() < 0.4:
+            old = path.replace(name, rnd.choice(WORDS))
+            lines += [f"diff --git a/{old} b/{path}", "similarity index 100%",
+                      f"rename from {old}", f"rename to {path}"]
+            continue
+        count = rnd.randint(2, 30)
+        lines += [f"diff --git a/{path} b/{path}", f"--- a/{path}", f"+++ b/{path}",
+                  f"@@ -1,{count} +1,{count} @@"]
+        for _ in range(count):
+            template = rnd.choice(templates if rnd.random() < 0.7 else SOURCE_LINES)
+            name = rnd.choice(WORDS) + '_' + rnd.choice(WORDS)
+            text = template.format(name=name, Name=name.title().replace('_', ''), n=rnd.randint(0, 9),
+                                   words=' '.join(rnd.choice(WORDS) for _ in range(5)))
+            lines.append(('-' if rnd.random() < removed else '+') + text)
+    return lines
+
+
+def synthetic_history(commits: int = 1000, seed: int = 0, noise: float = 0.3) -> List[Tuple[str, str, str]]:
+    """Conventional commits as (sha, subject, diff), oldest first.
+    
+    Each commit mostly looks like its type; with probability ``noise`` it
+    also carries the changes of another type, as real commits do.
+    """
+    rnd = random.Random(seed)
+    types = list(HISTORY_WEIGHTS)
+    weights = [HISTORY_WEIGHTS[commit_type] for commit_type in types]
+    history = []
+    for number in range(commits):
+        commit_type = rnd.choices(types, weights)[0]
+        lines = _history_commit(rnd, commit_type)
+        if rnd.random() < noise:
+            lines += _history_commit(rnd, rnd.choice(types))
+        subject = f"{commit_type}: " + ' '.join(rnd.choice(WORDS) for _ in range(4))
+        history.append((f"{number:040x}", subject, '\n'.join(lines)))
+    return history
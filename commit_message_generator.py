@@ -8,31 +8,2084 @@ based on the type of changes made.
 Usage:
     python commit_message_generator.py
     python commit_message_generator.py --staged
+    python commit_message_generator.py --serve
+    python commit_message_generator.py --quick --staged --client
+    python commit_message_generator.py --watch --staged
+    python commit_message_generator.py --train --range main~2000..main
+    python commit_message_generator.py --discover ~/src --format json
+    git diff main... | python commit_message_generator.py --stdin --format json
     python commit_message_generator.py --help
+
+In hooks, which start it on every commit, run it as a module so Python
+loads the compiled bytecode instead of compiling the script each time:
+    PYTHONPATH=/path/to/tools python -m commit_message_generator --quick --staged
+
+With a --serve daemon running, add --client: the run asks the daemon before
+anything but socket and json is loaded, so it costs little more than
+starting Python. Without Python at all, send the request line yourself:
+    printf '{"repo": "%s", "staged": true}\\n' "$PWD" |
+        socat - "UNIX-CONNECT:${XDG_RUNTIME_DIR:-/tmp}/commit-message-generator-$(id -u)/daemon.sock"
+which prints ``{"message": ...}``, see MessageServer.
+
+Library use, without running git:
+    from commit_message_generator import CommitMessageGenerator, suggest_commit
+
+    generator = CommitMessageGenerator()        # reuse it across calls
+    report = suggest_commit(diff_text, generator=generator)
+    report['type'], report['message'], report['scores']
+
+suggest_commit and analyze_diff accept the diff as a string, as an
+iterable of blocks of whole lines, or as a text or binary file object.
+The report is the dict printed by --format json, see
+CommitMessageGenerator.report. Messages get a conventional commit scope
+once ``generator.scope_index`` is set, e.g. to
+``ScopeIndex.from_config({"billing": "services/billing"})``.
 """
 
-import subprocess
-import re
-import argparse
-from typing import List, Dict, Tuple
-from pathlib import Path
+# Startup time matters in hooks, which run on every commit: modules only
+# some modes need (asyncio, sqlite3, socket, select, tempfile, argparse,
+# concurrent.futures) are imported where they are used, and annotations are
+# not evaluated so they can name them and typing without importing them.
+# See benchmarks/bench_startup.py.
+from __future__ import annotations
+
+import json
+import os
+import sys
+
+# How much of a change set is read from git, cheapest first
+ANALYSIS_LEVELS = ('name-status', 'numstat', 'patch')
+
+
+# The client side of the --serve daemon comes before everything else: a
+# hook's `--quick --client` run is answered with only socket and json loaded,
+# see run_thin_client.
+
+def default_socket_path() -> str:
+    """Per-user socket path of the message server.
+    
+    The socket lives in a directory only its user can enter, which the
+    server creates and checks, see MessageServer.serve.
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir is None:
+        import tempfile
+        runtime_dir = tempfile.gettempdir()
+    return os.path.join(runtime_dir, f"commit-message-generator-{os.getuid()}", 'daemon.sock')
+
+
+def request_message(socket_path: str, repo: str, staged: bool = False, level: str = 'auto',
+                    detailed: bool = False, timeout: float = 10.0,
+                    output_format: str = 'text') -> dict:
+    """Ask a running MessageServer for a message; raises OSError if none is listening.
+    
+    With ``output_format='json'`` the response holds the full report instead.
+    A socket owned by another user is refused with PermissionError: its
+    server would see the repository path and could answer anything.
+    """
+    if os.stat(socket_path).st_uid != os.getuid():
+        raise PermissionError(f"{socket_path} belongs to another user")
+    import socket
+    request = {'repo': repo, 'staged': staged, 'level': level, 'detailed': detailed,
+               'format': output_format}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(socket_path)
+        client.sendall(json.dumps(request).encode() + b'\n')
+        data = b''
+        while not data.endswith(b'\n'):
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    return json.loads(data)
+
+
+def print_response(response: dict):
+    """Print a daemon response the way an in-process run prints its result.
+    
+    An error response is printed on stderr and exits with status 1.
+    """
+    if 'error' in response:
+        print(f"Error from server: {response['error']}", file=sys.stderr)
+        sys.exit(1)
+    elif 'report' in response:
+        print(json.dumps(response['report']))
+    elif response['message'] is None:
+        print("No changes detected.")
+    else:
+        print(response['message'])
+
+
+def run_thin_client(argv: List[str]) -> bool:
+    """Answer a ``--quick --client`` run from the daemon before the module loads.
+    
+    Only understands --client, --quick, --staged, --level, --format and
+    --socket. Returns False on anything else, or when no daemon is
+    listening, and the full command line takes over.
+    """
+    flags = set()
+    options = {'--level': 'auto', '--format': 'text', '--socket': None}
+    arguments = iter(argv)
+    for argument in arguments:
+        name, has_value, value = argument.partition('=')
+        if name in options:
+            options[name] = value if has_value else next(arguments, None)
+        elif argument in ('--client', '--quick', '--staged'):
+            flags.add(argument)
+        else:
+            return False
+    if (options['--level'] not in ('auto',) + ANALYSIS_LEVELS
+            or options['--format'] not in ('text', 'json') or options['--socket'] == ''
+            or not ('--quick' in flags or options['--format'] == 'json')):
+        return False
+    try:
+        response = request_message(options['--socket'] or default_socket_path(), os.getcwd(),
+                                   '--staged' in flags, options['--level'],
+                                   output_format=options['--format'])
+    except (OSError, ValueError):
+        return False
+    print_response(response)
+    return True
+
+
+def run_main(function, *args):
+    """Run an entry point, exiting quietly with status 1 when stdout's reader goes away.
+    
+    Output piped into e.g. ``head`` otherwise ends in a BrokenPipeError
+    traceback once head has read enough.
+    """
+    try:
+        result = function(*args)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # Point stdout at /dev/null so the flush at exit does not fail again
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    return result
+
+
+if __name__ == '__main__' and '--client' in sys.argv and run_main(run_thin_client, sys.argv[1:]):
+    sys.exit()
+
+import subprocess
+import re
+import codecs
+import fnmatch
+import functools
+import hashlib
+import math
+import signal
+import struct
+import threading
+import time
+from array import array
+from collections import Counter, deque
+from itertools import chain, islice
+from types import MappingProxyType
+
+# Type checkers treat this as True. typing is also needed by
+# typing.get_type_hints() in library use, but not by hooks, which run the
+# module as __main__; the async server and pools stay checker-only.
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import asyncio
+    from concurrent.futures import Executor
+if TYPE_CHECKING or __name__ != '__main__':
+    from typing import IO, AsyncIterator, Callable, List, Dict, Iterable, Iterator, Optional, Set, Tuple, Union
+
+    # Analysis of one file's diff: counters, keywords found and symbol index
+    FileDiffResult = Tuple[Dict[str, int], Set[str], List[dict]]
+
+# Size of the blocks read from git when streaming a diff
+STREAM_CHUNK_SIZE = 1 << 20
+
+# KeywordMatcher.find reads a text in blocks of about this many characters,
+# the first one smaller so that common keywords are found cheaply, and
+# searches a block through its distinct words while at least
+# KEYWORD_DEDUP_MIN_MISSING keywords are still missing
+KEYWORD_PROBE_CHARS = 64 * 1024
+KEYWORD_BLOCK_CHARS = 1024 * 1024
+KEYWORD_DEDUP_MIN_MISSING = 24
+
+# Bump when the per-file analysis changes so stale cache entries are ignored
+ANALYSIS_CACHE_VERSION = 6
+
+# Diff size (in characters) from which per-file analysis uses a process
+# pool, and the amount of diff sent to a worker per task
+PARALLEL_THRESHOLD = 8 * 1024 * 1024
+PARALLEL_BATCH_BYTES = 1024 * 1024
+
+# Default limits of a DiffBudget: diff analyzed line by line per file before
+# sampling it, and diff read per change set before stopping
+MAX_FILE_DIFF_BYTES = 1024 * 1024
+MAX_FILE_DIFF_LINES = 20000
+MAX_TOTAL_DIFF_BYTES = 64 * 1024 * 1024
+
+# Least diff analyzed of each further block of a sampled file, the least
+# hunks or lines sampled and the longest line analyzed (minified code is
+# one huge line)
+MIN_SAMPLE_BYTES = 16 * 1024
+MIN_SAMPLE_UNITS = 16
+MAX_SAMPLED_LINE = 1000
+
+# Lockfiles and generated files: their diffs say nothing about the kind of
+# change and can be huge, so they are only classified by name. Patterns
+# without a '/' match the base name, others the whole path.
+GENERATED_PATTERNS = (
+    'package-lock.json', 'npm-shrinkwrap.json', 'yarn.lock', 'pnpm-lock.yaml', 'Cargo.lock',
+    'Gemfile.lock', 'composer.lock', 'poetry.lock', 'Pipfile.lock', 'uv.lock', 'go.sum',
+    '*.min.js', '*.min.css', '*.map', '*_pb2.py', '*.pb.go', '*.generated.*',
+)
+
+# Files that mark the root of a package in a monorepo; the package's
+# directory name becomes the conventional commit scope of the files below it
+SCOPE_MARKERS = ('package.json', 'pyproject.toml', 'setup.py')
+
+# Share of the changed files one scope (or the listed scopes together) needs
+# to appear in the subject, and the most scopes listed in a subject before
+# it only counts packages
+DOMINANT_SCOPE_SHARE = 0.8
+MAX_SUBJECT_SCOPES = 3
+
+# Conventional commits a learned model needs overall and per commit type
+# (rarer types are left out of it), and the least log score lead of its
+# best type over the next: closer calls go to the hand-tuned weights
+MIN_MODEL_COMMITS = 100
+MIN_MODEL_TYPE_COMMITS = 10
+MIN_MODEL_MARGIN = 0.25
+
+# Limit on paths passed to one `git diff -- <paths>` before diffing everything
+MAX_PATHSPECS = 256
+
+# Most tracked files --watch stats on every poll without inotify, see PollingWatcher
+MAX_POLLED_TRACKED_FILES = 50000
+
+# Machine-readable status, see parse_status; without optional locks it never
+# rewrites the index, which would race with the user's own git commands
+STATUS_COMMAND = ['git', '--no-optional-locks', 'status', '--porcelain=v2', '-z', '--untracked-files=all']
+
+# Status letters of changes that carry a source path
+RENAME_STATUSES = ('R', 'C')
+
+# Version of the report dict (--format json); bumped when keys change meaning
+REPORT_VERSION = 1
+
+# Starts the header line of every commit in a `git log -p` stream
+COMMIT_MARKER = '\x1e'
+
+# Header line of every file in a unified diff
+DIFF_HEADER = re.compile(r'^diff --git .*$', re.MULTILINE)
+
+# Conventional commit subject, e.g. "feat(parser)!: add streaming mode"
+CONVENTIONAL_SUBJECT = re.compile(r'^(\w+)(?:\([^)]*\))?!?:')
+
+
+def line_blocks(text: str, size: int, first: Optional[int] = None) -> Iterator[str]:
+    """Split a text into blocks of whole lines of about ``size`` characters.
+    
+    The newline ending each block is dropped: joined with newlines, the
+    blocks give back the text without its final newline. The first block
+    is about ``first`` characters if given.
+    """
+    start = 0
+    length = first or size
+    while start < len(text):
+        end = text.find('\n', start + length)
+        if end == -1:
+            end = len(text)
+        yield text[start:end]
+        start = end + 1
+        length = size
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Build a regex alternation that shares common prefixes between words."""
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: dict) -> str:
+        branches = [re.escape(char) + build(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # Greedy optional suffix: the longest word at each offset wins
+        if '' in node:
+            body = '(?:' + body + ')?'
+        return body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """Find the keywords of every commit type in a piece of text.
+
+    A keyword without whitespace never straddles two whitespace-separated
+    words, so a text can be searched through its distinct words instead:
+    diffs repeat the same words over and over, and one split replaces a full
+    scan per keyword, which is what absent keywords cost ``keyword in text``.
+    Word-boundary matching and counts use a single prefix-sharing regex
+    wrapped in a lookahead, which reports overlapping hits ('test' inside
+    'testing') just like ``keyword in text``; it is built on first use.
+    """
+
+    def __init__(self, keywords: Dict[str, List[str]], word_boundary: bool = False):
+        self.word_boundary = word_boundary
+        self.types_by_keyword: Dict[str, List[str]] = {}
+        for commit_type, words in keywords.items():
+            for word in words:
+                if word:
+                    self.types_by_keyword.setdefault(word.lower(), []).append(commit_type)
+        # User keywords may hold whitespace; those are searched in the text itself
+        self.spaced = {keyword for keyword in self.types_by_keyword if keyword.split() != [keyword]}
+
+    @functools.cached_property
+    def implied(self) -> Dict[str, List[str]]:
+        """Keywords matched along with each keyword the regex reports.
+        
+        The regex reports the longest keyword at each offset; shorter
+        keywords that are prefixes of it matched at the same offset too.
+        """
+        implied = {}
+        for keyword in self.types_by_keyword:
+            implied[keyword] = [
+                prefix for prefix in self.types_by_keyword
+                if keyword.startswith(prefix) and (
+                    not self.word_boundary or prefix == keyword
+                    or not self._is_word_char(keyword[len(prefix)])
+                )
+            ]
+        return implied
+
+    @functools.cached_property
+    def pattern(self) -> Optional[re.Pattern]:
+        """The regex finding the longest keyword at every offset, None without keywords."""
+        if not self.types_by_keyword:
+            return None
+        alternation = _trie_pattern(self.types_by_keyword)
+        if self.word_boundary:
+            alternation = r'(?<!\w)(' + alternation + r')(?!\w)'
+        else:
+            alternation = '(' + alternation + ')'
+        return re.compile('(?=' + alternation + ')')
+
+    @staticmethod
+    def _is_word_char(char: str) -> bool:
+        return char.isalnum() or char == '_'
+
+    def count(self, text: str) -> Dict[str, int]:
+        """Count the hits of every keyword, scanning each distinct word once."""
+        counts = dict.fromkeys(self.types_by_keyword, 0)
+        if self.pattern is None:
+            return counts
+        
+        text_lower = text.lower()
+        words = Counter(text_lower.split()) if not self.spaced else {text_lower: 1}
+        implied = self.implied
+        for word, times in words.items():
+            for match in self.pattern.finditer(word):
+                for keyword in implied[match.group(1)]:
+                    counts[keyword] += times
+        return counts
+
+    def find(self, text: str, candidates: Optional[Iterable[str]] = None) -> Set[str]:
+        """Return the keywords (out of ``candidates``) that occur in the text.
+        
+        Reads the text block by block and stops once every candidate is
+        found. While many are missing, or with word boundaries, a block is
+        searched through its distinct words; once few are left, scanning
+        the block for each of them is cheaper.
+        """
+        missing = set(self.types_by_keyword if candidates is None else candidates)
+        found: Set[str] = set()
+        # No keyword without whitespace spans the newline between two blocks
+        for block in line_blocks(text, KEYWORD_BLOCK_CHARS, KEYWORD_PROBE_CHARS):
+            if not missing:
+                break
+            block = block.lower()
+            if self.word_boundary or len(missing) >= KEYWORD_DEDUP_MIN_MISSING:
+                words = '\n'.join(set(block.split()))
+                hits = self._search(words, missing - self.spaced)
+                if self.spaced:
+                    hits |= self._search(block, missing & self.spaced)
+            else:
+                hits = self._search(block, missing)
+            found |= hits
+            missing -= hits
+        return found
+
+    def _search(self, text_lower: str, wanted: Set[str]) -> Set[str]:
+        """The keywords of ``wanted`` in an already lowercased text."""
+        if not wanted:
+            return set()
+        if not self.word_boundary:
+            return {keyword for keyword in wanted if keyword in text_lower}
+        
+        found = set()
+        if self.pattern is not None:
+            for match in self.pattern.finditer(text_lower):
+                found.update(self.implied[match.group(1)])
+                if wanted <= found:
+                    break
+        return found & wanted
+
+    def score(self, found: Iterable[str], commit_types: Iterable[str]) -> Dict[str, int]:
+        """Score commit types by one point per distinct keyword found."""
+        scores = {commit_type: 0 for commit_type in commit_types}
+        for keyword in found:
+            for commit_type in self.types_by_keyword[keyword]:
+                scores[commit_type] += 1
+        return scores
+
+
+def empty_diff_analysis() -> Dict[str, int]:
+    """Return zeroed diff content counters."""
+    return {
+        'additions': 0,
+        'deletions': 0,
+        'function_additions': 0,
+        'class_additions': 0,
+        'import_changes': 0,
+        'comment_changes': 0,
+        'test_changes': 0,
+        'symbol_removals': 0,
+        'symbol_modifications': 0,
+        # Files whose counters were estimated from a sample or not analyzed
+        # at all, and whether reading stopped at the total budget
+        'sampled_files': 0,
+        'skipped_files': 0,
+        'truncated': 0
+    }
+
+
+# Counters a sampled file extrapolates; additions and deletions are exact
+SAMPLED_COUNTERS = ('function_additions', 'class_additions', 'import_changes', 'comment_changes',
+                    'test_changes', 'symbol_removals', 'symbol_modifications')
+
+
+# Language of the source file extensions analyze_file_types knows about
+LANGUAGE_BY_EXTENSION = {
+    '.py': 'python',
+    '.js': 'javascript', '.jsx': 'javascript', '.mjs': 'javascript', '.cjs': 'javascript',
+    '.ts': 'javascript', '.tsx': 'javascript',
+    '.java': 'java',
+    '.c': 'c', '.h': 'c', '.cpp': 'c', '.cc': 'c', '.cxx': 'c', '.hpp': 'c', '.hh': 'c',
+}
+
+# Definition patterns per language as (kind, regex with the name in group 1).
+# They are matched against single stripped diff lines, because hunks are
+# fragments that a real parser (ast, tokenize) would reject.
+SYMBOL_PATTERNS = {
+    'python': [
+        ('function', r'(?:async\s+)?def\s+([A-Za-z_]\w*)\s*\('),
+        ('class', r'class\s+([A-Za-z_]\w*)\s*[(:]'),
+    ],
+    'javascript': [
+        ('function', r'(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)\s*[(<]'),
+        ('function', r'(?:export\s+)?(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*(?::[^=]+)?=\s*'
+                     r'(?:async\s+)?(?:function\b|\([^)]*\)\s*(?::[^=]+)?=>|[A-Za-z_$][\w$]*\s*=>)'),
+        ('class', r'(?:export\s+)?(?:default\s+)?(?:abstract\s+)?(?:class|interface)\s+([A-Za-z_$][\w$]*)'),
+        ('function', r'(?:(?:public|private|protected|static|async|get|set|override|readonly)\s+)*'
+                     r'([A-Za-z_$][\w$]*)\s*\([^)]*\)\s*(?::\s*[^{;]+)?\{\s*$'),
+    ],
+    'java': [
+        ('class', r'(?:(?:public|protected|private|abstract|final|static|sealed|non-sealed)\s+)*'
+                  r'(?:class|interface|enum|record)\s+([A-Za-z_]\w*)'),
+        ('function', r'(?:(?:public|protected|private|static|final|abstract|synchronized|native|default)\s+)*'
+                     r'(?:<[^>]+>\s+)?[\w<>\[\],.?]+(?:\s*<[^>]*>)?\s+([A-Za-z_]\w*)\s*\([^;]*$'),
+    ],
+    'c': [
+        ('class', r'(?:template\s*<[^>]*>\s*)?(?:class|struct)\s+([A-Za-z_]\w*)\s*(?:final\s*)?[:{]?\s*$'),
+        ('function', r'(?:[\w:<>,*&]+\s+)+[*&]*\s*([A-Za-z_~][\w:~]*)\s*\([^;]*\)\s*'
+                     r'(?:const\s*)?(?:noexcept\s*)?(?:override\s*)?\{?\s*$'),
+    ],
+}
+
+# Substrings without which a line cannot match any pattern of the language
+SYMBOL_HINTS = {
+    'python': ('def', 'class'),
+    'javascript': ('function', '=>', 'class', 'interface', '{'),
+    'java': ('(', 'class', 'interface', 'enum', 'record'),
+    'c': ('(', 'class', 'struct'),
+}
+
+# Hunks indexed per analysis, so huge diffs keep a bounded symbol index
+MAX_INDEXED_HUNKS = 10000
+
+# Statements that look like definitions to the patterns above
+NOT_SYMBOLS = frozenset([
+    'if', 'for', 'while', 'switch', 'catch', 'return', 'else', 'new', 'sizeof',
+    'do', 'delete', 'throw', 'case', 'function', 'typeof', 'await', 'yield'
+])
+
+# Statements whose call looks like a definition to the C and Java patterns,
+# e.g. "return foo(x)", "else foo(x)" or "case 1: foo(x)"
+STATEMENT_PREFIX = re.compile(
+    r'(?:return|else|case|do|throw|goto|delete|new|co_return|co_yield|await|yield)\b')
+
+
+class SymbolDetector:
+    """Recognize function and class definitions of one language in diff lines."""
+
+    def __init__(self, language: str):
+        self.language = language
+        self.hints = SYMBOL_HINTS[language]
+        self.patterns = [(kind, re.compile(pattern)) for kind, pattern in SYMBOL_PATTERNS[language]]
+
+    def match(self, line: str) -> Optional[Tuple[str, str]]:
+        """Return (kind, name) if the line defines a symbol."""
+        for hint in self.hints:
+            if hint in line:
+                break
+        else:
+            return None
+        content = line.strip()
+        if STATEMENT_PREFIX.match(content):
+            return None
+        for kind, pattern in self.patterns:
+            match = pattern.match(content)
+            if match and match.group(1) not in NOT_SYMBOLS:
+                return kind, match.group(1)
+        return None
+
+
+# Detectors by file extension, built the first time a language shows up
+_detectors: Dict[str, Optional[SymbolDetector]] = {}
+_detectors_by_language: Dict[str, SymbolDetector] = {}
+
+
+def get_detector(path: str) -> Optional[SymbolDetector]:
+    """Get the (cached) symbol detector for a file, None for unknown languages."""
+    name = path[path.rfind('/') + 1:]
+    dot = name.rfind('.')
+    extension = name[dot:].lower() if dot > 0 else ''
+    try:
+        return _detectors[extension]
+    except KeyError:
+        pass
+    language = LANGUAGE_BY_EXTENSION.get(extension)
+    detector = None
+    if language is not None:
+        detector = _detectors_by_language.get(language)
+        if detector is None:
+            detector = _detectors_by_language[language] = SymbolDetector(language)
+    _detectors[extension] = detector
+    return detector
+
+
+class DiffLineCounter:
+    """Accumulate the content signals of diff lines, file by file and hunk by hunk.
+
+    Files in a language with a SymbolDetector get an index of the symbols
+    each hunk adds, removes and modifies (a definition both removed and
+    added, or the enclosing definition git names in the hunk header);
+    other files fall back to simple line prefix checks.
+    """
+
+    def __init__(self, max_indexed_hunks: int = MAX_INDEXED_HUNKS):
+        self.analysis = empty_diff_analysis()
+        # {path: [{'hunk': header, 'added': [...], 'removed': [...], 'modified': [...]}]}
+        self.symbols: Dict[str, List[dict]] = {}
+        # Past this many entries symbols are still counted, but not indexed
+        self.indexed_hunks = 0
+        self.max_indexed_hunks = max_indexed_hunks
+        self.path: Optional[str] = None
+        self.detector: Optional[SymbolDetector] = None
+        self.hunk: Optional[str] = None
+        self.added: Dict[str, str] = {}
+        self.removed: Dict[str, str] = {}
+
+    def feed(self, lines: Iterable[str]):
+        """Add the content signals of some diff lines."""
+        analysis = self.analysis
+        detector = self.detector
+        for line in lines:
+            if line.startswith('+'):
+                if line.startswith('+++'):
+                    continue
+                analysis['additions'] += 1
+                line_content = line[1:].strip().lower()
+                
+                if detector is None:
+                    # Check for function definitions
+                    if line_content.startswith('def ') or 'function' in line_content:
+                        analysis['function_additions'] += 1
+                    
+                    # Check for class definitions
+                    if line_content.startswith('class '):
+                        analysis['class_additions'] += 1
+                else:
+                    symbol = detector.match(line[1:])
+                    if symbol:
+                        self.added[symbol[1]] = symbol[0]
+                
+                # Check for imports
+                if line_content.startswith('import ') or line_content.startswith('from '):
+                    analysis['import_changes'] += 1
+                
+                # Check for comments
+                if line_content.startswith('#') or line_content.startswith('//') or line_content.startswith('/*'):
+                    analysis['comment_changes'] += 1
+                
+                # Check for test-related content
+                if 'test' in line_content or 'assert' in line_content:
+                    analysis['test_changes'] += 1
+                    
+            elif line.startswith('-'):
+                if line.startswith('---'):
+                    continue
+                analysis['deletions'] += 1
+                if detector is not None:
+                    symbol = detector.match(line[1:])
+                    if symbol:
+                        self.removed[symbol[1]] = symbol[0]
+            
+            elif line.startswith('@@'):
+                self.end_hunk()
+                self.hunk = line
+            
+            elif line.startswith('diff --git '):
+                self.end_hunk()
+                self.hunk = None
+                self.path = file_diff_path(line)
+                detector = self.detector = get_detector(self.path)
+
+    def end_hunk(self):
+        """Index the symbols of the current hunk and count them."""
+        detector = self.detector
+        if detector is None or self.hunk is None:
+            # Symbols outside any hunk, e.g. in a sampled diff, are dropped
+            if self.added or self.removed:
+                self.added = {}
+                self.removed = {}
+            return
+        added, removed = self.added, self.removed
+        modified = [name for name in added if name in removed]
+        
+        # "@@ -1,5 +1,6 @@ def enclosing():" names the definition being edited
+        context = detector.match(self.hunk.split('@@', 2)[-1])
+        if context and context[1] not in added and context[1] not in removed:
+            modified.append(context[1])
+        
+        new = [name for name in added if name not in removed]
+        gone = [name for name in removed if name not in added]
+        analysis = self.analysis
+        for name in new:
+            analysis['function_additions' if added[name] == 'function' else 'class_additions'] += 1
+        analysis['symbol_removals'] += len(gone)
+        analysis['symbol_modifications'] += len(modified)
+        
+        if (new or gone or modified) and self.indexed_hunks < self.max_indexed_hunks:
+            self.indexed_hunks += 1
+            self.symbols.setdefault(self.path, []).append(
+                {'hunk': self.hunk, 'added': new, 'removed': gone, 'modified': modified})
+        self.added = {}
+        self.removed = {}
+
+    def finish(self) -> Dict[str, int]:
+        """Close the last hunk and return the counters."""
+        self.end_hunk()
+        self.hunk = None
+        return self.analysis
+
+
+class DiffBudget:
+    """How much of a diff is analyzed line by line, see FileDiffAccumulator.
+    
+    Files matching ``skip_patterns`` are not analyzed at all, files whose
+    diff is longer than ``max_file_bytes`` or ``max_file_lines`` are sampled,
+    and reading stops after ``max_total_bytes`` of diff. None disables a limit.
+    """
+
+    __slots__ = ('max_file_bytes', 'max_file_lines', 'max_total_bytes', 'skip_patterns',
+                 'skip_name', 'skip_path')
+
+    def __init__(self, max_file_bytes: Optional[int] = MAX_FILE_DIFF_BYTES,
+                 max_file_lines: Optional[int] = MAX_FILE_DIFF_LINES,
+                 max_total_bytes: Optional[int] = MAX_TOTAL_DIFF_BYTES,
+                 skip_patterns: Iterable[str] = GENERATED_PATTERNS):
+        self.max_file_bytes = max_file_bytes
+        self.max_file_lines = max_file_lines
+        self.max_total_bytes = max_total_bytes
+        self.skip_patterns = tuple(skip_patterns)
+        self.skip_name = self._compile(pattern for pattern in self.skip_patterns if '/' not in pattern)
+        self.skip_path = self._compile(pattern for pattern in self.skip_patterns if '/' in pattern)
+
+    @staticmethod
+    def _compile(patterns: Iterable[str]) -> Optional['re.Pattern']:
+        patterns = [fnmatch.translate(pattern) for pattern in patterns]
+        return re.compile('|'.join(patterns)) if patterns else None
+
+    @classmethod
+    def unlimited(cls) -> 'DiffBudget':
+        """A budget that analyzes every line of every file."""
+        return cls(None, None, None, ())
+
+    def skips(self, path: Optional[str]) -> bool:
+        """Whether the diff of ``path`` is not analyzed at all."""
+        if path is None:
+            return False
+        if self.skip_name is not None and self.skip_name.match(path.rpartition('/')[2]):
+            return True
+        return self.skip_path is not None and self.skip_path.match(path) is not None
+
+    def exceeded(self, size: int, lines: int) -> bool:
+        """Whether a diff of ``size`` characters and ``lines`` lines is over a limit."""
+        return ((self.max_file_bytes is not None and size > self.max_file_bytes)
+                or (self.max_file_lines is not None and lines > self.max_file_lines)
+                or (self.max_total_bytes is not None and size > self.max_total_bytes))
+
+    def fingerprint(self) -> list:
+        """The settings per-file results depend on, for cache keys."""
+        return [self.max_file_bytes, self.max_file_lines, list(self.skip_patterns)]
+
+
+DEFAULT_DIFF_BUDGET = DiffBudget()
+
+
+def sample_hunks(text: str, fraction: float) -> str:
+    """Evenly spaced hunks making up about ``fraction`` of a diff, long lines cut.
+    
+    A diff with a single huge hunk is sampled line by line instead, keeping
+    the lines up to its hunk header. The first hunk, which holds the file
+    header, is always part of the sample.
+    """
+    units = text.split('\n@@')
+    if len(units) > 2:
+        units[1:] = ['@@' + unit for unit in units[1:]]
+        sample = _evenly_spaced(units, fraction)
+        # Hunks vary in size; fall back to lines when the chosen ones are huge
+        if len(sample) <= 2 * len(text) * fraction + MIN_SAMPLE_BYTES:
+            units = None
+    if units is not None:
+        cut = text.find('\n@@')
+        cut = text.find('\n', cut + 1) if cut != -1 else -1
+        sample = _evenly_spaced(text[cut + 1:].split('\n'), fraction)
+        if cut != -1:
+            sample = text[:cut] + '\n' + sample
+    return '\n'.join(line[:MAX_SAMPLED_LINE] for line in sample.split('\n'))
+
+
+def _evenly_spaced(units: List[str], fraction: float) -> str:
+    count = max(min(len(units), MIN_SAMPLE_UNITS), int(len(units) * fraction))
+    step = len(units) / count
+    return '\n'.join(units[int(i * step)] for i in range(count))
+
+
+def count_prefixed(text: str, prefix: str) -> int:
+    """Lines of ``text`` starting with ``prefix`` but not with three of it, as DiffLineCounter counts."""
+    header = prefix * 3
+    return (text.count('\n' + prefix) - text.count('\n' + header)
+            + (text.startswith(prefix) and not text.startswith(header)))
+
+
+class FileDiffAccumulator:
+    """Analyze the diff of one file as it arrives, within a DiffBudget.
+    
+    Until the file exceeds the budget every line goes through the
+    DiffLineCounter. Past it, only evenly spaced hunks of each further piece
+    are analyzed, each piece getting half the allowance of the one before,
+    and the content counters found in a sample are scaled up to the whole
+    piece. Additions and deletions stay exact: counting them is a cheap
+    substring count. Skipped files are not analyzed at all.
+    """
+
+    __slots__ = ('budget', 'counter', 'skipped', 'size', 'lines', 'samples', 'estimates')
+
+    def __init__(self, budget: DiffBudget, path: Optional[str],
+                 counter: Optional[DiffLineCounter] = None):
+        self.budget = budget
+        # Several files can share one counter, see DiffStreamAnalyzer
+        self.counter = counter if counter is not None else DiffLineCounter()
+        self.skipped = budget.skips(path)
+        self.size = 0
+        self.lines = 0
+        # Number of sampled pieces, and the counts extrapolated from them
+        self.samples = 0
+        self.estimates = dict.fromkeys(SAMPLED_COUNTERS, 0.0)
+
+    def feed(self, text: str) -> str:
+        """Analyze the next piece of whole lines; return the part that was analyzed."""
+        if self.skipped:
+            return ''
+        lines = text.count('\n') + 1
+        self.size += len(text)
+        self.lines += lines
+        if not self.samples and not self.budget.exceeded(self.size, self.lines):
+            self.counter.feed(text.split('\n'))
+            return text
+        
+        budget = self.budget
+        self.samples += 1
+        fraction = 1.0
+        if budget.max_file_bytes is not None:
+            allowance = max(budget.max_file_bytes >> self.samples, MIN_SAMPLE_BYTES)
+            fraction = min(fraction, allowance / len(text))
+        if budget.max_file_lines is not None:
+            allowance = max(budget.max_file_lines >> self.samples, MIN_SAMPLE_BYTES // 64)
+            fraction = min(fraction, allowance / lines)
+        sample = sample_hunks(text, fraction)
+        
+        # Close the hunk in progress so its symbols are not counted as sampled;
+        # sampled lines before the next hunk header still belong to it, so
+        # they are indexed under its header again
+        counter = self.counter
+        hunk = counter.hunk
+        analysis = counter.finish()
+        counter.hunk = hunk
+        before = [analysis[key] for key in SAMPLED_COUNTERS]
+        additions = analysis['additions'] + count_prefixed(text, '+')
+        deletions = analysis['deletions'] + count_prefixed(text, '-')
+        counter.feed(sample.split('\n'))
+        hunk = counter.hunk
+        counter.finish()
+        counter.hunk = hunk
+        scale = lines / (sample.count('\n') + 1) - 1
+        for key, value in zip(SAMPLED_COUNTERS, before):
+            self.estimates[key] += (analysis[key] - value) * scale
+        analysis['additions'] = additions
+        analysis['deletions'] = deletions
+        return sample
+
+    def close(self):
+        """Add the extrapolated counts and the sampling markers to the counter."""
+        analysis = self.counter.finish()
+        if self.skipped:
+            analysis['skipped_files'] += 1
+        elif self.samples:
+            for key, value in self.estimates.items():
+                analysis[key] += round(value)
+            analysis['sampled_files'] += 1
+
+
+class DiffStreamAnalyzer:
+    """Analyze a diff incrementally, one block of whole lines at a time.
+
+    Only the current block is held in memory, so peak memory depends on the
+    block size rather than on the size of the diff. Each file goes through a
+    FileDiffAccumulator, and blocks past the total budget are dropped and
+    mark the analysis as truncated.
+    """
+
+    def __init__(self, matcher: KeywordMatcher, budget: Optional[DiffBudget] = None):
+        self.matcher = matcher
+        self.budget = budget or DEFAULT_DIFF_BUDGET
+        self.counter = DiffLineCounter()
+        self.file: Optional[FileDiffAccumulator] = None
+        self.size = 0
+        self.found_keywords: Set[str] = set()
+        self.missing_keywords = set(matcher.types_by_keyword)
+
+    @property
+    def truncated(self) -> bool:
+        """Whether the total budget was used up and later blocks are ignored."""
+        return bool(self.counter.analysis['truncated'])
+
+    def feed(self, block: str):
+        """Analyze a block of complete diff lines."""
+        if self.truncated:
+            return
+        limit = self.budget.max_total_bytes
+        self.size += len(block)
+        if limit is not None and self.size > limit:
+            # Keep the whole lines that fit and stop there
+            block = block[:max(block.rfind('\n', 0, len(block) - (self.size - limit)), 0)]
+            self.counter.analysis['truncated'] = 1
+        
+        text = block if self.feed_whole(block) else self.feed_files(block)
+        # Keywords never span lines, so blocks can be searched independently
+        if self.missing_keywords and text:
+            found = self.matcher.find(text, self.missing_keywords)
+            self.found_keywords |= found
+            self.missing_keywords -= found
+
+    def feed_whole(self, block: str) -> bool:
+        """Feed a block in one pass if no file in it is skipped or goes over budget."""
+        file = self.file
+        if file is not None and (file.skipped or file.samples):
+            return False
+        size, lines = (0, 0) if file is None else (file.size, file.lines)
+        block_lines = block.count('\n') + 1
+        budget = self.budget
+        if budget.exceeded(size + len(block), lines + block_lines):
+            return False
+        if any(budget.skips(file_diff_path(header)) for header in set(DIFF_HEADER.findall(block))):
+            return False
+        self.counter.feed(block.split('\n'))
+        
+        # Only the last file of the block can continue in the next one
+        last = block.rfind('\ndiff --git ') + 1
+        if last or file is None or block.startswith('diff --git '):
+            tail = block[last:]
+            file = self.file = FileDiffAccumulator(budget, file_diff_path(tail), self.counter)
+            size, lines, block_lines = 0, 0, tail.count('\n') + 1
+        file.size = size + len(block) - last
+        file.lines = lines + block_lines
+        return True
+
+    def feed_files(self, block: str) -> str:
+        """Feed a block file by file; return the text that was analyzed."""
+        analyzed = []
+        whole = True
+        start = 0
+        while start < len(block) or self.file is None:
+            end = block.find('\ndiff --git ', start)
+            piece = block[start:] if end == -1 else block[start:end]
+            if self.file is None or piece.startswith('diff --git '):
+                self.end_file()
+                self.file = FileDiffAccumulator(self.budget, file_diff_path(piece), self.counter)
+            part = self.file.feed(piece)
+            whole = whole and part is piece
+            if part:
+                analyzed.append(part)
+            if end == -1:
+                break
+            start = end + 1
+        return block if whole else '\n'.join(analyzed)
+
+    def end_file(self):
+        """Finish the file in progress."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def finish(self) -> Dict[str, int]:
+        """Finish the last file and return the counters."""
+        self.end_file()
+        return self.counter.finish()
+
+
+def files_from_diff(lines: Iterable[str]) -> List[str]:
+    """List the files touched by a unified diff from its 'diff --git' headers."""
+    files = []
+    for line in lines:
+        if line.startswith('diff --git '):
+            if line.endswith('"'):
+                # Paths with special characters are C-quoted: "b/caf\303\251.txt"
+                files.append(unquote_path(line[line.rindex(' "b/') + 1:])[2:])
+            else:
+                # "diff --git a/old b/new": keep the new path
+                files.append(line.rpartition(' b/')[2])
+    return files
+
+
+def changes_from_diff(lines: Iterable[str]) -> List[FileChange]:
+    """The changes of a unified diff with the status its extended headers give.
+    
+    Renames and copies ("similarity index", "rename from", "copy from") and
+    added or deleted files are recognized; git log -p detects renames by
+    default, so history gets the same file categories as git status.
+    """
+    changes = []
+    change = None
+    for line in lines:
+        if line.startswith('diff --git '):
+            change = FileChange('M', files_from_diff([line])[0])
+            changes.append(change)
+        elif change is None:
+            continue
+        elif line.startswith(('rename from ', 'copy from ')):
+            change.status = 'R' if line[0] == 'r' else 'C'
+            change.old_path = unquote_path(line.split(' ', 2)[2])
+        elif line.startswith('similarity index '):
+            change.similarity = int(line[len('similarity index '):].rstrip('%') or 0)
+        elif line.startswith('new file mode'):
+            change.status = 'A'
+        elif line.startswith('deleted file mode'):
+            change.status = 'D'
+    return changes
+
+
+def unquote_path(quoted: str) -> str:
+    """Undo git's C-style quoting of a path, e.g. in diff headers."""
+    if not (len(quoted) >= 2 and quoted[0] == quoted[-1] == '"'):
+        return quoted
+    return codecs.escape_decode(quoted[1:-1].encode('utf-8'))[0].decode('utf-8', 'replace')
+
+
+def file_diff_path(section: str) -> Optional[str]:
+    """Path of the file a per-file diff section belongs to."""
+    paths = files_from_diff([section.partition('\n')[0]])
+    return paths[0] if paths else None
+
+
+def base_name(path: str) -> str:
+    """Last component of a path; git lists untracked repositories as "nested/repo/"."""
+    return path.rstrip('/').rpartition('/')[2]
+
+
+def batched_by_size(sections: Iterable[str], max_size: int) -> Iterator[List[str]]:
+    """Group strings into lists of about ``max_size`` characters each."""
+    batch: List[str] = []
+    size = 0
+    for section in sections:
+        batch.append(section)
+        size += len(section)
+        if size >= max_size:
+            yield batch
+            batch = []
+            size = 0
+    if batch:
+        yield batch
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """Yield lists of up to ``size`` consecutive items."""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def bounded_map(executor: Executor, func, items: Iterable, max_pending: int) -> Iterator:
+    """Like Executor.map, but submits lazily with at most ``max_pending`` tasks in flight."""
+    pending = deque()
+    for item in items:
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+        pending.append(executor.submit(func, item))
+    while pending:
+        yield pending.popleft().result()
+
+
+def analyze_file_diff(matcher: KeywordMatcher, section: str,
+                      budget: Optional[DiffBudget] = None) -> FileDiffResult:
+    """Analyze the diff of a single file: its counters, keywords and symbol index."""
+    accumulator = FileDiffAccumulator(budget or DEFAULT_DIFF_BUDGET, file_diff_path(section))
+    analyzed = accumulator.feed(section)
+    accumulator.close()
+    counter = accumulator.counter
+    hunks = next(iter(counter.symbols.values()), [])
+    return counter.analysis, matcher.find(analyzed) if analyzed else set(), hunks
+
+
+def merge_file_analysis(diff_analysis: Dict[str, int], found_keywords: Set[str],
+                        symbols: Dict[str, List[dict]], path: Optional[str],
+                        result: FileDiffResult):
+    """Add one file's analysis to the totals of a change set."""
+    counts, keywords, hunks = result
+    for key, value in counts.items():
+        diff_analysis[key] += value
+    found_keywords |= keywords
+    if hunks:
+        symbols[path] = hunks
+
+
+class FileDiffSplitter:
+    """Regroup a streamed diff into per-file work, holding no file whole past its budget.
+    
+    A file's blocks are collected while its diff stays within the per-file
+    budget, and it comes out whole, as a section for analyze_file_diff that
+    can go to a worker process. Once a file goes over the budget, what was
+    collected and every later block of it are fed to a FileDiffAccumulator
+    as they arrive, and the file comes out as its finished result instead.
+    Files ``wanted`` rejects are dropped unread. The total budget counts the
+    wanted files only; once it is used up the input is closed, which stops
+    git, and the file cut short is reported as ``partial``.
+    """
+
+    def __init__(self, matcher: KeywordMatcher, budget: Optional[DiffBudget] = None,
+                 wanted: Optional[Callable[[Optional[str]], bool]] = None):
+        self.matcher = matcher
+        self.budget = budget or DEFAULT_DIFF_BUDGET
+        self.wanted = wanted
+        self.size = 0
+        self.truncated = False
+        # Path of the file the total budget cut short, its result is incomplete
+        self.partial: Optional[str] = None
+        # The file in progress: collected pieces while within budget, else
+        # its accumulator; both None for a dropped file
+        self.path: Optional[str] = None
+        self.parts: Optional[List[str]] = None
+        self.file_size = 0
+        self.file_lines = 0
+        self.file: Optional[FileDiffAccumulator] = None
+        self.found_keywords: Set[str] = set()
+        self.missing_keywords: Set[str] = set()
+
+    def split(self, blocks: Iterable[str]) -> Iterator[
+            Union[str, Tuple[Optional[str], FileDiffResult]]]:
+        """Yield each wanted file's diff section, or its result once it went over budget."""
+        limit = self.budget.max_total_bytes
+        started = False
+        for block in blocks:
+            start = 0
+            while True:
+                end = block.find('\ndiff --git ', start)
+                piece = block[start:] if end == -1 else block[start:end]
+                if not started or piece.startswith('diff --git '):
+                    started = True
+                    item = self.end_file()
+                    if item is not None:
+                        yield item
+                    self.start_file(file_diff_path(piece))
+                if self.parts is not None or self.file is not None:
+                    if limit is not None and self.size + len(piece) > limit:
+                        # Keep the whole lines that fit and stop reading
+                        piece = piece[:max(piece.rfind('\n', 0, limit - self.size), 0)]
+                        self.truncated = True
+                    self.size += len(piece)
+                    if not self.truncated:
+                        self.feed(piece)
+                    else:
+                        if piece:
+                            self.feed(piece)
+                        partial = self.file is not None or bool(self.parts)
+                        item = self.end_file()
+                        close = getattr(blocks, 'close', None)
+                        if close is not None:
+                            close()
+                        if partial:
+                            self.partial = self.path
+                            yield item
+                        return
+                if end == -1:
+                    break
+                start = end + 1
+        item = self.end_file()
+        if item is not None:
+            yield item
+
+    def start_file(self, path: Optional[str]):
+        self.path = path
+        self.file = None
+        self.file_size = 0
+        self.file_lines = 0
+        self.parts = [] if self.wanted is None or self.wanted(path) else None
+
+    def feed(self, piece: str):
+        """Collect the next piece of the file, or analyze it once the file is over budget."""
+        if self.file is None:
+            self.file_size += len(piece) + bool(self.parts)
+            self.file_lines += piece.count('\n') + 1
+            self.parts.append(piece)
+            if not self.budget.exceeded(self.file_size, self.file_lines):
+                return
+            piece = '\n'.join(self.parts)
+            self.parts = None
+            self.file = FileDiffAccumulator(self.budget, self.path)
+            self.found_keywords = set()
+            self.missing_keywords = set(self.matcher.types_by_keyword)
+        analyzed = self.file.feed(piece)
+        if analyzed and self.missing_keywords:
+            found = self.matcher.find(analyzed, self.missing_keywords)
+            self.found_keywords |= found
+            self.missing_keywords -= found
+
+    def end_file(self) -> Optional[Union[str, Tuple[Optional[str], FileDiffResult]]]:
+        """Finish the file in progress: its section, its result, or None if it was dropped."""
+        if self.file is not None:
+            self.file.close()
+            counter = self.file.counter
+            hunks = next(iter(counter.symbols.values()), [])
+            item = (self.path, (counter.analysis, self.found_keywords, hunks))
+        elif self.parts is not None:
+            item = '\n'.join(self.parts)
+        else:
+            item = None
+        self.file = None
+        self.parts = None
+        return item
+
+
+class FileChange:
+    """One changed file as reported by git status or git diff --raw."""
+
+    __slots__ = ('status', 'path', 'old_path', 'similarity', 'old_blob', 'new_blob')
+
+    def __init__(self, status: str, path: str, old_path: Optional[str] = None,
+                 similarity: Optional[int] = None, old_blob: Optional[str] = None,
+                 new_blob: Optional[str] = None):
+        # One of git's status letters (M, A, D, R, C, T, U), '?' for untracked
+        self.status = status
+        self.path = path
+        # Source path of a rename or copy, None otherwise
+        self.old_path = old_path
+        self.similarity = similarity
+        # Blob ids, None when git did not report them (untracked files)
+        self.old_blob = old_blob
+        self.new_blob = new_blob
+
+    @property
+    def renamed(self) -> bool:
+        """Whether this is a rename or a copy."""
+        return self.status in RENAME_STATUSES
+
+    def __repr__(self) -> str:
+        if self.old_path is not None:
+            return f"FileChange({self.status!r}, {self.old_path!r} -> {self.path!r})"
+        return f"FileChange({self.status!r}, {self.path!r})"
+
+
+def parse_status(output: str, staged: bool = False) -> List[FileChange]:
+    """Parse `git status --porcelain=v2 -z` into staged or unstaged changes.
+    
+    Unstaged changes include untracked files. Paths come NUL-terminated and
+    unquoted, so spaces, quotes, newlines and arrows in names are kept as is.
+    """
+    changes: List[FileChange] = []
+    fields = iter(output.split('\0'))
+    for field in fields:
+        kind = field[:1]
+        if kind == '?':
+            if not staged:
+                changes.append(FileChange('?', field[2:]))
+            continue
+        if kind not in ('1', '2', 'u'):
+            # Ignored files and headers
+            continue
+        
+        # "1 XY sub mH mI mW hH hI path", "2 XY sub mH mI mW hH hI Xscore path\0origPath"
+        # or "u XY sub m1 m2 m3 mW h1 h2 h3 path"
+        parts = field.split(' ', {'1': 8, '2': 9, 'u': 10}[kind])
+        code = parts[1][0] if staged else parts[1][1]
+        path = parts[-1]
+        old_path = next(fields) if kind == '2' else None
+        if code == '.':
+            continue
+        if kind == 'u':
+            changes.append(FileChange('U', path))
+        elif staged:
+            if code in RENAME_STATUSES:
+                changes.append(FileChange(code, path, old_path, int(parts[8][1:]), parts[6], parts[7]))
+            else:
+                changes.append(FileChange(code, path, old_blob=parts[6], new_blob=parts[7]))
+        else:
+            # The work tree side has no blob id until it is staged; git
+            # reports it as all zeros as well
+            changes.append(FileChange(code, path, old_blob=parts[7], new_blob='0' * len(parts[7])))
+    return changes
+
+
+def parse_raw_diff(output: str) -> Tuple[List[FileChange], Dict[str, Tuple[int, int]]]:
+    """Parse `git diff --raw [--numstat] -z` into changes and ``{path: (added, deleted)}``."""
+    changes: List[FileChange] = []
+    line_counts: Dict[str, Tuple[int, int]] = {}
+    fields = iter(output.split('\0'))
+    for field in fields:
+        if not field:
+            continue
+        if field.startswith(':'):
+            # Raw format: ":old_mode new_mode old_sha new_sha STATUS\0path",
+            # with a second path for renames and copies
+            _, _, old_blob, new_blob, status = field.split()
+            path = next(fields)
+            if status[0] in RENAME_STATUSES:
+                changes.append(FileChange(status[0], next(fields), path, int(status[1:]),
+                                          old_blob, new_blob))
+            else:
+                changes.append(FileChange(status[0], path, old_blob=old_blob, new_blob=new_blob))
+        else:
+            # Numstat format: "added\tdeleted\tpath", or "added\tdeleted\t"
+            # followed by the old and new path for renames and copies
+            added, deleted, path = field.split('\t', 2)
+            if not path:
+                next(fields)
+                path = next(fields)
+            # Binary files report '-' for both counts
+            line_counts[path] = (int(added) if added != '-' else 0,
+                                 int(deleted) if deleted != '-' else 0)
+    return changes, line_counts
+
+
+def find_git_dir(start: Optional[str] = None) -> Optional[Tuple[str, str]]:
+    """Find the work tree and git directory containing ``start`` without running git."""
+    path = os.path.abspath(start or os.getcwd())
+    while True:
+        dot_git = os.path.join(path, '.git')
+        if os.path.isdir(dot_git):
+            return path, dot_git
+        if os.path.isfile(dot_git):
+            # Worktrees and submodules: ".git" is a file with "gitdir: <path>"
+            try:
+                with open(dot_git, encoding='utf-8') as f:
+                    content = f.read().strip()
+            except OSError:
+                return None
+            if content.startswith('gitdir:'):
+                return path, os.path.join(path, content[len('gitdir:'):].strip())
+            return None
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+class AnalysisCache:
+    """Per-file diff analysis results in SQLite, evicted least recently used first.
+
+    Lives under the repository's git directory, so it is shared by every run
+    of the generator (e.g. each pre-commit hook invocation) in that clone.
+    """
+
+    FILE_NAME = 'commit-message-generator.sqlite'
+
+    def __init__(self, path: str, work_tree: str = '.', max_bytes: int = 32 * 1024 * 1024):
+        self.path = path
+        self.work_tree = work_tree
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        import sqlite3
+        # The server hands a repository's cache to one executor thread at a time
+        self.connection = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS file_analysis ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+            'size INTEGER NOT NULL, used INTEGER NOT NULL)'
+        )
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS file_analysis_used ON file_analysis (used)')
+
+    @classmethod
+    def for_repository(cls, start: Optional[str] = None, **kwargs) -> Optional['AnalysisCache']:
+        """Open the cache of the repository containing ``start``, if there is one."""
+        found = find_git_dir(start)
+        if found is None:
+            return None
+        work_tree, git_dir = found
+        import sqlite3
+        try:
+            return cls(os.path.join(git_dir, cls.FILE_NAME), work_tree, **kwargs)
+        except sqlite3.Error:
+            return None
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, FileDiffResult]:
+        """Look up many keys at once and mark the ones found as recently used."""
+        import sqlite3
+        keys = list(keys)
+        found = {}
+        try:
+            for batch in batched(keys, 500):
+                placeholders = ','.join('?' * len(batch))
+                rows = self.connection.execute(
+                    f'SELECT key, value FROM file_analysis WHERE key IN ({placeholders})', batch)
+                for key, value in rows:
+                    counts, keywords, hunks = json.loads(value)
+                    found[key] = (counts, set(keywords), hunks)
+            if found:
+                now = time.time_ns()
+                self.connection.executemany(
+                    'UPDATE file_analysis SET used = ? WHERE key = ?',
+                    [(now, key) for key in found])
+                self.connection.commit()
+        except sqlite3.Error:
+            # A locked or broken cache only costs a full analysis
+            pass
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, entries: Dict[str, FileDiffResult]):
+        """Store analysis results and evict old entries beyond ``max_bytes``."""
+        if not entries:
+            return
+        now = time.time_ns()
+        rows = []
+        for key, (counts, keywords, hunks) in entries.items():
+            value = json.dumps([counts, sorted(keywords), hunks])
+            rows.append((key, value, len(value), now))
+        import sqlite3
+        try:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO file_analysis (key, value, size, used) VALUES (?, ?, ?, ?)',
+                rows)
+            self.evict()
+            self.connection.commit()
+        except sqlite3.Error:
+            pass
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in ``max_bytes``."""
+        total = self.connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM file_analysis').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Make some headroom so that eviction does not run on every write
+        target = total - self.max_bytes * 0.9
+        stale = []
+        for key, size in self.connection.execute(
+                'SELECT key, size FROM file_analysis ORDER BY used'):
+            stale.append((key,))
+            target -= size
+            if target <= 0:
+                break
+        self.connection.executemany('DELETE FROM file_analysis WHERE key = ?', stale)
+
+    def close(self):
+        self.connection.close()
+
+
+class _Stage:
+    """Times one ``with profiler.stage(name):`` block."""
+
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler: 'Profiler', name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record_stage(self.name, time.perf_counter() - self.start)
+
+
+class Profiler:
+    """Record where a run spends its time: git subprocesses vs. analysis stages.
+
+    Hooks registered with add_hook() are called as ``hook(event, data)`` for
+    every 'stage' and 'git' event, e.g. to forward them to telemetry.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.git_commands: List[Dict[str, object]] = []
+        self.counters: Dict[str, int] = {}
+        self.hooks: List[Callable[[str, dict], None]] = []
+
+    def add_hook(self, hook: Callable[[str, dict], None]):
+        self.hooks.append(hook)
+
+    def _emit(self, event: str, data: dict):
+        for hook in self.hooks:
+            hook(event, data)
+
+    def stage(self, name: str) -> _Stage:
+        """Context manager timing an analysis stage."""
+        return _Stage(self, name)
+
+    def record_stage(self, name: str, seconds: float):
+        stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0})
+        stage['calls'] += 1
+        stage['seconds'] += seconds
+        self._emit('stage', {'name': name, 'seconds': seconds})
+
+    def record_git(self, cmd: List[str], seconds: float, received: int):
+        """Record a git subprocess: time spent waiting on it and bytes it wrote."""
+        command = {'cmd': ' '.join(cmd), 'seconds': seconds, 'bytes': received}
+        self.git_commands.append(command)
+        self._emit('git', command)
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def count_lines(self, texts: Iterable[str], unit: Optional[str] = None) -> Iterator[str]:
+        """Pass texts through while counting their lines (and the texts as ``unit``).
+        
+        Closing the returned iterator closes ``texts`` as well, so a consumer
+        can stop a git stream through it.
+        """
+        try:
+            for text in texts:
+                self.count('diff_lines', text.count('\n') + 1)
+                if unit:
+                    self.count(unit)
+                yield text
+        finally:
+            close = getattr(texts, 'close', None)
+            if close is not None:
+                close()
+
+    def report(self) -> dict:
+        """All measurements as a JSON-serializable dict."""
+        return {
+            'git': {
+                'commands': self.git_commands,
+                'seconds': sum(command['seconds'] for command in self.git_commands),
+                'bytes': sum(command['bytes'] for command in self.git_commands),
+            },
+            'stages': self.stages,
+            'counters': self.counters,
+        }
+
+    def format_table(self) -> str:
+        """All measurements as a human readable table."""
+        report = self.report()
+        rows = [f"{'git command':<56} {'time':>10} {'bytes':>12}"]
+        for command in self.git_commands:
+            cmd = command['cmd'] if len(command['cmd']) <= 56 else command['cmd'][:53] + '...'
+            rows.append(f"{cmd:<56} {command['seconds'] * 1000:>8.1f}ms {command['bytes']:>12}")
+        rows.append(f"{'total git':<56} {report['git']['seconds'] * 1000:>8.1f}ms "
+                    f"{report['git']['bytes']:>12}")
+        rows.append('')
+        rows.append(f"{'stage':<56} {'time':>10} {'calls':>12}")
+        for name, stage in sorted(self.stages.items(), key=lambda item: -item[1]['seconds']):
+            rows.append(f"{name:<56} {stage['seconds'] * 1000:>8.1f}ms {stage['calls']:>12}")
+        if self.counters:
+            rows.append('')
+            for name, value in sorted(self.counters.items()):
+                rows.append(f"{name:<56} {value:>23}")
+        return '\n'.join(rows)
+
+
+class NullProfiler(Profiler):
+    """Profiler that records nothing; the default, so profiling costs nothing when off."""
+
+    enabled = False
+
+    def stage(self, name: str) -> _Stage:
+        return _NULL_STAGE
+
+    def record_stage(self, name: str, seconds: float):
+        pass
+
+    def record_git(self, cmd: List[str], seconds: float, received: int):
+        pass
+
+    def count(self, name: str, amount: int = 1):
+        pass
+
+    def count_lines(self, texts: Iterable[str], unit: Optional[str] = None) -> Iterable[str]:
+        return texts
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def profiled(method):
+    """Record each call of a generator method as a profiler stage."""
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not self.profiler.enabled:
+            return method(self, *args, **kwargs)
+        with self.profiler.stage(name):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+# File categories in priority order: when several rules match a file, the
+# lowest code wins. OTHER (0) means no rule matched. Renames and copies are
+# reported by git rather than matched by rules and override the path rules.
+FILE_CATEGORIES = ('other', 'test', 'doc', 'config', 'build', 'source', 'renamed')
+OTHER, TEST, DOC, CONFIG, BUILD, SOURCE, RENAMED = range(len(FILE_CATEGORIES))
+
+DEFAULT_FILE_RULES = {
+    # Substrings of the lowercased path
+    'test_substrings': ['test', 'spec'],
+    'doc_substrings': ['readme'],
+    # Exact file suffixes and base names
+    'suffixes': {
+        '.md': 'doc', '.rst': 'doc', '.txt': 'doc',
+        '.json': 'config', '.yaml': 'config', '.yml': 'config', '.toml': 'config',
+        '.ini': 'config', '.cfg': 'config',
+        '.py': 'source', '.js': 'source', '.ts': 'source', '.java': 'source',
+        '.cpp': 'source', '.c': 'source', '.h': 'source', '.css': 'source', '.html': 'source',
+    },
+    'names': {
+        'Dockerfile': 'build', 'Makefile': 'build', 'package.json': 'build',
+        'requirements.txt': 'build', 'setup.py': 'build',
+        # Lockfiles, whose diffs are skipped, see GENERATED_PATTERNS
+        'package-lock.json': 'build', 'yarn.lock': 'build', 'pnpm-lock.yaml': 'build',
+        'Cargo.lock': 'build', 'Gemfile.lock': 'build', 'composer.lock': 'build',
+        'poetry.lock': 'build', 'Pipfile.lock': 'build', 'uv.lock': 'build', 'go.sum': 'build',
+    },
+}
+
+
+class FileClassification:
+    """Categories of a list of files, one byte per file."""
+
+    __slots__ = ('files', 'categories')
+
+    def __init__(self, files: List[str], categories: array):
+        self.files = files
+        self.categories = categories
+
+    def counts(self) -> Dict[str, int]:
+        """Files per category, in the shape analyze_file_types returns."""
+        tally = [0] * len(FILE_CATEGORIES)
+        for category in self.categories:
+            tally[category] += 1
+        analysis = {f"{FILE_CATEGORIES[code]}_files": tally[code]
+                    for code in (SOURCE, TEST, DOC, CONFIG, BUILD, RENAMED)}
+        analysis['total_files'] = len(self.files)
+        return analysis
+
+    def files_in(self, category: str) -> List[str]:
+        """The files of one category, e.g. ``files_in('test')``."""
+        code = FILE_CATEGORIES.index(category)
+        return [path for path, found in zip(self.files, self.categories) if found == code]
+
+
+class FileClassifier:
+    """Classify file paths with frozen suffix/name lookup tables.
+
+    Uses plain string operations instead of building a ``Path`` per file.
+    ``rules`` (e.g. loaded from a JSON rules file) override the defaults:
+    'suffixes' and 'names' entries are merged in, substring lists replace
+    the default ones.
+    """
+
+    def __init__(self, rules: Optional[dict] = None):
+        rules = rules or {}
+        for category in list(rules.get('suffixes', {}).values()) + list(rules.get('names', {}).values()):
+            if category not in FILE_CATEGORIES[:RENAMED]:
+                raise ValueError(f"Unknown file category in rules: {category}")
+        
+        self.test_substrings = tuple(rules.get('test_substrings', DEFAULT_FILE_RULES['test_substrings']))
+        self.doc_substrings = tuple(rules.get('doc_substrings', DEFAULT_FILE_RULES['doc_substrings']))
+        suffixes = dict(DEFAULT_FILE_RULES['suffixes'], **rules.get('suffixes', {}))
+        names = dict(DEFAULT_FILE_RULES['names'], **rules.get('names', {}))
+        self.suffixes = MappingProxyType(
+            {suffix: FILE_CATEGORIES.index(category) for suffix, category in suffixes.items()})
+        self.names = MappingProxyType(
+            {name: FILE_CATEGORIES.index(category) for name, category in names.items()})
+
+    def category(self, path: str) -> int:
+        """Category code of a single path."""
+        path_lower = path.lower()
+        for substring in self.test_substrings:
+            if substring in path_lower:
+                return TEST
+        
+        name = path[path.rfind('/') + 1:]
+        # Same rule as PurePath.suffix: no suffix for ".bashrc" or "name."
+        dot = name.rfind('.')
+        suffix = name[dot:] if 0 < dot < len(name) - 1 else ''
+        
+        best = self.suffixes.get(suffix, OTHER)
+        by_name = self.names.get(name, OTHER)
+        if by_name and (not best or by_name < best):
+            best = by_name
+        if best != DOC and best != TEST:
+            for substring in self.doc_substrings:
+                if substring in path_lower:
+                    return DOC
+        return best
+
+    def classify(self, files: List[str], renamed: Iterable[str] = ()) -> FileClassification:
+        """Classify ``files``; the ``renamed`` ones go to the renamed category."""
+        category = self.category
+        categories = array('B', [category(path) for path in files])
+        renamed = set(renamed)
+        if renamed:
+            for index, path in enumerate(files):
+                if path in renamed:
+                    categories[index] = RENAMED
+        return FileClassification(files, categories)
+
+
+async def _kill_process(process: asyncio.subprocess.Process):
+    """Kill a git process started by the async collection layer and reap it."""
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+    await process.wait()
+
+
+class DiffAnalysis:
+    """Result of analyzing a change set once, shared by every generator method."""
+
+    __slots__ = ('files', 'file_analysis', 'diff_analysis', 'keyword_scores', 'level', 'symbols',
+                 'classification', 'changes', 'scopes')
+
+    def __init__(self, files: List[str], file_analysis: Dict[str, int],
+                 diff_analysis: Dict[str, int], keyword_scores: Dict[str, int],
+                 level: str = 'patch', symbols: Optional[Dict[str, List[dict]]] = None,
+                 classification: Optional[FileClassification] = None,
+                 changes: Optional[List[FileChange]] = None):
+        self.files = files
+        self.file_analysis = file_analysis
+        self.diff_analysis = diff_analysis
+        self.keyword_scores = keyword_scores
+        # Which of ANALYSIS_LEVELS the diff counters come from
+        self.level = level
+        # Symbols added/removed/modified per hunk, see DiffLineCounter
+        self.symbols = symbols if symbols is not None else {}
+        # Per-file categories, for listing e.g. the changed test files
+        self.classification = classification
+        # Status records of the files, when they came from git status/diff
+        self.changes = changes if changes is not None else []
+        # Changed files per scope, see CommitMessageGenerator.scope_counts
+        self.scopes: Optional[Dict[str, int]] = None
+
+
+def commit_features(analysis: DiffAnalysis) -> Dict[str, float]:
+    """Sparse model features of an analysis: its log-scaled non-zero counters."""
+    features = {}
+    for prefix, values in (('files', analysis.file_analysis), ('diff', analysis.diff_analysis),
+                           ('keywords', analysis.keyword_scores)):
+        for name, value in values.items():
+            if value:
+                features[f"{prefix}:{name}"] = math.log1p(value)
+    return features
+
+
+class CommitTypeModel:
+    """Multinomial naive Bayes over commit_features, stored as a compact binary.
+    
+    Scoring is linear: ``bias[type] + sum(weight[type][feature] * value)``.
+    The file holds a small header, the type and feature names, the number
+    of commits of each type it learned from and the float32 bias and
+    weight tables, so loading is a couple of copies.
+    
+    A model is only trained, and only loaded, with MIN_MODEL_COMMITS
+    commits of at least two types that have MIN_MODEL_TYPE_COMMITS each;
+    a few commits make a model that is confidently wrong.
+    """
+
+    FILE_NAME = 'commit-message-generator.model'
+    MAGIC = b'CMGM'
+    VERSION = 2
+    # magic, version, number of types, number of features, size of the names
+    HEADER = struct.Struct('<4sHHII')
+
+    def __init__(self, types: List[str], features: List[str], bias: array, weights: array,
+                 counts: array):
+        self.types = types
+        self.features = features
+        self.index = {name: i for i, name in enumerate(features)}
+        self.bias = bias
+        # One row of len(features) weights per type
+        self.weights = weights
+        # Commits of each type the model learned from
+        self.counts = counts
+
+    @classmethod
+    def train(cls, samples: Iterable[Tuple[str, Dict[str, float]]],
+              smoothing: float = 1.0) -> 'CommitTypeModel':
+        """Fit the model to (commit type, features) samples.
+        
+        Types with fewer than MIN_MODEL_TYPE_COMMITS samples are left out.
+        Raises ValueError when too few samples remain, see check_counts.
+        """
+        type_counts: Dict[str, int] = {}
+        totals: Dict[str, Dict[str, float]] = {}
+        for commit_type, features in samples:
+            type_counts[commit_type] = type_counts.get(commit_type, 0) + 1
+            total = totals.setdefault(commit_type, {})
+            for name, value in features.items():
+                total[name] = total.get(name, 0.0) + value
+        if not type_counts:
+            raise ValueError("no commits with a conventional commit subject to learn from")
+        
+        types = sorted(commit_type for commit_type, count in type_counts.items()
+                       if count >= MIN_MODEL_TYPE_COMMITS)
+        counts = array('I', [type_counts[commit_type] for commit_type in types])
+        cls.check_counts(types, counts)
+        totals = {commit_type: totals[commit_type] for commit_type in types}
+        features = sorted({name for total in totals.values() for name in total})
+        samples_seen = sum(counts)
+        bias = array('f')
+        weights = array('f')
+        for commit_type in types:
+            total = totals[commit_type]
+            bias.append(math.log((type_counts[commit_type] + smoothing) /
+                                 (samples_seen + smoothing * len(types))))
+            denominator = sum(total.values()) + smoothing * len(features)
+            weights.extend(math.log((total.get(name, 0.0) + smoothing) / denominator)
+                           for name in features)
+        return cls(types, features, bias, weights, counts)
+
+    @staticmethod
+    def check_counts(types: List[str], counts: array):
+        """Raise ValueError unless enough commits of enough types back a model."""
+        usable = [count for count in counts if count >= MIN_MODEL_TYPE_COMMITS]
+        if len(usable) < 2:
+            raise ValueError(f"needs at least {MIN_MODEL_TYPE_COMMITS} commits of each of two "
+                             f"types, has {dict(zip(types, counts))}")
+        if sum(usable) < MIN_MODEL_COMMITS:
+            raise ValueError(f"needs at least {MIN_MODEL_COMMITS} commits, has {sum(usable)}")
+
+    def scores(self, features: Dict[str, float]) -> Dict[str, float]:
+        """Log score of every type for one commit's features."""
+        width = len(self.features)
+        found = [(self.index[name], value) for name, value in features.items() if name in self.index]
+        weights = self.weights
+        scores = {}
+        for row, commit_type in enumerate(self.types):
+            offset = row * width
+            scores[commit_type] = self.bias[row] + sum(weights[offset + i] * value for i, value in found)
+        return scores
+
+    @staticmethod
+    def choose(scores: Dict[str, float]) -> Optional[str]:
+        """The best type of ``scores``, None when it leads by less than MIN_MODEL_MARGIN."""
+        runner_up, best = sorted(scores.values())[-2:]
+        if best - runner_up < MIN_MODEL_MARGIN:
+            return None
+        return max(scores, key=scores.get)
+
+    def predict(self, features: Dict[str, float]) -> Optional[str]:
+        """The type of one commit, None when the model cannot tell it apart."""
+        return self.choose(self.scores(features))
+
+    def to_bytes(self) -> bytes:
+        names = '\0'.join(self.types + self.features).encode('utf-8')
+        bias, weights = array('f', self.bias), array('f', self.weights)
+        counts = array('I', self.counts)
+        if sys.byteorder == 'big':
+            bias.byteswap()
+            weights.byteswap()
+            counts.byteswap()
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, len(self.types), len(self.features), len(names))
+        return header + names + counts.tobytes() + bias.tobytes() + weights.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'CommitTypeModel':
+        magic, version, type_count, feature_count, names_size = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError("not a commit type model, or one of another version")
+        offset = cls.HEADER.size
+        names = data[offset:offset + names_size].decode('utf-8').split('\0')
+        offset += names_size
+        counts = array('I')
+        counts.frombytes(data[offset:offset + counts.itemsize * type_count])
+        offset += counts.itemsize * type_count
+        bias = array('f')
+        bias.frombytes(data[offset:offset + 4 * type_count])
+        offset += 4 * type_count
+        weights = array('f')
+        weights.frombytes(data[offset:offset + 4 * type_count * feature_count])
+        if len(names) != type_count + feature_count or len(weights) != type_count * feature_count:
+            raise ValueError("truncated commit type model")
+        if sys.byteorder == 'big':
+            bias.byteswap()
+            weights.byteswap()
+            counts.byteswap()
+        cls.check_counts(names[:type_count], counts)
+        return cls(names[:type_count], names[type_count:], bias, weights, counts)
+
+    def save(self, path: str):
+        """Write the model atomically, so hooks never read half a file."""
+        import tempfile
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix='.model-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.to_bytes())
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> 'CommitTypeModel':
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+    @classmethod
+    def default_path(cls, start: Optional[str] = None) -> Optional[str]:
+        """Model location inside the repository containing ``start``."""
+        found = find_git_dir(start)
+        return os.path.join(found[1], cls.FILE_NAME) if found else None
+
+    @classmethod
+    def for_repository(cls, start: Optional[str] = None) -> Optional['CommitTypeModel']:
+        """Load the model trained for the repository containing ``start``, if there is one."""
+        path = cls.default_path(start)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            return cls.load(path)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Ignoring model {path}: {e}", file=sys.stderr)
+            return None
+
+
+class ScopeIndex:
+    """Map changed files to conventional commit scopes with a trie of package roots.
+    
+    Every root ("services/billing") is a path of directory names in the
+    trie, so a file's scope, the one of its deepest root, is found in one
+    step per directory. Lookups are memoized per directory: large change
+    sets touch many files in few directories.
+    
+    Roots either come from configuration or are discovered from the
+    SCOPE_MARKERS files in HEAD; discovered roots are cached under the git
+    directory together with the commit they were found in.
+    """
+
+    FILE_NAME = 'commit-message-generator.scopes'
+    VERSION = 1
+
+    def __init__(self, roots: Dict[str, str], marker_paths: Optional[List[str]] = None,
+                 markers: Tuple[str, ...] = SCOPE_MARKERS, commit: Optional[str] = None):
+        # Package root -> scope
+        self.roots = roots
+        # Marker files the roots were discovered from, None for configured roots
+        self.marker_paths = marker_paths
+        self.markers = markers
+        # Commit whose tree holds the marker files
+        self.commit = commit
+        self.trie: Dict[str, dict] = {}
+        for root, scope in roots.items():
+            node = self.trie
+            for name in root.split('/'):
+                node = node.setdefault(name, {})
+            node[''] = scope
+        self.by_directory: Dict[str, Optional[str]] = {}
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Union[str, List[str]]]) -> ScopeIndex:
+        """Scopes from a ``{"scope": "root/dir" or ["root/dir", ...]}`` mapping."""
+        if not isinstance(config, dict):
+            raise ValueError("scopes must be a JSON object mapping scopes to roots")
+        roots = {}
+        for scope, paths in config.items():
+            for root in [paths] if isinstance(paths, str) else paths:
+                if not isinstance(root, str) or not root.strip('/'):
+                    raise ValueError(f"invalid root for scope {scope}: {root!r}")
+                roots[root.strip('/')] = scope
+        return cls(roots)
+
+    @classmethod
+    def discovered(cls, marker_paths: Iterable[str], markers: Tuple[str, ...] = SCOPE_MARKERS,
+                   commit: Optional[str] = None) -> ScopeIndex:
+        """Scopes named after the directories holding marker files.
+        
+        Roots whose directory names clash are named by their whole path.
+        Marker files at the top of the repository mark no scope.
+        """
+        marker_paths = sorted(set(marker_paths))
+        roots = {path.rpartition('/')[0] for path in marker_paths}
+        roots.discard('')
+        names: Dict[str, int] = {}
+        for root in roots:
+            name = root.rpartition('/')[2]
+            names[name] = names.get(name, 0) + 1
+        scopes = {}
+        for root in roots:
+            name = root.rpartition('/')[2]
+            scopes[root] = name if names[name] == 1 else root
+        return cls(scopes, marker_paths, tuple(markers), commit)
+
+    def is_marker(self, path: str) -> bool:
+        return path.rpartition('/')[2] in self.markers
+
+    def with_changes(self, changes: Iterable[FileChange]) -> ScopeIndex:
+        """This index with the marker files added or deleted by uncommitted changes."""
+        if self.marker_paths is None:
+            return self
+        added = set()
+        deleted = set()
+        for change in changes:
+            if change.status == 'D':
+                if self.is_marker(change.path):
+                    deleted.add(change.path)
+                continue
+            if change.status == 'R' and self.is_marker(change.old_path):
+                deleted.add(change.old_path)
+            if self.is_marker(change.path):
+                added.add(change.path)
+        marker_paths = set(self.marker_paths)
+        if added <= marker_paths and not deleted & marker_paths:
+            return self
+        return ScopeIndex.discovered((marker_paths - deleted) | added, self.markers, self.commit)
+
+    def scope(self, path: str) -> Optional[str]:
+        """The scope of a file, None when it is in no package."""
+        directory = path.rpartition('/')[0]
+        try:
+            return self.by_directory[directory]
+        except KeyError:
+            pass
+        scope = None
+        node = self.trie
+        for name in directory.split('/') if directory else ():
+            node = node.get(name)
+            if node is None:
+                break
+            scope = node.get('', scope)
+        self.by_directory[directory] = scope
+        return scope
+
+    def count(self, files: Iterable[str]) -> Dict[str, int]:
+        """Number of files per scope; files in no package are left out."""
+        counts: Dict[str, int] = {}
+        scope_of = self.scope
+        for path in files:
+            scope = scope_of(path)
+            if scope is not None:
+                counts[scope] = counts.get(scope, 0) + 1
+        return counts
+
+    def save(self, path: str):
+        """Write the discovered roots atomically, so hooks never read half a file."""
+        import tempfile
+        data = json.dumps({'version': self.VERSION, 'markers': list(self.markers),
+                           'commit': self.commit, 'marker_paths': self.marker_paths})
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix='.scopes-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> ScopeIndex:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or data.get('version') != cls.VERSION:
+            raise ValueError("not a scope index, or one of another version")
+        return cls.discovered(data['marker_paths'], tuple(data['markers']), data['commit'])
+
+
+# Conventional commit types, in scoring order, and their descriptions
+COMMIT_TYPES = MappingProxyType({
+    'feat': 'A new feature',
+    'fix': 'A bug fix',
+    'docs': 'Documentation only changes',
+    'style': 'Changes that do not affect the meaning of the code',
+    'refactor': 'A code change that neither fixes a bug nor adds a feature',
+    'test': 'Adding missing tests or correcting existing tests',
+    'chore': 'Changes to the build process or auxiliary tools',
+    'perf': 'A code change that improves performance',
+    'ci': 'Changes to CI configuration files and scripts',
+    'build': 'Changes that affect the build system or external dependencies',
+    'revert': 'Reverts a previous commit'
+})
+
+
+class GitError(Exception):
+    """A git command failed, see CommitMessageGenerator.raise_git_errors."""
 
 
 class CommitMessageGenerator:
-    def __init__(self):
-        self.commit_types = {
-            'feat': 'A new feature',
-            'fix': 'A bug fix',
-            'docs': 'Documentation only changes',
-            'style': 'Changes that do not affect the meaning of the code',
-            'refactor': 'A code change that neither fixes a bug nor adds a feature',
-            'test': 'Adding missing tests or correcting existing tests',
-            'chore': 'Changes to the build process or auxiliary tools',
-            'perf': 'A code change that improves performance',
-            'ci': 'Changes to CI configuration files and scripts',
-            'build': 'Changes that affect the build system or external dependencies',
-            'revert': 'Reverts a previous commit'
-        }
+    def __init__(self, keywords: Optional[Dict[str, List[str]]] = None,
+                 word_boundary: bool = False, cache: Optional['AnalysisCache'] = None,
+                 repo: Optional[str] = None, profiler: Optional[Profiler] = None,
+                 file_rules: Optional[dict] = None, budget: Optional[DiffBudget] = None):
+        # Repository the git commands run in; None means the current directory
+        self.repo = repo
+        # Limits on the diff analyzed line by line, see DiffBudget
+        self.budget = budget or DEFAULT_DIFF_BUDGET
+        self.profiler = profiler or NullProfiler()
+        self.file_rules = file_rules
+        self.file_classifier = FileClassifier(file_rules)
+        
+        # Shared by every generator; only interactive mode shows the descriptions
+        self.commit_types = COMMIT_TYPES
         
         # Keywords that indicate different types of changes
         self.keywords = {
@@ -77,146 +2130,799 @@ class CommitMessageGenerator:
                 'setup.py', 'cmake', 'gradle', 'npm', 'pip', 'yarn'
             ]
         }
+        
+        # User supplied keyword lists replace the defaults for their type
+        if keywords:
+            unknown = set(keywords) - set(self.commit_types)
+            if unknown:
+                raise ValueError(f"Unknown commit type(s) in keywords: {', '.join(sorted(unknown))}")
+            self.keywords.update(keywords)
+        
+        self.keyword_matcher = KeywordMatcher(self.keywords, word_boundary)
+        
+        # Per-file analysis cache; cached results are only valid for the
+        # matcher settings they were computed with. With open_cache set, the
+        # repository's cache is opened when a patch is first analyzed, so
+        # runs that never read one never open SQLite.
+        self.cache = cache
+        self.open_cache = False
+        self.keyword_fingerprint = hashlib.blake2b(json.dumps(
+            [ANALYSIS_CACHE_VERSION, self.keyword_matcher.types_by_keyword, word_boundary,
+             self.budget.fingerprint()],
+            sort_keys=True).encode(), digest_size=8).hexdigest()
+        
+        # Diffs smaller than this are analyzed without a process pool;
+        # workers=None means one worker per CPU
+        self.parallel_threshold = PARALLEL_THRESHOLD
+        self.workers: Optional[int] = None
+        
+        # Lead a commit type needs over the runner-up before the tiered
+        # analysis trusts file names alone and skips reading the patch
+        self.ambiguity_margin = 3
+        
+        # Seconds a single git command may take; None waits forever
+        self.git_timeout: Optional[float] = None
+        
+        # Learned commit type model replacing the hand-tuned weights, see --train
+        self.model: Optional[CommitTypeModel] = None
+        
+        # Package roots that give messages a conventional commit scope, see
+        # load_scope_index; None leaves the scope out
+        self.scope_index: Optional[ScopeIndex] = None
+        
+        # Raise GitError from failed git commands instead of printing them,
+        # for callers that handle many repositories, see run_fleet_mode
+        self.raise_git_errors = False
+        # Number of failed git commands reported on stderr
+        self.git_errors = 0
 
-    def run_git_command(self, cmd: List[str]) -> str:
+    def git_error(self, message: str):
+        """Report a failed git command; the command's output is then empty."""
+        if self.raise_git_errors:
+            raise GitError(message)
+        self.git_errors += 1
+        print(message, file=sys.stderr)
+
+    def run_git_command(self, cmd: List[str], strip: bool = True) -> str:
         """Run a git command and return the output."""
+        start = time.perf_counter()
         try:
             result = subprocess.run(
                 cmd, 
                 capture_output=True, 
-                text=True, 
                 check=True,
-                cwd=Path.cwd()
+                cwd=self.repo,
+                timeout=self.git_timeout
             )
-            return result.stdout.strip()
+            self.profiler.record_git(cmd, time.perf_counter() - start, len(result.stdout))
+            output = result.stdout.decode('utf-8', 'replace')
+            return output.strip() if strip else output
         except subprocess.CalledProcessError as e:
-            print(f"Error running git command: {e}")
+            self.git_error(f"Error running git command: {e}")
+            return ""
+        except subprocess.TimeoutExpired:
+            self.git_error(f"Git command timed out after {self.git_timeout}s: {' '.join(cmd)}")
             return ""
         except FileNotFoundError:
-            print("Git is not installed or not in PATH")
+            self.git_error("Git is not installed or not in PATH")
             return ""
 
-    def get_git_diff(self, staged: bool = False) -> str:
-        """Get git diff output."""
+    def try_git_command(self, cmd: List[str]) -> Optional[str]:
+        """Run a git command that may fail, e.g. on an unborn branch; None if it does."""
+        start = time.perf_counter()
+        try:
+            result = subprocess.run(cmd, capture_output=True, cwd=self.repo, timeout=self.git_timeout)
+        except (subprocess.TimeoutExpired, FileNotFoundError):
+            return None
+        self.profiler.record_git(cmd, time.perf_counter() - start, len(result.stdout))
+        if result.returncode:
+            return None
+        return result.stdout.decode('utf-8', 'replace')
+
+    def stream_git_command(self, cmd: List[str],
+                           chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[str]:
+        """Run a git command and yield its output in blocks of whole lines."""
+        # Only time spent waiting on git counts as git time, not the time the
+        # consumer spends analyzing each block
+        start = time.perf_counter()
+        try:
+            process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                cwd=self.repo
+            )
+        except FileNotFoundError:
+            self.git_error("Git is not installed or not in PATH")
+            return
+        waited = time.perf_counter() - start
+        
+        # Past the timeout git is killed, which ends the output early
+        timer = None
+        if self.git_timeout is not None:
+            deadline = time.monotonic() + self.git_timeout
+            timer = threading.Timer(self.git_timeout, process.kill)
+            timer.daemon = True
+            timer.start()
+        
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        received = 0
+        try:
+            carry = ''
+            while True:
+                start = time.perf_counter()
+                chunk = process.stdout.read(chunk_size)
+                waited += time.perf_counter() - start
+                if not chunk:
+                    break
+                received += len(chunk)
+                data = carry + decoder.decode(chunk)
+                cut = data.rfind('\n')
+                if cut == -1:
+                    carry = data
+                    continue
+                carry = data[cut + 1:]
+                yield data[:cut]
+            carry += decoder.decode(b'', True)
+            if carry:
+                yield carry
+        except BaseException:
+            # The consumer stopped early: don't leave git blocked on the pipe
+            process.kill()
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+            process.stdout.close()
+            start = time.perf_counter()
+            process.wait()
+            self.profiler.record_git(cmd, waited + time.perf_counter() - start, received)
+        
+        if (timer is not None and process.returncode == -signal.SIGKILL
+                and time.monotonic() >= deadline):
+            self.git_error(f"Git command timed out after {self.git_timeout}s: {' '.join(cmd)}")
+        elif process.returncode:
+            error = subprocess.CalledProcessError(process.returncode, cmd)
+            self.git_error(f"Error running git command: {error}")
+
+    async def run_git_command_async(self, cmd: List[str], strip: bool = True,
+                                    timeout: Optional[float] = None) -> str:
+        """Run a git command without blocking the event loop and return the output.
+        
+        The process is killed when it runs longer than ``timeout`` seconds
+        (default ``self.git_timeout``) or when the awaiting task is cancelled.
+        """
+        import asyncio
+        timeout = self.git_timeout if timeout is None else timeout
+        start = time.perf_counter()
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=self.repo
+            )
+        except FileNotFoundError:
+            self.git_error("Git is not installed or not in PATH")
+            return ""
+        
+        try:
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            await _kill_process(process)
+            self.git_error(f"Git command timed out after {timeout}s: {' '.join(cmd)}")
+            return ""
+        except asyncio.CancelledError:
+            await _kill_process(process)
+            raise
+        
+        self.profiler.record_git(cmd, time.perf_counter() - start, len(stdout))
+        if process.returncode:
+            error = subprocess.CalledProcessError(process.returncode, cmd)
+            self.git_error(f"Error running git command: {error}")
+            return ""
+        output = stdout.decode('utf-8', 'replace')
+        return output.strip() if strip else output
+
+    async def stream_git_command_async(self, cmd: List[str], chunk_size: int = STREAM_CHUNK_SIZE,
+                                       timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Async counterpart of stream_git_command, killing git on timeout or cancellation."""
+        import asyncio
+        timeout = self.git_timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        start = time.perf_counter()
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+                cwd=self.repo
+            )
+        except FileNotFoundError:
+            self.git_error("Git is not installed or not in PATH")
+            return
+        waited = time.perf_counter() - start
+        
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        received = 0
+        try:
+            carry = ''
+            while True:
+                start = time.perf_counter()
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                chunk = await asyncio.wait_for(process.stdout.read(chunk_size), remaining)
+                waited += time.perf_counter() - start
+                if not chunk:
+                    break
+                received += len(chunk)
+                data = carry + decoder.decode(chunk)
+                cut = data.rfind('\n')
+                if cut == -1:
+                    carry = data
+                    continue
+                carry = data[cut + 1:]
+                yield data[:cut]
+            carry += decoder.decode(b'', True)
+            if carry:
+                yield carry
+        except asyncio.TimeoutError:
+            await _kill_process(process)
+            self.git_error(f"Git command timed out after {timeout}s: {' '.join(cmd)}")
+            return
+        except BaseException:
+            await _kill_process(process)
+            raise
+        
+        start = time.perf_counter()
+        await process.wait()
+        self.profiler.record_git(cmd, waited + time.perf_counter() - start, received)
+        if process.returncode:
+            error = subprocess.CalledProcessError(process.returncode, cmd)
+            self.git_error(f"Error running git command: {error}")
+
+    def run_git_commands(self, cmds: List[List[str]], strip: bool = True) -> List[str]:
+        """Run independent git commands concurrently; outputs come back in order.
+        
+        Every command is started before any output is read. Plain processes
+        instead of run_git_command_async keep asyncio out of hook runs.
+        """
+        start = time.perf_counter()
+        deadline = None if self.git_timeout is None else time.monotonic() + self.git_timeout
+        processes = []
+        try:
+            for cmd in cmds:
+                try:
+                    processes.append(subprocess.Popen(
+                        cmd,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.DEVNULL,
+                        cwd=self.repo
+                    ))
+                except FileNotFoundError:
+                    self.git_error("Git is not installed or not in PATH")
+                    processes.append(None)
+            
+            outputs = []
+            for cmd, process in zip(cmds, processes):
+                if process is None:
+                    outputs.append("")
+                    continue
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    stdout, _ = process.communicate(timeout=remaining)
+                except subprocess.TimeoutExpired:
+                    # Commands that finished while an earlier one ran keep their output
+                    process.kill()
+                    stdout, _ = process.communicate()
+                    if process.returncode == -signal.SIGKILL:
+                        self.git_error(f"Git command timed out after {self.git_timeout}s: {' '.join(cmd)}")
+                        outputs.append("")
+                        continue
+                self.profiler.record_git(cmd, time.perf_counter() - start, len(stdout))
+                if process.returncode:
+                    error = subprocess.CalledProcessError(process.returncode, cmd)
+                    self.git_error(f"Error running git command: {error}")
+                    outputs.append("")
+                    continue
+                output = stdout.decode('utf-8', 'replace')
+                outputs.append(output.strip() if strip else output)
+            return outputs
+        finally:
+            # Only still running when a failure was raised
+            for process in processes:
+                if process is not None and process.returncode is None:
+                    process.kill()
+                    process.communicate()
+
+    def stream_git_diff(self, staged: bool = False) -> Iterator[str]:
+        """Stream git diff output in blocks of whole lines."""
         if staged:
-            return self.run_git_command(['git', 'diff', '--staged'])
+            return self.stream_git_command(['git', 'diff', '--staged'])
         else:
-            return self.run_git_command(['git', 'diff'])
+            return self.stream_git_command(['git', 'diff'])
+
+    def get_git_diff(self, staged: bool = False) -> str:
+        """Get git diff output."""
+        return '\n'.join(self.stream_git_diff(staged)).strip()
 
     def get_git_status(self) -> str:
         """Get git status output."""
-        return self.run_git_command(['git', 'status', '--porcelain'])
+        return self.run_git_command(STATUS_COMMAND, strip=False)
+
+    def enable_profiling(self, hook: Optional[Callable[[str, dict], None]] = None) -> Profiler:
+        """Start recording timings; ``hook(event, data)`` sees every measurement."""
+        if not self.profiler.enabled:
+            self.profiler = Profiler()
+        if hook is not None:
+            self.profiler.add_hook(hook)
+        return self.profiler
+
+    def for_repository(self, work_tree: str, use_cache: bool = True,
+                       infer_scopes: bool = True) -> CommitMessageGenerator:
+        """A generator with these settings for another repository.
+        
+        It gets that repository's cache, its model unless this generator has
+        one (e.g. from --model), and its scopes unless this generator's are
+        configured. Failed git commands raise GitError.
+        """
+        generator = CommitMessageGenerator(
+            self.keywords, self.keyword_matcher.word_boundary, repo=work_tree,
+            file_rules=self.file_rules, budget=self.budget)
+        generator.open_cache = use_cache
+        generator.git_timeout = self.git_timeout
+        generator.raise_git_errors = True
+        generator.model = self.model if self.model is not None else CommitTypeModel.for_repository(work_tree)
+        if self.scope_index is not None and self.scope_index.marker_paths is None:
+            generator.scope_index = self.scope_index
+        elif infer_scopes:
+            generator.scope_index = generator.load_scope_index()
+        return generator
+
+    @profiled
+    def get_changes(self, staged: bool = False) -> List[FileChange]:
+        """Get the staged or unstaged changes, renames included, from git status."""
+        return parse_status(self.get_git_status(), staged)
 
     def get_changed_files(self, staged: bool = False) -> List[str]:
         """Get list of changed files."""
-        status = self.get_git_status()
-        if not status:
-            return []
+        return [change.path for change in self.get_changes(staged)]
+
+    @profiled
+    def get_file_changes(self, staged: bool = False, numstat: bool = True) -> Tuple[
+            List[FileChange], Optional[Dict[str, Tuple[int, int]]]]:
+        """Get changed files with their blob ids, and line counts if ``numstat``.
         
-        files = []
-        for line in status.split('\n'):
-            if line.strip():
-                # Git status format: XY filename
-                status_code = line[:2]
-                filename = line[3:].strip()
-                
-                if staged:
-                    # For staged changes, look at the first character
-                    if status_code[0] != ' ' and status_code[0] != '?':
-                        files.append(filename)
-                else:
-                    # For unstaged changes, look at the second character
-                    if status_code[1] != ' ' and status_code[1] != '?':
-                        files.append(filename)
-                    # Also include untracked files
-                    elif status_code == '??':
-                        files.append(filename)
+        Without line counts a single `git status` call is enough; otherwise
+        `git diff --raw --numstat` reports both, plus `git ls-files` for the
+        untracked files when looking at unstaged changes, run concurrently.
+        """
+        if not numstat:
+            return self.get_changes(staged), None
         
-        return files
+        cmd = ['git', 'diff', '--raw', '--numstat', '--no-abbrev', '-z']
+        if staged:
+            cmd.insert(2, '--staged')
+            return parse_raw_diff(self.run_git_command(cmd, strip=False))
+        
+        # git diff leaves out untracked files; list them at the same time
+        diff, untracked = self.run_git_commands(
+            [cmd, ['git', 'ls-files', '--others', '--exclude-standard', '-z']], strip=False)
+        changes, line_counts = parse_raw_diff(diff)
+        changes.extend(FileChange('?', path) for path in untracked.split('\0') if path)
+        return changes, line_counts
+
+    def load_scope_index(self, markers: Tuple[str, ...] = SCOPE_MARKERS) -> Optional[ScopeIndex]:
+        """Discover the package roots of the repository, cached under its git directory.
+        
+        The cache holds the marker files of one commit. When HEAD has moved
+        since, only the marker files added or deleted in between are read
+        (a tree diff, cheap for nearby commits); the whole tree is listed
+        only when there is no usable cache. None outside a repository.
+        """
+        found = find_git_dir(self.repo)
+        if found is None:
+            return None
+        head = self.try_git_command(['git', 'rev-parse', '--verify', '-q', 'HEAD'])
+        if head is None:
+            # No commits yet: only the change set can add packages
+            return ScopeIndex.discovered((), markers)
+        head = head.strip()
+        path = os.path.join(found[1], ScopeIndex.FILE_NAME)
+        try:
+            index = ScopeIndex.load(path)
+        except (OSError, ValueError, KeyError, TypeError):
+            index = None
+        if index is not None and index.markers == markers:
+            if index.commit == head:
+                return index
+            index = self.update_scope_index(index, head)
+        else:
+            index = None
+        
+        if index is None:
+            listing = self.try_git_command(['git', 'ls-tree', '-r', '-z', '--name-only', head])
+            if listing is None:
+                return ScopeIndex.discovered((), markers)
+            index = ScopeIndex.discovered(
+                (name for name in listing.split('\0') if name.rpartition('/')[2] in markers),
+                markers, head)
+        try:
+            index.save(path)
+        except OSError:
+            # A read-only git directory only costs rebuilding the index next time
+            pass
+        return index
+
+    def update_scope_index(self, index: ScopeIndex, head: str) -> Optional[ScopeIndex]:
+        """Move a discovered ScopeIndex to ``head``; None when the diff fails."""
+        pathspecs = [f":(glob)**/{marker}" for marker in index.markers]
+        output = self.try_git_command(['git', 'diff', '--name-status', '--no-renames', '-z',
+                                       index.commit, head, '--'] + pathspecs)
+        if output is None:
+            return None
+        marker_paths = set(index.marker_paths)
+        fields = output.split('\0')
+        for status, name in zip(fields[0::2], fields[1::2]):
+            if status == 'D':
+                marker_paths.discard(name)
+            else:
+                marker_paths.add(name)
+        return ScopeIndex.discovered(marker_paths, index.markers, head)
 
+    @profiled
     def analyze_file_types(self, files: List[str]) -> Dict[str, int]:
         """Analyze file types and extensions."""
-        analysis = {
-            'source_files': 0,
-            'test_files': 0,
-            'doc_files': 0,
-            'config_files': 0,
-            'build_files': 0,
-            'total_files': len(files)
-        }
+        return self.classify_files(files).counts()
+
+    @profiled
+    def classify_files(self, files: List[str],
+                       changes: Optional[List[FileChange]] = None) -> FileClassification:
+        """Assign every file a category, see FileClassifier."""
+        self.profiler.count('files_classified', len(files))
+        renamed = [change.path for change in changes if change.renamed] if changes else ()
+        return self.file_classifier.classify(files, renamed)
+
+    @profiled
+    def analyze_diff_content(self, diff: str) -> Dict[str, int]:
+        """Analyze the content of the diff."""
+        counter = DiffLineCounter()
+        counter.feed(diff.split('\n'))
+        return counter.finish()
+
+    @profiled
+    def score_keywords(self, files: List[str], diff: str) -> Dict[str, int]:
+        """Score each commit type by the keywords found in file names and diff."""
+        matcher = self.keyword_matcher
+        found = matcher.find(' '.join(files))
+        # Only look for the keywords the file names did not already contain
+        found |= matcher.find(diff, set(matcher.types_by_keyword) - found)
+        return matcher.score(found, self.commit_types)
+
+    def count_keywords(self, files: List[str], diff: str) -> Dict[str, int]:
+        """Count the hits of every keyword in file names and diff."""
+        counts = self.keyword_matcher.count(' '.join(files))
+        for keyword, hits in self.keyword_matcher.count(diff).items():
+            counts[keyword] += hits
+        return counts
+
+    @profiled
+    def analyze(self, files: List[str], diff: str,
+                changes: Optional[List[FileChange]] = None) -> DiffAnalysis:
+        """Analyze the changed files and diff once for all message generators.
+        
+        The diff is read in a single pass, block by block: each block's lines
+        are counted and the block is searched for the keywords still missing
+        while it is at hand.
+        """
+        budget = self.budget
+        line_count = diff.count('\n') + 1
+        self.profiler.count('diff_lines', line_count)
+        # A diff within the budget of a single file can neither be sampled nor
+        # truncated, so unless a file is skipped one counter does it all
+        if budget.exceeded(len(diff), line_count) or any(budget.skips(path) for path in files):
+            analyzer = DiffStreamAnalyzer(self.keyword_matcher, budget)
+            analyzer.feed(diff)
+            return self.finish_stream(files, analyzer, changes)
+        
+        counter = DiffLineCounter()
+        matcher = self.keyword_matcher
+        found = matcher.find(' '.join(files))
+        missing = set(matcher.types_by_keyword) - found
+        for block in line_blocks(diff, KEYWORD_BLOCK_CHARS):
+            counter.feed(block.split('\n'))
+            if missing:
+                hits = matcher.find(block, missing)
+                found |= hits
+                missing -= hits
+        classification = self.classify_files(files, changes)
+        return DiffAnalysis(
+            files,
+            classification.counts(),
+            counter.finish(),
+            matcher.score(found, self.commit_types),
+            symbols=counter.symbols,
+            classification=classification,
+            changes=changes
+        )
+
+    @profiled
+    def analyze_stream(self, files: List[str], blocks: Iterable[str],
+                       changes: Optional[List[FileChange]] = None) -> DiffAnalysis:
+        """Analyze a diff that arrives in blocks of whole lines, e.g. from git."""
+        analyzer = DiffStreamAnalyzer(self.keyword_matcher, self.budget)
+        for block in self.profiler.count_lines(blocks):
+            analyzer.feed(block)
+            if analyzer.truncated:
+                # Closing the stream stops git
+                break
+        return self.finish_stream(files, analyzer, changes)
+
+    async def analyze_worktree_async(self, staged: bool = False) -> DiffAnalysis:
+        """Analyze the current changes, reading git status while the diff streams in.
+        
+        Status and diff are independent, so on slow file systems the status
+        call costs no extra wall time. Cancelling the task kills both.
+        """
+        import asyncio
+        status = asyncio.ensure_future(self.run_git_command_async(STATUS_COMMAND, strip=False))
+        try:
+            analyzer = DiffStreamAnalyzer(self.keyword_matcher, self.budget)
+            cmd = ['git', 'diff', '--staged'] if staged else ['git', 'diff']
+            blocks = self.stream_git_command_async(cmd)
+            async for block in blocks:
+                self.profiler.count('diff_lines', block.count('\n') + 1)
+                analyzer.feed(block)
+                if analyzer.truncated:
+                    await blocks.aclose()
+                    break
+            changes = parse_status(await status, staged)
+        finally:
+            # Only still running when the diff failed or was cancelled
+            status.cancel()
+        return self.finish_stream([change.path for change in changes], analyzer, changes)
+
+    def analyze_worktree(self, staged: bool = False) -> DiffAnalysis:
+        """Blocking wrapper around analyze_worktree_async."""
+        import asyncio
+        return asyncio.run(self.analyze_worktree_async(staged))
+
+    def finish_stream(self, files: List[str], analyzer: DiffStreamAnalyzer,
+                      changes: Optional[List[FileChange]] = None) -> DiffAnalysis:
+        """Build the analysis of a fully fed DiffStreamAnalyzer."""
+        matcher = self.keyword_matcher
+        found = analyzer.found_keywords | matcher.find(' '.join(files))
+        classification = self.classify_files(files, changes)
+        return DiffAnalysis(
+            files,
+            classification.counts(),
+            analyzer.finish(),
+            matcher.score(found, self.commit_types),
+            symbols=analyzer.counter.symbols,
+            classification=classification,
+            changes=changes
+        )
+
+    @profiled
+    def analyze_file_list(self, files: List[str],
+                          line_counts: Optional[Dict[str, Tuple[int, int]]] = None,
+                          changes: Optional[List[FileChange]] = None) -> DiffAnalysis:
+        """Analyze a change set from its file names and line counts only."""
+        diff_analysis = empty_diff_analysis()
+        if line_counts is not None:
+            for added, deleted in line_counts.values():
+                diff_analysis['additions'] += added
+                diff_analysis['deletions'] += deleted
         
-        for file in files:
-            file_lower = file.lower()
-            path = Path(file)
+        matcher = self.keyword_matcher
+        classification = self.classify_files(files, changes)
+        return DiffAnalysis(
+            files,
+            classification.counts(),
+            diff_analysis,
+            matcher.score(matcher.find(' '.join(files)), self.commit_types),
+            level='name-status' if line_counts is None else 'numstat',
+            classification=classification,
+            changes=changes
+        )
+
+    def analyze_changes(self, staged: bool = False, level: str = 'auto') -> DiffAnalysis:
+        """Analyze the current changes, reading no more from git than needed.
+        
+        ``level`` is one of ANALYSIS_LEVELS, or 'auto' to classify from the
+        numstat summary and only stream the full patch when that is ambiguous.
+        A learned model is trained on full patches, so with one 'auto' always
+        reads the patch.
+        """
+        if level == 'auto' and self.model is not None:
+            level = 'patch'
+        changes, line_counts = self.get_file_changes(staged, numstat=level != 'name-status')
+        if not changes:
+            # Reported at the level that ran: name-status, or numstat
+            return self.analyze_file_list([], line_counts, [])
+        
+        if level != 'patch':
+            files = [change.path for change in changes]
+            analysis = self.analyze_file_list(files, line_counts, changes)
+            if level != 'auto' or not self.is_ambiguous(self.score_commit_types(analysis)):
+                return analysis
+        
+        return self.analyze_patch(changes, staged)
+
+    @profiled
+    def analyze_patch(self, changes: List[FileChange], staged: bool = False) -> DiffAnalysis:
+        """Analyze the patch file by file, only reading files missing from the cache."""
+        files = [change.path for change in changes]
+        # Untracked files have no blobs and no diff
+        blobs = {change.path: (change.old_blob, change.new_blob, change.old_path or change.path)
+                 for change in changes if change.old_blob is not None}
+        # Generated files are only classified by name, their diff is never read
+        skipped = {path for path in blobs if self.budget.skips(path)}
+        keys: Dict[str, str] = {}
+        cached: Dict[str, FileDiffResult] = {}
+        if self.cache is None and self.open_cache:
+            self.open_cache = False
+            self.cache = AnalysisCache.for_repository(self.repo)
+        if self.cache is not None:
+            keys = {path: self.cache_key(path, blob, staged)
+                    for path, blob in blobs.items() if path not in skipped}
+            cached = self.cache.get_many(keys.values())
+        
+        diff_analysis = empty_diff_analysis()
+        found_keywords = self.keyword_matcher.find(' '.join(files))
+        symbols: Dict[str, List[dict]] = {}
+        for path, key in keys.items():
+            if key in cached:
+                merge_file_analysis(diff_analysis, found_keywords, symbols, path, cached[key])
+        diff_analysis['skipped_files'] = len(skipped)
+        missing = [path for path in blobs if path not in skipped and keys.get(path) not in cached]
+        
+        if missing:
+            cmd = ['git', '--literal-pathspecs', 'diff']
+            if staged:
+                cmd.append('--staged')
+            pathspecs = {spec for path in missing for spec in (path, blobs[path][2])}
+            if len(missing) < len(blobs) and len(pathspecs) <= MAX_PATHSPECS:
+                cmd += ['--'] + sorted(pathspecs)
             
-            # Test files
-            if 'test' in file_lower or 'spec' in file_lower or file_lower.endswith('.test.py'):
-                analysis['test_files'] += 1
-            # Documentation files
-            elif path.suffix in ['.md', '.rst', '.txt'] or 'readme' in file_lower:
-                analysis['doc_files'] += 1
-            # Configuration files
-            elif path.suffix in ['.json', '.yaml', '.yml', '.toml', '.ini', '.cfg']:
-                analysis['config_files'] += 1
-            # Build files
-            elif path.name in ['Dockerfile', 'Makefile', 'package.json', 'requirements.txt', 'setup.py']:
-                analysis['build_files'] += 1
-            # Source files
-            elif path.suffix in ['.py', '.js', '.ts', '.java', '.cpp', '.c', '.h', '.css', '.html']:
-                analysis['source_files'] += 1
+            # Skipped files and files already merged from the cache are dropped
+            # unread; the splitter stops git once the total budget is used up
+            splitter = FileDiffSplitter(
+                self.keyword_matcher, self.budget,
+                lambda path: path not in skipped and keys.get(path) not in cached)
+            items = splitter.split(self.profiler.count_lines(self.stream_git_command(cmd)))
+            fresh = {}
+            for path, result in self.analyze_file_diffs(items):
+                self.profiler.count('diff_files')
+                merge_file_analysis(diff_analysis, found_keywords, symbols, path, result)
+                # A file the total budget cut short is not cached
+                if path in keys and not (splitter.truncated and path == splitter.partial):
+                    fresh[keys[path]] = result
+            if splitter.truncated:
+                diff_analysis['truncated'] = 1
+            if self.cache is not None:
+                self.cache.put_many(fresh)
         
-        return analysis
+        classification = self.classify_files(files, changes)
+        return DiffAnalysis(
+            files,
+            classification.counts(),
+            diff_analysis,
+            self.keyword_matcher.score(found_keywords, self.commit_types),
+            symbols=symbols,
+            classification=classification,
+            changes=changes
+        )
 
-    def analyze_diff_content(self, diff: str) -> Dict[str, int]:
-        """Analyze the content of the diff."""
-        analysis = {
-            'additions': 0,
-            'deletions': 0,
-            'function_additions': 0,
-            'class_additions': 0,
-            'import_changes': 0,
-            'comment_changes': 0,
-            'test_changes': 0
-        }
+    def analyze_file_diffs(self, items: Iterable[Union[str, Tuple[Optional[str], FileDiffResult]]]
+                           ) -> Iterator[Tuple[Optional[str], FileDiffResult]]:
+        """Analyze per-file diffs, spreading them over processes for large diffs.
         
-        lines = diff.split('\n')
-        for line in lines:
-            if line.startswith('+') and not line.startswith('+++'):
-                analysis['additions'] += 1
-                line_content = line[1:].strip().lower()
-                
-                # Check for function definitions
-                if line_content.startswith('def ') or 'function' in line_content:
-                    analysis['function_additions'] += 1
-                
-                # Check for class definitions
-                if line_content.startswith('class '):
-                    analysis['class_additions'] += 1
-                
-                # Check for imports
-                if line_content.startswith('import ') or line_content.startswith('from '):
-                    analysis['import_changes'] += 1
-                
-                # Check for comments
-                if line_content.startswith('#') or line_content.startswith('//') or line_content.startswith('/*'):
-                    analysis['comment_changes'] += 1
-                
-                # Check for test-related content
-                if 'test' in line_content or 'assert' in line_content:
-                    analysis['test_changes'] += 1
-                    
-            elif line.startswith('-') and not line.startswith('---'):
-                analysis['deletions'] += 1
+        ``items`` come from FileDiffSplitter.split: sections are analyzed,
+        results of files already analyzed while streaming pass through.
+        Sections are analyzed in-process until ``parallel_threshold`` bytes
+        have been seen, so small diffs never pay for starting a pool.
+        """
+        done: List[Tuple[Optional[str], FileDiffResult]] = []
         
-        return analysis
+        def sections_of(items):
+            for item in items:
+                if isinstance(item, str):
+                    yield item
+                else:
+                    done.append(item)
+        
+        sections = sections_of(items)
+        buffered = []
+        size = 0
+        for section in sections:
+            buffered.append(section)
+            size += len(section)
+            if size >= self.parallel_threshold:
+                break
+        else:
+            yield from done
+            for section in buffered:
+                yield file_diff_path(section), analyze_file_diff(self.keyword_matcher, section,
+                                                                 self.budget)
+            return
+        
+        from concurrent.futures import ProcessPoolExecutor
+        workers = self.workers or os.cpu_count() or 1
+        tasks = batched_by_size(chain(buffered, sections), PARALLEL_BATCH_BYTES)
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(self.keywords, self.keyword_matcher.word_boundary,
+                                           self.file_rules, None, self.budget)) as executor:
+            for results in bounded_map(executor, _analyze_file_batch, tasks, workers * 2):
+                yield from results
+                yield from done
+                done.clear()
+        yield from done
 
-    def determine_commit_type(self, files: List[str], diff: str) -> str:
-        """Determine the most appropriate commit type."""
-        if not files:
-            return 'chore'
+    def cache_key(self, path: str, blob: Tuple[str, str, str], staged: bool) -> str:
+        """Key of one file's analysis: its blobs, its path and the matcher settings."""
+        old_blob, new_blob, old_path = blob
+        if not staged and set(new_blob) == {'0'}:
+            # Unstaged work tree files have no blob id yet, use their stat data
+            try:
+                stat = os.stat(os.path.join(self.cache.work_tree, path))
+                new_blob = f"{stat.st_mtime_ns}:{stat.st_size}"
+            except OSError:
+                new_blob = 'missing'
+        raw = '\0'.join((self.keyword_fingerprint, old_path, path, old_blob, new_blob))
+        return hashlib.blake2b(raw.encode('utf-8', 'surrogateescape'), digest_size=16).hexdigest()
+
+    def suggest_message(self, staged: bool = False, level: str = 'auto',
+                        detailed: bool = False) -> Optional[str]:
+        """Suggest a message for the current changes, or None if there are none."""
+        analysis = self.analyze_changes(staged, level)
+        if not analysis.files:
+            return None
+        if detailed:
+            return self.generate_detailed_message(analysis.files, analysis=analysis)
+        return self.generate_commit_message(analysis.files, analysis=analysis)
+
+    def report(self, analysis: DiffAnalysis) -> dict:
+        """Everything known about a change set, as a JSON-serializable dict.
         
-        file_analysis = self.analyze_file_types(files)
-        diff_analysis = self.analyze_diff_content(diff)
+        Keys: ``version`` (REPORT_VERSION), ``type``, ``message`` (the
+        subject line), ``detailed_message``, ``scores`` (per commit type; log
+        probabilities when a learned model decides, hand-tuned scores when
+        there is none or it is unsure), ``scope`` (see
+        commit_scope), ``scopes`` (changed files per scope), ``files``,
+        ``level``, ``file_analysis`` and ``diff_analysis``. Type, scope and
+        messages are None when nothing changed.
+        """
+        files = analysis.files
+        scores = None
+        if self.model is not None:
+            scores = self.model.scores(commit_features(analysis))
+            if self.model.choose(scores) is None:
+                scores = None
+        if scores is None:
+            scores = self.score_commit_types(analysis)
+        return {
+            'version': REPORT_VERSION,
+            'type': self.determine_commit_type(files, analysis=analysis) if files else None,
+            'message': self.generate_commit_message(files, analysis=analysis) if files else None,
+            'detailed_message': self.generate_detailed_message(files, analysis=analysis) if files else None,
+            'scores': scores,
+            'scope': self.commit_scope(analysis) if files else None,
+            'scopes': self.scope_counts(analysis),
+            'files': files,
+            'level': analysis.level,
+            'file_analysis': analysis.file_analysis,
+            'diff_analysis': analysis.diff_analysis,
+        }
+
+    def is_ambiguous(self, scores: Dict[str, int]) -> bool:
+        """Whether the leading commit type does not win by a clear margin."""
+        best, runner_up = sorted(scores.values(), reverse=True)[:2]
+        return best == 0 or best - runner_up < self.ambiguity_margin
+
+    def score_commit_types(self, analysis: DiffAnalysis) -> Dict[str, int]:
+        """Score every commit type from a precomputed analysis."""
+        file_analysis = analysis.file_analysis
+        diff_analysis = analysis.diff_analysis
         
         # Score each commit type
         scores = {commit_type: 0 for commit_type in self.commit_types.keys()}
@@ -231,6 +2937,11 @@ class CommitMessageGenerator:
         if file_analysis['config_files'] > 0 or file_analysis['build_files'] > 0:
             scores['chore'] += 2
         
+        # Mostly moving files around
+        renamed = file_analysis['renamed_files']
+        if renamed > 0 and renamed * 2 >= file_analysis['total_files']:
+            scores['refactor'] += 3
+        
         # Analyze based on diff content
         if diff_analysis['function_additions'] > 0 or diff_analysis['class_additions'] > 0:
             scores['feat'] += 2
@@ -242,17 +2953,30 @@ class CommitMessageGenerator:
             scores['docs'] += 1
         
         # Analyze based on keywords in file names and diff
-        content_to_analyze = ' '.join(files) + ' ' + diff
-        content_lower = content_to_analyze.lower()
+        for commit_type, score in analysis.keyword_scores.items():
+            scores[commit_type] += score
+        
+        return scores
+
+    @profiled
+    def determine_commit_type(self, files: List[str], diff: str = '',
+                              analysis: Optional[DiffAnalysis] = None) -> str:
+        """Determine the most appropriate commit type."""
+        if not files:
+            return 'chore'
         
-        for commit_type, keywords in self.keywords.items():
-            for keyword in keywords:
-                if keyword in content_lower:
-                    scores[commit_type] += 1
+        if analysis is None:
+            analysis = self.analyze(files, diff)
+        if self.model is not None:
+            # A close call goes to the hand-tuned weights
+            predicted = self.model.predict(commit_features(analysis))
+            if predicted is not None:
+                return predicted
+        scores = self.score_commit_types(analysis)
         
         # If no clear winner, default based on file changes
         if max(scores.values()) == 0:
-            if file_analysis['source_files'] > 0:
+            if analysis.file_analysis['source_files'] > 0:
                 return 'feat'
             else:
                 return 'chore'
@@ -260,14 +2984,48 @@ class CommitMessageGenerator:
         # Return the commit type with the highest score
         return max(scores, key=scores.get)
 
-    def generate_commit_message(self, files: List[str], diff: str) -> str:
+    def scope_counts(self, analysis: DiffAnalysis) -> Dict[str, int]:
+        """Changed files per scope, computed once per analysis; empty without a scope index."""
+        if self.scope_index is None:
+            return {}
+        if analysis.scopes is None:
+            index = self.scope_index.with_changes(analysis.changes)
+            analysis.scopes = index.count(analysis.files)
+        return analysis.scopes
+
+    def commit_scope(self, analysis: DiffAnalysis) -> Optional[str]:
+        """The conventional commit scope of a change set, None when it has none.
+        
+        A scope holding DOMINANT_SCOPE_SHARE of the changed files stands
+        alone; otherwise up to MAX_SUBJECT_SCOPES scopes are listed, most
+        files first, if together they hold that share. Files in no package
+        count against it: a package file among top-level files has no scope.
+        """
+        counts = self.scope_counts(analysis)
+        if not counts:
+            return None
+        required = DOMINANT_SCOPE_SHARE * len(analysis.files)
+        ranked = sorted(counts, key=lambda scope: (-counts[scope], scope))
+        if counts[ranked[0]] >= required:
+            return ranked[0]
+        if len(ranked) <= MAX_SUBJECT_SCOPES and sum(counts.values()) >= required:
+            return ','.join(ranked)
+        return None
+
+    @profiled
+    def generate_commit_message(self, files: List[str], diff: str = '',
+                                analysis: Optional[DiffAnalysis] = None) -> str:
         """Generate a commit message based on the changes."""
         if not files:
             return "chore: no changes detected"
         
-        commit_type = self.determine_commit_type(files, diff)
-        file_analysis = self.analyze_file_types(files)
-        diff_analysis = self.analyze_diff_content(diff)
+        if analysis is None:
+            analysis = self.analyze(files, diff)
+        commit_type = self.determine_commit_type(files, analysis=analysis)
+        file_analysis = analysis.file_analysis
+        diff_analysis = analysis.diff_analysis
+        scope = self.commit_scope(analysis)
+        scope_count = len(self.scope_counts(analysis))
         
         # Generate the main message
         if commit_type == 'feat':
@@ -318,22 +3076,30 @@ class CommitMessageGenerator:
         
         # Add file context if helpful
         if len(files) == 1:
-            file_name = Path(files[0]).name
+            file_name = base_name(files[0])
             message += f" in {file_name}"
         elif len(files) <= 3:
-            file_names = [Path(f).name for f in files]
+            file_names = [base_name(f) for f in files]
             message += f" in {', '.join(file_names)}"
+        elif scope is None and scope_count > 1:
+            message += f" across {scope_count} packages"
         elif file_analysis['total_files'] > 3:
             message += f" across {file_analysis['total_files']} files"
         
+        if scope is not None:
+            return f"{commit_type}({scope}): {message}"
         return f"{commit_type}: {message}"
 
-    def generate_detailed_message(self, files: List[str], diff: str) -> str:
+    @profiled
+    def generate_detailed_message(self, files: List[str], diff: str = '',
+                                  analysis: Optional[DiffAnalysis] = None) -> str:
         """Generate a detailed commit message with body."""
-        main_message = self.generate_commit_message(files, diff)
+        if analysis is None:
+            analysis = self.analyze(files, diff)
+        main_message = self.generate_commit_message(files, analysis=analysis)
         
-        file_analysis = self.analyze_file_types(files)
-        diff_analysis = self.analyze_diff_content(diff)
+        file_analysis = analysis.file_analysis
+        diff_analysis = analysis.diff_analysis
         
         details = []
         
@@ -349,38 +3115,145 @@ class CommitMessageGenerator:
         if diff_analysis['class_additions'] > 0:
             details.append(f"- Added {diff_analysis['class_additions']} new classes")
         
+        if diff_analysis['symbol_modifications'] > 0:
+            details.append(f"- Modified {diff_analysis['symbol_modifications']} functions and classes")
+        
+        if diff_analysis['symbol_removals'] > 0:
+            details.append(f"- Removed {diff_analysis['symbol_removals']} functions and classes")
+        
         if file_analysis['test_files'] > 0:
             details.append(f"- Modified {file_analysis['test_files']} test files")
         
-        if file_analysis['doc_files'] > 0:
-            details.append(f"- Updated {file_analysis['doc_files']} documentation files")
+        if file_analysis['doc_files'] > 0:
+            details.append(f"- Updated {file_analysis['doc_files']} documentation files")
+        
+        if file_analysis['renamed_files'] > 0:
+            details.append(f"- Renamed {file_analysis['renamed_files']} files")
+        
+        # Counters that are estimates or incomplete
+        if diff_analysis['sampled_files'] > 0:
+            details.append(f"- Estimated changes in {diff_analysis['sampled_files']} large files "
+                           "from a sample of their hunks")
+        
+        if diff_analysis['skipped_files'] > 0:
+            details.append(f"- Skipped the diff of {diff_analysis['skipped_files']} "
+                           "lockfiles and generated files")
+        
+        if diff_analysis['truncated']:
+            details.append(f"- Stopped reading the diff after {self.budget.max_total_bytes // (1024 * 1024)} MB")
+        
+        scopes = self.scope_counts(analysis)
+        if len(scopes) > 1:
+            ranked = sorted(scopes.items(), key=lambda item: (-item[1], item[0]))
+            listed = ', '.join(f"{scope} ({count})" for scope, count in ranked[:10])
+            more = f" and {len(ranked) - 10} more" if len(ranked) > 10 else ''
+            details.append(f"- Changed files in {len(ranked)} packages: {listed}{more}")
+        
+        if details:
+            return f"{main_message}\n\n" + "\n".join(details)
+        else:
+            return main_message
+
+    def iter_history(self, revisions: List[str]) -> Iterator[Tuple[str, str, str]]:
+        """Yield (sha, subject, diff) for every commit in one `git log -p` stream."""
+        cmd = ['git', 'log', '-p', '--no-color', '--format=%x1e%H%x00%s'] + revisions
+        sha = subject = None
+        lines: List[str] = []
+        for block in self.stream_git_command(cmd):
+            for line in block.split('\n'):
+                if line.startswith(COMMIT_MARKER):
+                    if sha is not None:
+                        yield sha, subject, '\n'.join(lines)
+                    sha, _, subject = line[1:].partition('\0')
+                    lines = []
+                else:
+                    lines.append(line)
+        if sha is not None:
+            yield sha, subject, '\n'.join(lines)
+
+    def classify_commit(self, sha: str, subject: str, diff: str) -> Dict[str, Optional[str]]:
+        """Classify one historical commit and report the type its subject declares."""
+        changes = changes_from_diff(diff.split('\n'))
+        files = [change.path for change in changes]
+        match = CONVENTIONAL_SUBJECT.match(subject)
+        declared = match.group(1).lower() if match else None
+        return {
+            'commit': sha,
+            'subject': subject,
+            'type': self.determine_commit_type(files, diff, self.analyze(files, diff, changes)),
+            'declared': declared if declared in self.commit_types else None
+        }
+
+    def classify_history(self, revisions: List[str], workers: Optional[int] = None,
+                         chunk_size: int = 64) -> Iterator[Dict[str, Optional[str]]]:
+        """Classify every commit in ``revisions``, in log order, on a process pool."""
+        return self.map_history('classify_commit', revisions, workers, chunk_size)
+
+    def commit_sample(self, sha: str, subject: str, diff: str) -> Optional[Tuple[str, Dict[str, float]]]:
+        """Training sample (declared type, features) of a commit, None without a conventional subject."""
+        match = CONVENTIONAL_SUBJECT.match(subject)
+        declared = match.group(1).lower() if match else None
+        if declared not in self.commit_types:
+            return None
+        # Renames come from the diff headers, as they come from git status at inference
+        changes = changes_from_diff(diff.split('\n'))
+        files = [change.path for change in changes]
+        return declared, commit_features(self.analyze(files, diff, changes))
+
+    def train_model(self, revisions: List[str], workers: Optional[int] = None,
+                    chunk_size: int = 64) -> Tuple[CommitTypeModel, int]:
+        """Learn a commit type model from the conventional commits in ``revisions``.
+        
+        Returns the model and the number of commits it was trained on.
+        """
+        samples = [sample for sample in self.map_history('commit_sample', revisions, workers, chunk_size)
+                   if sample is not None]
+        return CommitTypeModel.train(samples), len(samples)
+
+    def map_history(self, method: str, revisions: List[str], workers: Optional[int] = None,
+                    chunk_size: int = 64) -> Iterator:
+        """Call ``method(sha, subject, diff)`` for every commit in ``revisions``, in log order."""
+        commits = self.iter_history(revisions)
+        workers = workers or self.workers or os.cpu_count() or 1
+        if workers == 1:
+            call = getattr(self, method)
+            for commit in commits:
+                yield call(*commit)
+            return
         
-        if details:
-            return f"{main_message}\n\n" + "\n".join(details)
-        else:
-            return main_message
+        from concurrent.futures import ProcessPoolExecutor
+        model = self.model.to_bytes() if self.model is not None else None
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(self.keywords, self.keyword_matcher.word_boundary,
+                                           self.file_rules, model, self.budget)) as executor:
+            for results in bounded_map(executor, functools.partial(_history_batch, method),
+                                       batched(commits, chunk_size), workers * 2):
+                yield from results
 
     def interactive_mode(self, staged: bool = False):
         """Run in interactive mode to let user choose/modify the message."""
         print("🚀 Commit Message Generator")
         print("=" * 40)
         
-        files = self.get_changed_files(staged)
+        analysis = self.analyze_worktree(staged)
+        files = analysis.files
         if not files:
             print("No changes detected.")
             return
         
         print(f"Changed files ({len(files)}):")
-        for file in files[:10]:  # Show first 10 files
-            print(f"  • {file}")
+        for change in analysis.changes[:10]:  # Show first 10 files
+            if change.renamed:
+                print(f"  • {change.old_path} → {change.path}")
+            else:
+                print(f"  • {change.path}")
         if len(files) > 10:
             print(f"  ... and {len(files) - 10} more files")
         
         print()
         
-        diff = self.get_git_diff(staged)
-        suggested_message = self.generate_commit_message(files, diff)
-        detailed_message = self.generate_detailed_message(files, diff)
+        suggested_message = self.generate_commit_message(files, analysis=analysis)
+        detailed_message = self.generate_detailed_message(files, analysis=analysis)
         
         print(f"Suggested commit message:")
         print(f"📝 {suggested_message}")
@@ -424,8 +3297,12 @@ class CommitMessageGenerator:
                 print("Available types:", ', '.join(self.commit_types.keys()))
                 new_type = input("Enter commit type: ").strip()
                 if new_type in self.commit_types:
-                    message_body = suggested_message.split(': ', 1)[1]
-                    new_message = f"{new_type}: {message_body}"
+                    # Only the type changes: "feat(billing): ..." becomes "fix(billing): ..."
+                    match = CONVENTIONAL_SUBJECT.match(suggested_message)
+                    if match:
+                        new_message = new_type + suggested_message[match.end(1):]
+                    else:
+                        new_message = f"{new_type}: {suggested_message}"
                     print(f"\n📋 Final message:\n{new_message}")
                     if input("\nCopy to clipboard? (y/n): ").lower() == 'y':
                         self.copy_to_clipboard(new_message)
@@ -461,7 +3338,729 @@ class CommitMessageGenerator:
                     print(f"'{text}'")
 
 
+def read_blocks(stream: IO, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[str]:
+    """Read a text or binary file object in blocks of whole lines, e.g. a diff on stdin."""
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    carry = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        data = carry + (decoder.decode(chunk) if isinstance(chunk, bytes) else chunk)
+        cut = data.rfind('\n')
+        if cut == -1:
+            carry = data
+            continue
+        carry = data[cut + 1:]
+        yield data[:cut]
+    carry += decoder.decode(b'', True)
+    if carry:
+        yield carry
+
+
+def analyze_diff(diff: Union[str, Iterable[str], IO], files: Optional[List[str]] = None,
+                 generator: Optional[CommitMessageGenerator] = None) -> DiffAnalysis:
+    """Analyze a unified diff without running git.
+    
+    ``diff`` is the diff text, an iterable of blocks of whole lines (such as
+    the lines of a file) or a file object, which is read in blocks. Without
+    ``files`` the changed files are taken from the diff headers.
+    """
+    generator = generator or CommitMessageGenerator()
+    if isinstance(diff, str):
+        if files is None:
+            files = files_from_diff(DIFF_HEADER.findall(diff))
+        return generator.analyze(files, diff)
+    
+    if hasattr(diff, 'read'):
+        diff = read_blocks(diff)
+    # Files found in the headers are added while the diff streams in
+    found = files if files is not None else []
+    
+    def blocks() -> Iterator[str]:
+        for block in diff:
+            if block.endswith('\n'):
+                block = block[:-1]
+            if files is None:
+                found.extend(files_from_diff(DIFF_HEADER.findall(block)))
+            yield block
+    
+    return generator.analyze_stream(found, blocks())
+
+
+def suggest_commit(diff: Union[str, Iterable[str], IO], files: Optional[List[str]] = None,
+                   generator: Optional[CommitMessageGenerator] = None) -> dict:
+    """The report (see CommitMessageGenerator.report) of a diff, without running git."""
+    generator = generator or CommitMessageGenerator()
+    return generator.report(analyze_diff(diff, files, generator))
+
+
+# Generator of the current worker process, see map_history and analyze_file_diffs
+_worker_generator: Optional[CommitMessageGenerator] = None
+
+
+def _init_worker(keywords: Dict[str, List[str]], word_boundary: bool,
+                 file_rules: Optional[dict] = None, model: Optional[bytes] = None,
+                 budget: Optional[DiffBudget] = None):
+    global _worker_generator
+    _worker_generator = CommitMessageGenerator(keywords, word_boundary, file_rules=file_rules,
+                                               budget=budget)
+    if model is not None:
+        _worker_generator.model = CommitTypeModel.from_bytes(model)
+
+
+def _history_batch(method: str, commits: List[Tuple[str, str, str]]) -> list:
+    call = getattr(_worker_generator, method)
+    return [call(*commit) for commit in commits]
+
+
+def _analyze_file_batch(sections: List[str]) -> List[Tuple[Optional[str], FileDiffResult]]:
+    matcher = _worker_generator.keyword_matcher
+    budget = _worker_generator.budget
+    return [(file_diff_path(section), analyze_file_diff(matcher, section, budget))
+            for section in sections]
+
+
+def run_history_mode(generator: CommitMessageGenerator, revisions: List[str],
+                     workers: Optional[int], chunk_size: int) -> int:
+    """Print one JSON line per commit and a per-type summary on stderr.
+    
+    Returns the exit status: 1 when git failed, e.g. on an invalid range.
+    """
+    totals: Dict[str, int] = {}
+    for result in generator.classify_history(revisions, workers, chunk_size):
+        print(json.dumps(result))
+        totals[result['type']] = totals.get(result['type'], 0) + 1
+    
+    for commit_type, count in sorted(totals.items(), key=lambda item: -item[1]):
+        print(f"{commit_type}: {count}", file=sys.stderr)
+    return 1 if generator.git_errors else 0
+
+
+# inotify(7) event flags
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# Files in the git directory whose changes can affect every changed file
+GIT_STATE_FILES = frozenset(['index', 'HEAD'])
+
+
+class InotifyWatcher:
+    """Report changed paths of a work tree using Linux inotify.
+    
+    Raises OSError (or AttributeError without inotify in libc) when
+    inotify is unavailable or runs out of watches.
+    """
+
+    def __init__(self, work_tree: str, git_dir: str, ignored: Iterable[str] = ()):
+        # Only --watch needs ctypes
+        import ctypes
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.get_errno = ctypes.get_errno
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(self.get_errno(), "inotify_init1 failed")
+        
+        self.work_tree = work_tree
+        self.ignored = {path.rstrip('/') for path in ignored}
+        # Watch descriptor -> directory relative to the work tree, None for the git dir
+        self.dirs: Dict[int, Optional[str]] = {}
+        try:
+            self.add_watch(git_dir, None)
+            self.add_tree('')
+        except BaseException:
+            self.close()
+            raise
+
+    def add_watch(self, path: str, relative: Optional[str]):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(self.get_errno(), f"inotify_add_watch failed for {path}")
+        self.dirs[wd] = relative
+
+    def add_tree(self, relative: str):
+        """Watch a directory and its subdirectories, skipping .git and ignored ones."""
+        top = os.path.join(self.work_tree, relative)
+        for root, dirnames, _ in os.walk(top):
+            prefix = os.path.relpath(root, self.work_tree)
+            prefix = '' if prefix == '.' else prefix.replace(os.sep, '/') + '/'
+            dirnames[:] = [name for name in dirnames
+                           if name != '.git' and prefix + name not in self.ignored]
+            self.add_watch(root, prefix.rstrip('/'))
+
+    def wait(self, timeout: Optional[float]) -> Optional[Set[str]]:
+        """Wait for changes; return the changed paths, or None when everything
+        needs to be checked again (index or HEAD changed, events were lost)."""
+        import select
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        
+        paths: Set[str] = set()
+        everything = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = struct.unpack_from('iIII', data, offset)
+                name = os.fsdecode(data[offset + 16:offset + 16 + length].rstrip(b'\0'))
+                offset += 16 + length
+                if mask & IN_Q_OVERFLOW:
+                    everything = True
+                    continue
+                if wd not in self.dirs:
+                    continue
+                directory = self.dirs[wd]
+                if directory is None:
+                    everything = everything or name in GIT_STATE_FILES
+                    continue
+                path = f"{directory}/{name}" if directory else name
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and path not in self.ignored:
+                    try:
+                        self.add_tree(path)
+                    except OSError:
+                        everything = True
+                paths.add(path)
+        return None if everything else paths
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    """Report changes by polling the index, HEAD and the known changed files.
+    
+    Without --staged every tracked file is polled too, so the first edit to
+    a clean file shows up on the next poll; in work trees of more than
+    ``max_tracked`` files, and for new untracked files, that takes the full
+    re-check done every ``rescan_every`` polls.
+    """
+
+    def __init__(self, work_tree: str, git_dir: str, live: 'LiveAnalysis',
+                 interval: float = 1.0, rescan_every: int = 10,
+                 max_tracked: int = MAX_POLLED_TRACKED_FILES):
+        self.work_tree = work_tree
+        self.state_files = [os.path.join(git_dir, name) for name in sorted(GIT_STATE_FILES)]
+        self.live = live
+        self.interval = interval
+        self.rescan_every = rescan_every
+        self.max_tracked = max_tracked
+        self.polls = 0
+        self.state = self.stat_state_files()
+        self.tracked = self.list_tracked_files()
+        self.stats = self.stat_changed_files()
+
+    def stat_state_files(self) -> List[Optional[Tuple[int, int]]]:
+        return [_stat_signature(path) for path in self.state_files]
+
+    def list_tracked_files(self) -> List[str]:
+        """Tracked files whose edits only the work tree shows, none with --staged or too many."""
+        if self.live.staged:
+            return []
+        output = self.live.generator.run_git_command(
+            ['git', '-C', self.work_tree, 'ls-files', '-z'], strip=False)
+        tracked = output.split('\0')[:-1]
+        return tracked if len(tracked) <= self.max_tracked else []
+
+    def stat_changed_files(self) -> Dict[str, Optional[Tuple[int, int]]]:
+        return {path: _stat_signature(os.path.join(self.work_tree, path))
+                for path in chain(self.tracked, self.live.changes)}
+
+    def wait(self, timeout: Optional[float]) -> Optional[Set[str]]:
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        self.polls += 1
+        state = self.stat_state_files()
+        if state != self.state:
+            # Files were added to or removed from the index
+            self.tracked = self.list_tracked_files()
+        stats = self.stat_changed_files()
+        everything = state != self.state or self.polls % self.rescan_every == 0
+        changed = {path for path, stat in stats.items() if self.stats.get(path, stat) != stat}
+        self.state = state
+        self.stats = stats
+        return None if everything else changed
+
+    def close(self):
+        pass
+
+
+def _stat_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class LiveAnalysis:
+    """Per-file analysis of the current changes that is updated file by file.
+    
+    Files whose status, blobs and (for the work tree) stat data are
+    unchanged keep their results; only the others are diffed again.
+    """
+
+    def __init__(self, generator: CommitMessageGenerator, staged: bool = False,
+                 work_tree: str = '.'):
+        self.generator = generator
+        self.staged = staged
+        self.work_tree = work_tree
+        self.changes: Dict[str, FileChange] = {}
+        self.signatures: Dict[str, tuple] = {}
+        self.results: Dict[str, FileDiffResult] = {}
+        self.categories: Dict[str, int] = {}
+
+    def signature(self, change: FileChange) -> tuple:
+        signature = (change.status, change.old_path, change.old_blob, change.new_blob)
+        if not self.staged:
+            signature += (_stat_signature(os.path.join(self.work_tree, change.path)),)
+        return signature
+
+    def update(self, paths: Optional[Iterable[str]] = None) -> bool:
+        """Re-check ``paths`` (everything when None); return whether anything changed."""
+        generator = self.generator
+        cmd = ['git', '--literal-pathspecs'] + STATUS_COMMAND[1:]
+        if paths is not None:
+            paths = set(paths)
+            if not paths:
+                return False
+            if len(paths) > MAX_PATHSPECS:
+                paths = None
+            else:
+                cmd += ['--'] + sorted(paths)
+        changes = {change.path: change for change in parse_status(generator.run_git_command(cmd, strip=False),
+                                                                  self.staged)}
+        
+        if paths is None:
+            removed = set(self.changes) - set(changes)
+        else:
+            # Paths may be directories that were created, moved or deleted
+            removed = {path for path in self.changes if path not in changes and (
+                path in paths or any(path.startswith(prefix + '/') for prefix in paths))}
+        for path in removed:
+            for table in (self.changes, self.signatures, self.results, self.categories):
+                del table[path]
+        
+        dirty = {}
+        for path, change in changes.items():
+            signature = self.signature(change)
+            if self.signatures.get(path) != signature:
+                dirty[path] = change
+                self.changes[path] = change
+                self.signatures[path] = signature
+                self.categories[path] = (RENAMED if change.renamed
+                                         else generator.file_classifier.category(path))
+        if dirty:
+            self.analyze(dirty)
+        return bool(dirty or removed)
+
+    def analyze(self, dirty: Dict[str, FileChange]):
+        """Diff and analyze only the ``dirty`` files."""
+        matcher = self.generator.keyword_matcher
+        for path in dirty:
+            # Untracked files have no diff, only their name counts
+            self.results[path] = (empty_diff_analysis(), matcher.find(path), [])
+        
+        tracked = [change for change in dirty.values() if change.old_blob is not None]
+        if not tracked:
+            return
+        cmd = ['git', '--literal-pathspecs', 'diff']
+        if self.staged:
+            cmd.append('--staged')
+        pathspecs = {spec for change in tracked for spec in (change.path, change.old_path) if spec}
+        if len(pathspecs) <= MAX_PATHSPECS:
+            cmd += ['--'] + sorted(pathspecs)
+        splitter = FileDiffSplitter(matcher, self.generator.budget, dirty.__contains__)
+        for item in splitter.split(self.generator.stream_git_command(cmd)):
+            if isinstance(item, str):
+                path, (counts, keywords, hunks) = (
+                    file_diff_path(item), analyze_file_diff(matcher, item, self.generator.budget))
+            else:
+                path, (counts, keywords, hunks) = item
+            self.results[path] = (counts, keywords | matcher.find(path), hunks)
+
+    def analysis(self) -> DiffAnalysis:
+        """The analysis of the whole change set, merged from the per-file results."""
+        generator = self.generator
+        files = sorted(self.changes)
+        diff_analysis = empty_diff_analysis()
+        found_keywords: Set[str] = set()
+        symbols: Dict[str, List[dict]] = {}
+        for path in files:
+            merge_file_analysis(diff_analysis, found_keywords, symbols, path, self.results[path])
+        classification = FileClassification(files, array('B', [self.categories[path] for path in files]))
+        return DiffAnalysis(
+            files,
+            classification.counts(),
+            diff_analysis,
+            generator.keyword_matcher.score(found_keywords, generator.commit_types),
+            symbols=symbols,
+            classification=classification,
+            changes=[self.changes[path] for path in files]
+        )
+
+    def message(self, detailed: bool = False) -> Optional[str]:
+        """The suggested message, or None when nothing changed."""
+        analysis = self.analysis()
+        if not analysis.files:
+            return None
+        if detailed:
+            return self.generator.generate_detailed_message(analysis.files, analysis=analysis)
+        return self.generator.generate_commit_message(analysis.files, analysis=analysis)
+
+
+def run_watch_mode(generator: CommitMessageGenerator, staged: bool = False,
+                   interval: float = 1.0, detailed: bool = False, output_format: str = 'text'):
+    """Print the suggested message on start and whenever it changes, until interrupted.
+    
+    With ``output_format='json'`` every update is one line holding the report.
+    """
+    found = find_git_dir(generator.repo)
+    if found is None:
+        print("Not a git repository", file=sys.stderr)
+        return
+    work_tree, git_dir = found
+    live = LiveAnalysis(generator, staged, work_tree)
+    live.update()
+    
+    ignored = generator.run_git_command(
+        ['git', 'ls-files', '--others', '--ignored', '--exclude-standard', '--directory', '-z'],
+        strip=False).split('\0')
+    try:
+        watcher = InotifyWatcher(work_tree, git_dir, [path for path in ignored if path.endswith('/')])
+    except (OSError, AttributeError):
+        watcher = PollingWatcher(work_tree, git_dir, live, interval)
+    
+    last = None
+    try:
+        while True:
+            if output_format == 'json':
+                output = json.dumps(generator.report(live.analysis()))
+            else:
+                message = live.message(detailed)
+                output = (message if message is not None else "No changes detected.") + '\n'
+            if output != last:
+                print(output, flush=True)
+                last = output
+            
+            paths = watcher.wait(None)
+            if paths is not None and not paths:
+                continue
+            # Saves come as bursts of events: gather them before updating
+            while paths is not None:
+                more = watcher.wait(0.05)
+                if more is None:
+                    paths = None
+                elif more:
+                    paths |= more
+                    continue
+                break
+            scope_index = generator.scope_index
+            if paths is None and scope_index is not None and scope_index.marker_paths is not None:
+                # HEAD may have moved, and commits add and delete packages
+                generator.scope_index = generator.load_scope_index(scope_index.markers)
+            live.update(paths)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+def run_train_mode(generator: CommitMessageGenerator, revisions: List[str], path: Optional[str],
+                   workers: Optional[int], chunk_size: int) -> int:
+    """Train a commit type model on the history and save it; return the exit status."""
+    path = path or CommitTypeModel.default_path(generator.repo)
+    if path is None:
+        print("Not a git repository", file=sys.stderr)
+        return 1
+    try:
+        model, trained = generator.train_model(revisions, workers, chunk_size)
+    except ValueError as e:
+        print(f"Could not train a model: {e}", file=sys.stderr)
+        return 1
+    model.save(path)
+    learned = sum(model.counts)
+    left_out = f", {trained - learned} of rarer types left out" if learned < trained else ''
+    print(f"Trained on {learned} commits of types {', '.join(model.types)}{left_out}")
+    print(f"Saved {len(model.to_bytes())} byte model to {path}")
+    return 0
+
+
+# Directories never searched for repositories by --discover, besides hidden ones
+DISCOVER_SKIPPED = ('node_modules', '__pycache__')
+
+
+def discover_repositories(top: str, max_depth: int = 4) -> Iterator[str]:
+    """Yield the work trees under ``top``, nested checkouts and submodules included.
+    
+    Walks at most ``max_depth`` directories deep without running git; a
+    work tree is any directory holding a ``.git`` directory or file.
+    """
+    pending = [(os.path.abspath(top), 0)]
+    while pending:
+        path, depth = pending.pop()
+        try:
+            entries = sorted(os.scandir(path), key=lambda entry: entry.name, reverse=True)
+        except OSError:
+            continue
+        if any(entry.name == '.git' for entry in entries):
+            yield path
+        if depth >= max_depth:
+            continue
+        for entry in entries:
+            if (not entry.name.startswith('.') and entry.name not in DISCOVER_SKIPPED
+                    and entry.is_dir(follow_symlinks=False)):
+                pending.append((entry.path, depth + 1))
+
+
+def fleet_result(generator: CommitMessageGenerator, path: str, staged: bool, level: str,
+                 use_cache: bool, infer_scopes: bool) -> dict:
+    """The report of one repository of a fleet scan, or the error that stopped it."""
+    found = find_git_dir(path)
+    if found is None:
+        return {'repo': path, 'error': "not a git repository"}
+    work_tree = found[0]
+    repo_generator = None
+    try:
+        repo_generator = generator.for_repository(work_tree, use_cache, infer_scopes)
+        return {'repo': work_tree, 'report': repo_generator.report(repo_generator.analyze_changes(staged, level))}
+    except Exception as e:
+        return {'repo': work_tree, 'error': str(e) or type(e).__name__}
+    finally:
+        if repo_generator is not None and repo_generator.cache is not None:
+            repo_generator.cache.close()
+
+
+def run_fleet_mode(generator: CommitMessageGenerator, repositories: Iterable[str],
+                   staged: bool = False, level: str = 'auto', workers: Optional[int] = None,
+                   use_cache: bool = True, infer_scopes: bool = True, output_format: str = 'text'):
+    """Suggest a message for every repository, printed as soon as each one is done.
+    
+    Repositories are analyzed by a pool of ``workers`` threads (git does
+    most of the work, in its own processes); ``repositories`` may be a
+    lazy discover_repositories walk, which feeds the pool as it goes. A
+    repository that fails reports its error without stopping the others.
+    With ``output_format='json'`` every repository is one JSON line
+    ``{"repo": ..., "report": {...}}`` or ``{"repo": ..., "error": ...}``.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    totals = {'repositories': 0, 'changed': 0, 'failed': 0}
+    
+    def emit(result: dict):
+        totals['repositories'] += 1
+        report = result.get('report')
+        if 'error' in result:
+            totals['failed'] += 1
+        elif report['files']:
+            totals['changed'] += 1
+        if output_format == 'json':
+            print(json.dumps(result), flush=True)
+        elif 'error' in result:
+            print(f"{result['repo']}: error: {result['error']}", flush=True)
+        else:
+            print(f"{result['repo']}: {report['message'] or 'No changes detected.'}", flush=True)
+    
+    seen = set()
+    with ThreadPoolExecutor(workers) as executor:
+        pending = set()
+        for path in repositories:
+            path = os.path.abspath(path)
+            if path in seen:
+                continue
+            seen.add(path)
+            pending.add(executor.submit(fleet_result, generator, path, staged, level,
+                                        use_cache, infer_scopes))
+            # Print what finished meanwhile; discovery stays at most one batch
+            # ahead of the pool
+            full = len(pending) >= 2 * workers
+            done, pending = wait(pending, None if full else 0, FIRST_COMPLETED)
+            for future in done:
+                emit(future.result())
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                emit(future.result())
+    
+    print(f"{totals['repositories']} repositories, {totals['changed']} with changes, "
+          f"{totals['failed']} failed", file=sys.stderr)
+
+
+class MessageServer:
+    """Answer message requests on a Unix socket with warm per-repository generators.
+
+    Each request is one JSON line, e.g.
+    ``{"repo": "/path/to/repo", "staged": true, "level": "auto", "detailed": false}``,
+    and is answered with ``{"message": "..."}`` (null when nothing changed)
+    or ``{"error": "..."}``. Requests with ``"format": "json"`` are answered
+    with ``{"report": {...}}``, see CommitMessageGenerator.report.
+    """
+
+    def __init__(self, socket_path: Optional[str] = None,
+                 keywords: Optional[Dict[str, List[str]]] = None,
+                 word_boundary: bool = False, use_cache: bool = True,
+                 file_rules: Optional[dict] = None, git_timeout: Optional[float] = None,
+                 budget: Optional[DiffBudget] = None, scopes: Optional[dict] = None,
+                 infer_scopes: bool = True):
+        # Without a path the socket goes into a private per-user directory
+        self.private_directory = socket_path is None
+        self.socket_path = socket_path or default_socket_path()
+        self.keywords = keywords
+        self.word_boundary = word_boundary
+        self.file_rules = file_rules
+        self.git_timeout = git_timeout
+        self.budget = budget
+        self.use_cache = use_cache
+        # Configured scopes, or whether to discover them from marker files
+        self.scopes = scopes
+        self.infer_scopes = infer_scopes
+        self.generators: Dict[str, CommitMessageGenerator] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+
+    def generator_for(self, work_tree: str) -> CommitMessageGenerator:
+        """Get the generator of a repository, creating it on first use."""
+        generator = self.generators.get(work_tree)
+        if generator is None:
+            import asyncio
+            generator = CommitMessageGenerator(self.keywords, self.word_boundary, repo=work_tree,
+                                               file_rules=self.file_rules, budget=self.budget)
+            generator.open_cache = self.use_cache
+            generator.git_timeout = self.git_timeout
+            generator.model = CommitTypeModel.for_repository(work_tree)
+            if self.scopes is not None:
+                generator.scope_index = ScopeIndex.from_config(self.scopes)
+            self.generators[work_tree] = generator
+            self.locks[work_tree] = asyncio.Lock()
+        return generator
+
+    async def respond(self, request: dict) -> dict:
+        import asyncio
+        found = find_git_dir(request.get('repo') or '.')
+        if found is None:
+            return {'error': f"not a git repository: {request.get('repo')}"}
+        work_tree = found[0]
+        generator = self.generator_for(work_tree)
+        
+        # Requests for one repository share its generator and cache, so they
+        # run one at a time; different repositories are served concurrently
+        staged = bool(request.get('staged'))
+        level = request.get('level', 'auto')
+        async with self.locks[work_tree]:
+            loop = asyncio.get_running_loop()
+            if self.scopes is None and self.infer_scopes:
+                # HEAD moves between requests; the cache under .git/ keeps this cheap
+                generator.scope_index = await loop.run_in_executor(None, generator.load_scope_index)
+            if request.get('format') == 'json':
+                report = await loop.run_in_executor(
+                    None, lambda: generator.report(generator.analyze_changes(staged, level)))
+                return {'report': report}
+            message = await loop.run_in_executor(
+                None, generator.suggest_message, staged, level, bool(request.get('detailed')))
+        return {'message': message}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = await self.respond(json.loads(line))
+                except Exception as e:
+                    response = {'error': str(e)}
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def claim_socket_path(self):
+        """Make sure the socket can be bound without exposing or stealing it.
+        
+        The default path's directory is created with mode 0700 and must be
+        this user's alone; it may sit in a shared /tmp where anyone could
+        have created it first. A socket left at the path is only removed
+        when no daemon answers on it. Raises OSError otherwise.
+        """
+        import socket
+        import stat
+        path = self.socket_path
+        if self.private_directory:
+            directory = os.path.dirname(path)
+            try:
+                os.mkdir(directory, 0o700)
+            except FileExistsError:
+                pass
+            info = os.lstat(directory)
+            if (not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid()
+                    or info.st_mode & 0o077):
+                raise PermissionError(f"{directory} is not a directory private to this user")
+        try:
+            info = os.lstat(path)
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(info.st_mode):
+            raise FileExistsError(f"{path} exists and is not a socket")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a daemon that is gone
+                os.unlink(path)
+                return
+        raise FileExistsError(f"a daemon is already serving on {path}")
+
+    async def serve(self):
+        import asyncio
+        self.claim_socket_path()
+        # Bound with the permissions it keeps: nobody else can connect in between
+        umask = os.umask(0o077)
+        try:
+            server = await asyncio.start_unix_server(self.handle, path=self.socket_path)
+        finally:
+            os.umask(umask)
+        bound = os.stat(self.socket_path).st_ino
+        print(f"Serving commit messages on {self.socket_path}", file=sys.stderr)
+        
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            # Only remove the socket if it is still the one this daemon bound
+            try:
+                if os.stat(self.socket_path).st_ino == bound:
+                    os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+
+    def run(self):
+        import asyncio
+        try:
+            asyncio.run(self.serve())
+        except OSError as e:
+            print(f"Could not serve commit messages: {e}", file=sys.stderr)
+            sys.exit(1)
+
+
 def main():
+    import argparse
     parser = argparse.ArgumentParser(
         description="Generate commit messages based on git changes",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -470,6 +4069,16 @@ Examples:
   python commit_message_generator.py              # Analyze unstaged changes
   python commit_message_generator.py --staged     # Analyze staged changes
   python commit_message_generator.py --quick      # Generate quick message
+  python commit_message_generator.py --quick --keywords words.json --word-boundary
+  python commit_message_generator.py --quick --staged --scopes scopes.json
+  python commit_message_generator.py --range v1.0..HEAD --workers 8 > types.jsonl
+  python commit_message_generator.py --serve &    # Keep a warm daemon running
+  python commit_message_generator.py --quick --staged --client
+  python commit_message_generator.py --watch --staged   # Live message for editors
+  python commit_message_generator.py --train --range main~2000..main
+  python commit_message_generator.py --repos api web docs --staged   # One line per repo
+  python commit_message_generator.py --discover ~/src --workers 16 --format json
+  git diff main... | python commit_message_generator.py --stdin --format json
         """
     )
     
@@ -485,22 +4094,347 @@ Examples:
         help='Generate quick message without interactive mode'
     )
     
+    parser.add_argument(
+        '--format',
+        choices=('text', 'json'),
+        default='text',
+        help='Print the message as text, or a JSON report with the commit type, the scores '
+             'of every type and the file and diff analysis (implies --quick; one line per '
+             'update with --watch)'
+    )
+    
+    parser.add_argument(
+        '--stdin',
+        action='store_true',
+        help='Analyze a unified diff read from standard input instead of running git; '
+             'the model and packages of the current repository are only used when '
+             'given with --model and --scopes'
+    )
+    
+    parser.add_argument(
+        '--level',
+        choices=('auto',) + ANALYSIS_LEVELS,
+        default='auto',
+        help='How much of the change set --quick reads from git; auto only '
+             'reads the full patch when file names and line counts are ambiguous'
+    )
+    
+    parser.add_argument(
+        '--keywords',
+        metavar='FILE',
+        help='JSON file mapping commit types to keyword lists that replace the defaults'
+    )
+    
+    parser.add_argument(
+        '--file-rules',
+        metavar='FILE',
+        help='JSON file with test_substrings, doc_substrings, suffixes and names '
+             'rules that adjust how changed files are categorized'
+    )
+    
+    parser.add_argument(
+        '--scopes',
+        metavar='FILE',
+        help='JSON file mapping conventional commit scopes to package roots, e.g. '
+             '{"billing": "services/billing"}; by default the directories holding '
+             f"{', '.join(SCOPE_MARKERS)} files are the packages"
+    )
+    
+    parser.add_argument(
+        '--no-scopes',
+        action='store_true',
+        help='Leave the scope out of the message'
+    )
+    
+    parser.add_argument(
+        '--word-boundary',
+        action='store_true',
+        help='Only match keywords as whole words'
+    )
+    
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Do not use the per-file analysis cache stored under .git/'
+    )
+    
+    parser.add_argument(
+        '--cache-stats',
+        action='store_true',
+        help='Print analysis cache hits and misses to stderr'
+    )
+    
+    parser.add_argument(
+        '--profile', '--timings',
+        action='store_true',
+        help='Print git and analysis timings to stderr after the run'
+    )
+    
+    parser.add_argument(
+        '--profile-format',
+        choices=('table', 'json'),
+        default='table',
+        help='Format of the --profile output (default: table)'
+    )
+    
+    parser.add_argument(
+        '--git-timeout',
+        type=float,
+        metavar='SECONDS',
+        help='Kill git commands that take longer than this'
+    )
+    
+    parser.add_argument(
+        '--max-file-bytes',
+        type=int,
+        default=MAX_FILE_DIFF_BYTES,
+        metavar='N',
+        help='Sample the diff of files longer than this many characters; 0 disables '
+             f'(default: {MAX_FILE_DIFF_BYTES})'
+    )
+    
+    parser.add_argument(
+        '--max-file-lines',
+        type=int,
+        default=MAX_FILE_DIFF_LINES,
+        metavar='N',
+        help='Sample the diff of files longer than this many lines; 0 disables '
+             f'(default: {MAX_FILE_DIFF_LINES})'
+    )
+    
+    parser.add_argument(
+        '--max-diff-bytes',
+        type=int,
+        default=MAX_TOTAL_DIFF_BYTES,
+        metavar='N',
+        help='Stop reading the diff after this many characters; 0 disables '
+             f'(default: {MAX_TOTAL_DIFF_BYTES})'
+    )
+    
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help='Run as a daemon answering message requests on a Unix socket'
+    )
+    
+    parser.add_argument(
+        '--client',
+        action='store_true',
+        help='With --quick, ask the --serve daemon instead of analyzing in-process'
+    )
+    
+    parser.add_argument(
+        '--socket',
+        metavar='PATH',
+        help='Unix socket of the daemon (default: daemon.sock in a private per-user '
+             'directory under $XDG_RUNTIME_DIR or /tmp)'
+    )
+    
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='Keep running and print the suggested message whenever the changes do'
+    )
+    
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=1.0,
+        metavar='SECONDS',
+        help='Polling interval of --watch where inotify is unavailable (default: 1); '
+             'edits to clean tracked files show up on the next poll, in work trees of '
+             f'more than {MAX_POLLED_TRACKED_FILES} files only every 10 polls'
+    )
+    
+    parser.add_argument(
+        '--train',
+        action='store_true',
+        help='Learn commit types from the conventional commit subjects in the history '
+             '(--range, --all or HEAD) and save the model'
+    )
+    
+    parser.add_argument(
+        '--model',
+        metavar='FILE',
+        help='Model file to save with --train or to use instead of the hand-tuned weights '
+             '(default: .git/commit-message-generator.model, used when present)'
+    )
+    
+    parser.add_argument(
+        '--range',
+        metavar='A..B',
+        help='Classify every commit in a history range and print JSON lines'
+    )
+    
+    parser.add_argument(
+        '--all',
+        action='store_true',
+        help='Classify every commit reachable from any ref and print JSON lines'
+    )
+    
+    parser.add_argument(
+        '--repos',
+        nargs='+',
+        metavar='PATH',
+        help='Suggest a message for each of these repositories, one line each as they finish'
+    )
+    
+    parser.add_argument(
+        '--discover',
+        metavar='DIR',
+        help='Like --repos, for every repository found under DIR (nested checkouts and '
+             'submodules included)'
+    )
+    
+    parser.add_argument(
+        '--max-depth',
+        type=int,
+        default=4,
+        metavar='N',
+        help='How many directories deep --discover searches (default: 4)'
+    )
+    
+    parser.add_argument(
+        '--workers',
+        type=int,
+        help='Worker processes for --range/--all and large diffs (default: CPU count), '
+             'or repositories analyzed at once by --repos/--discover (default: CPU count + 4)'
+    )
+    
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=64,
+        help='Commits per worker task for --range/--all (default: 64)'
+    )
+    
     args = parser.parse_args()
+    # Only the client needs the socket path here, and looking it up imports tempfile
+    socket_path = args.socket or (default_socket_path() if args.client else None)
+    
+    quick = args.quick or args.format == 'json'
+    if args.client and quick and not (args.stdin or args.repos or args.discover):
+        try:
+            response = request_message(socket_path, os.getcwd(), args.staged, args.level,
+                                       output_format=args.format)
+        except (OSError, ValueError):
+            # No daemon listening: fall back to analyzing in-process
+            pass
+        else:
+            print_response(response)
+            return
+    
+    keywords = None
+    if args.keywords:
+        try:
+            with open(args.keywords, encoding='utf-8') as f:
+                keywords = json.load(f)
+        except (OSError, ValueError) as e:
+            parser.error(f"could not read keywords file: {e}")
     
-    generator = CommitMessageGenerator()
+    file_rules = None
+    if args.file_rules:
+        try:
+            with open(args.file_rules, encoding='utf-8') as f:
+                file_rules = json.load(f)
+        except (OSError, ValueError) as e:
+            parser.error(f"could not read file rules: {e}")
     
-    if args.quick:
-        files = generator.get_changed_files(args.staged)
-        if not files:
+    scopes = None
+    if args.scopes and not args.no_scopes:
+        try:
+            with open(args.scopes, encoding='utf-8') as f:
+                scopes = json.load(f)
+            scope_index = ScopeIndex.from_config(scopes)
+        except (OSError, ValueError) as e:
+            parser.error(f"could not read scopes: {e}")
+    
+    budget = DiffBudget(args.max_file_bytes or None, args.max_file_lines or None,
+                        args.max_diff_bytes or None)
+    try:
+        generator = CommitMessageGenerator(keywords, args.word_boundary, file_rules=file_rules,
+                                           budget=budget)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    if args.serve:
+        MessageServer(args.socket, keywords, args.word_boundary, not args.no_cache, file_rules,
+                      args.git_timeout, budget, scopes, not args.no_scopes).run()
+        return
+    
+    # A piped diff never reads git, so it has nothing to cache; a fleet scan
+    # opens the cache, model and scopes of each repository
+    fleet = bool(args.repos or args.discover)
+    generator.open_cache = not (args.no_cache or args.stdin or fleet)
+    generator.git_timeout = args.git_timeout
+    if args.profile:
+        generator.enable_profiling()
+    
+    if args.model and not args.train:
+        try:
+            generator.model = CommitTypeModel.load(args.model)
+        except (OSError, ValueError, struct.error) as e:
+            parser.error(f"could not read model: {e}")
+    elif not (args.train or args.stdin or fleet):
+        generator.model = CommitTypeModel.for_repository()
+    
+    # History modes only classify commit types, and a piped diff may come
+    # from any repository: it only gets the model and scopes passed to it
+    if scopes is not None:
+        generator.scope_index = scope_index
+    elif not (args.no_scopes or args.stdin or args.train or args.range or args.all or fleet):
+        generator.scope_index = generator.load_scope_index()
+    
+    exit_status = 0
+    if args.train:
+        revisions = ['--all'] if args.all else [args.range or 'HEAD']
+        exit_status = run_train_mode(generator, revisions, args.model, args.workers, args.chunk_size)
+    elif args.range or args.all:
+        revisions = ['--all'] if args.all else [args.range]
+        exit_status = run_history_mode(generator, revisions, args.workers, args.chunk_size)
+    elif fleet:
+        repositories = chain(args.repos or (),
+                             discover_repositories(args.discover, args.max_depth) if args.discover else ())
+        run_fleet_mode(generator, repositories, args.staged, args.level, args.workers,
+                       not args.no_cache, not args.no_scopes, args.format)
+    elif args.watch:
+        run_watch_mode(generator, args.staged, args.interval, output_format=args.format)
+    elif args.stdin or quick:
+        generator.workers = args.workers
+        if args.stdin:
+            analysis = analyze_diff(sys.stdin.buffer, generator=generator)
+        else:
+            analysis = generator.analyze_changes(args.staged, args.level)
+        if args.format == 'json':
+            print(json.dumps(generator.report(analysis)))
+        elif analysis.files:
+            print(generator.generate_commit_message(analysis.files, analysis=analysis))
+        else:
             print("No changes detected.")
-            return
-        
-        diff = generator.get_git_diff(args.staged)
-        message = generator.generate_commit_message(files, diff)
-        print(message)
+        # Scripts reading the report or piping a diff need to see that git failed
+        if generator.git_errors and (args.stdin or args.format == 'json'):
+            exit_status = 1
     else:
         generator.interactive_mode(args.staged)
+    
+    if args.cache_stats:
+        cache = generator.cache
+        if cache is not None:
+            print(f"cache: {cache.hits} hits, {cache.misses} misses", file=sys.stderr)
+        elif generator.open_cache:
+            print("cache: not opened, no patch was read", file=sys.stderr)
+        else:
+            print("cache: disabled", file=sys.stderr)
+    
+    if args.profile:
+        if args.profile_format == 'json':
+            print(json.dumps(generator.profiler.report()), file=sys.stderr)
+        else:
+            print(generator.profiler.format_table(), file=sys.stderr)
+    
+    if exit_status:
+        sys.exit(exit_status)
 
 
 if __name__ == "__main__":
-    main()
+    run_main(main)